@@ -0,0 +1,415 @@
+"""
+This module implements an AVL tree, which keeps its nodes in an arena of parallel arrays instead
+of as AVLNode objects. The left and right children of a node are slot indices in typed arrays,
+and so are the balance factors, so a node costs a few bytes plus the references to its value
+(and key). Slots of deleted nodes are kept on a free list and reused by later insertions.
+ArenaAVLTree is a class of its own, not a storage engine of AVLTree: it implements only the
+central methods of AVLTree, inserting, deleting, finding and collapsing the tree in a list, and
+orders the values the same way. The modes and the augmented operations of AVLTree (order
+statistics, ranges, multisets, aggregates, caching and so on) are not available on it. find
+returns an ArenaNode, a view of the slot found with the fields of an AVLNode, so code reading
+the node found works on both classes.
+"""
+
+import operator
+from array import array
+
+# The slot index denoting no node
+NIL = -1
+
+# Returned by find on a miss. Shared, so a failed lookup allocates nothing
+_NOT_FOUND = (False, None)
+
+
+class ArenaNode:
+    """
+    A read-only view of the node in a slot of an ArenaAVLTree, with the fields of an AVLNode.
+    The children are views as well, or None. A view is only valid until the tree is modified
+    """
+    __slots__ = ('tree', 'slot')
+
+    def __init__(self, tree, slot):
+        self.tree = tree
+        self.slot = slot
+
+    def _view(self, slot):
+        return None if slot == NIL else ArenaNode(self.tree, slot)
+
+    @property
+    def value(self):
+        return self.tree.values[self.slot]
+
+    @property
+    def key(self):
+        return self.tree.keys[self.slot]
+
+    @property
+    def left(self):
+        return self._view(self.tree.left[self.slot])
+
+    @property
+    def right(self):
+        return self._view(self.tree.right[self.slot])
+
+    @property
+    def balance(self):
+        return self.tree.balance[self.slot]
+
+    def __eq__(self, other):
+        return isinstance(other, ArenaNode) and self.tree is other.tree and \
+            self.slot == other.slot
+
+    def __hash__(self):
+        return hash((id(self.tree), self.slot))
+
+    def __repr__(self):
+        return f'<ArenaNode {self.value}>; slot={self.slot}; balance={self.balance}'
+
+
+class ArenaAVLTree:
+    """
+    The ArenaAVLTree class implements the central methods of AVLTree: insert, delete and find,
+    as well as preorder, inorder and postorder, on nodes kept in parallel arrays, cf. the module
+    documentation:
+    - values[slot] and keys[slot] hold the value and the key of the node in slot
+    - left[slot] and right[slot] hold the slots of its children, or NIL
+    - balance[slot] holds its balance factor
+    The remaining methods are auxiliary/internal and should not be used outside
+    """
+    def __init__(self, less_than_func=None, key=None, cmp=None):
+        """
+        - head (the slot of the head of the tree) is initialised to NIL
+        - free is the first slot on the free list. The free slots are chained by left
+        :param less_than_func: Function taking two parameters of same type as keys in the tree.
+            Returns True if and only if the first parameter is evaluated to be less then the second
+        :param key: Function taking a value and returning its key
+        :param cmp: Function taking two keys and returning a negative number, zero or a positive
+            number, if the first is less than, equal to or greater than the second, respectively
+        """
+        if less_than_func is not None and cmp is not None:
+            raise ValueError("Only one of less_than_func and cmp can be given!")
+        if cmp is not None:
+            self.less_than_func = lambda x, y: cmp(x, y) < 0
+        elif less_than_func is not None:
+            self.less_than_func = less_than_func
+        else:
+            self.less_than_func = operator.lt
+        self.key_func = key
+        self.head = NIL
+        self.free = NIL
+        self.values = []
+        # Without a key function, the key of a value is the value itself, so no extra list is kept
+        self.keys = self.values if key is None else []
+        self.left = array('i')
+        self.right = array('i')
+        self.balance = array('b')
+
+    def _new_slot(self, value, key):
+        """
+        Internal routine for allocating a slot for a new leaf node; from the free list if possible
+        :param value: The value of the node
+        :param key: The key of the node
+        :return: The slot of the new node
+        """
+        slot = self.free
+        if slot == NIL:
+            slot = len(self.values)
+            self.values.append(value)
+            if self.keys is not self.values:
+                self.keys.append(key)
+            self.left.append(NIL)
+            self.right.append(NIL)
+            self.balance.append(0)
+        else:
+            self.free = self.left[slot]
+            self.values[slot] = value
+            if self.keys is not self.values:
+                self.keys[slot] = key
+            self.left[slot] = NIL
+            self.right[slot] = NIL
+            self.balance[slot] = 0
+        return slot
+
+    def _free_slot(self, slot):
+        """
+        Internal routine for putting the slot of a deleted node on the free list
+        :param slot: The slot of the deleted node
+        :return: None
+        """
+        self.values[slot] = None
+        if self.keys is not self.values:
+            self.keys[slot] = None
+        self.left[slot] = self.free
+        self.free = slot
+
+    def _adjust_pointers(self, parent_slot, current_slot, new_slot):
+        """
+        Internal routine for finalising a rotation by fixing the rotated subtree to remaining tree
+        :param parent_slot: The node pointing to the rebalanced subtree
+        :param current_slot: The current subtree root node to be balanced down the subtree
+        :param new_slot: The new subtree root node
+        :return: None
+        """
+        if self.left[parent_slot] == current_slot:
+            self.left[parent_slot] = new_slot
+        elif self.right[parent_slot] == current_slot:
+            self.right[parent_slot] = new_slot
+        else:
+            self.head = new_slot
+
+    def _singlerotation(self, parent_slot, current_slot, delete=False):
+        """
+        Internal routine for performing a single rotation either left or right, depending on
+        the balance factor of current_slot. Cf. AVLTree._singlerotation
+        :param parent_slot: The node pointing to the node to be rotated down in the tree
+        :param current_slot: The node to be rotated down in the tree
+        :param delete: Is True, if called in connection with a deletion
+        :return: None
+        """
+        left, right, balance = self.left, self.right, self.balance
+        if balance[current_slot] == -1:
+            # Right rotation
+            new_top_slot = left[current_slot]
+            left[current_slot] = right[new_top_slot]
+            right[new_top_slot] = current_slot
+        else:
+            # Left rotation
+            new_top_slot = right[current_slot]
+            right[current_slot] = left[new_top_slot]
+            left[new_top_slot] = current_slot
+        # Adjust balance values
+        if delete and balance[new_top_slot] == 0:
+            balance[new_top_slot] = -balance[current_slot]
+        else:
+            balance[current_slot] = 0
+            balance[new_top_slot] = 0
+        self._adjust_pointers(parent_slot, current_slot, new_top_slot)
+
+    def _doublerotation(self, parent_slot, current_slot):
+        """
+        Internal routine for performing a double rotation either left-right or right-left,
+        depending on the balance factor of current_slot. Cf. AVLTree._doublerotation
+        :param parent_slot: The node pointing to the node to be rotated down in the tree
+        :param current_slot: The node to be rotated down in the tree
+        :return: None
+        """
+        left, right, balance = self.left, self.right, self.balance
+        if balance[current_slot] == -1:
+            # Left-right rotation
+            remain_slot = left[current_slot]
+            new_top_slot = right[remain_slot]
+            right[remain_slot] = left[new_top_slot]
+            left[new_top_slot] = remain_slot
+            left[current_slot] = right[new_top_slot]
+            right[new_top_slot] = current_slot
+        else:
+            # Right-left rotation
+            remain_slot = right[current_slot]
+            new_top_slot = left[remain_slot]
+            left[remain_slot] = right[new_top_slot]
+            right[new_top_slot] = remain_slot
+            right[current_slot] = left[new_top_slot]
+            left[new_top_slot] = current_slot
+        # Adjust balance values
+        if balance[new_top_slot] == balance[current_slot]:
+            balance[current_slot] = -balance[current_slot]
+            balance[remain_slot] = 0
+        elif balance[new_top_slot] == 0:
+            balance[current_slot] = 0
+            balance[remain_slot] = 0
+        elif balance[new_top_slot] == -balance[current_slot]:
+            balance[remain_slot] = balance[current_slot]
+            balance[current_slot] = 0
+        else:
+            raise ValueError("AVL invariance broken!!")
+        balance[new_top_slot] = 0
+        self._adjust_pointers(parent_slot, current_slot, new_top_slot)
+
+    def _descend(self, key):
+        """
+        Internal routine for walking down the tree from the head looking for key
+        :param key: The key looked for
+        :return: (path, directions, slot), where slot is the node holding key or NIL if key is not
+            in the tree. path holds the nodes passed above slot (on a miss, all nodes visited) and
+            directions the side taken at each of them: -1 for left, 1 for right
+        """
+        less_than_func = self.less_than_func
+        keys, left, right = self.keys, self.left, self.right
+        path = []
+        directions = []
+        current_slot = self.head
+        while current_slot != NIL:
+            slot_key = keys[current_slot]
+            if less_than_func(key, slot_key):
+                path.append(current_slot)
+                directions.append(-1)
+                current_slot = left[current_slot]
+            elif less_than_func(slot_key, key):
+                path.append(current_slot)
+                directions.append(1)
+                current_slot = right[current_slot]
+            else:
+                break
+        return path, directions, current_slot
+
+    def insert(self, value):
+        """
+        Public routine for inserting value in to the tree. Equal values are ignored
+        :param value: Value to be inserted in tree
+        :return: None
+        """
+        key = value if self.key_func is None else self.key_func(value)
+        if self.head == NIL:
+            self.head = self._new_slot(value, key)
+            return
+        path, directions, current_slot = self._descend(key)
+        if current_slot != NIL:  # key equal to the key of current_slot; value shall be ignored
+            return
+        left, right, balance = self.left, self.right, self.balance
+        if directions[-1] == -1:
+            left[path[-1]] = self._new_slot(value, key)
+        else:
+            right[path[-1]] = self._new_slot(value, key)
+        parent_slot = self.head
+        for i in range(len(path) - 1, -1, -1):
+            # height of the subtree entered from current_slot increased
+            current_slot = path[i]
+            inc = directions[i]
+            if i:
+                parent_slot = path[i - 1]
+            if balance[current_slot] == 0:
+                balance[current_slot] = inc
+            elif balance[current_slot] == -inc:
+                balance[current_slot] = 0
+                return
+            else:
+                child_slot = left[current_slot] if inc == -1 else right[current_slot]
+                if balance[child_slot] == -inc:
+                    self._doublerotation(parent_slot, current_slot)
+                else:
+                    self._singlerotation(parent_slot, current_slot)
+                return
+
+    def delete(self, value):
+        """
+        Public routine for deleting value from the tree. The slot of the removed node is put on
+        the free list
+        :param value: Value to be deleted from the tree
+        :return: None
+        :raises ValueError: If the tree is empty or value is not in the tree
+        """
+        if self.head == NIL:
+            raise ValueError("Trying to delete from an empty tree!")
+        key = value if self.key_func is None else self.key_func(value)
+        path, directions, current_slot = self._descend(key)
+        if current_slot == NIL:
+            raise ValueError(f"{key} not found in tree!")
+        left, right, balance = self.left, self.right, self.balance
+        if left[current_slot] == NIL:
+            replacement_slot = right[current_slot]
+        else:
+            # Move the value of the in-order predecessor up, and remove the predecessor's node
+            to_be_deleted_value_slot = current_slot
+            path.append(current_slot)
+            directions.append(-1)
+            current_slot = left[current_slot]
+            while right[current_slot] != NIL:
+                path.append(current_slot)
+                directions.append(1)
+                current_slot = right[current_slot]
+            self.values[to_be_deleted_value_slot] = self.values[current_slot]
+            if self.keys is not self.values:
+                self.keys[to_be_deleted_value_slot] = self.keys[current_slot]
+            replacement_slot = left[current_slot]
+        self._free_slot(current_slot)
+        if not path:
+            self.head = replacement_slot
+            return
+        if directions[-1] == -1:
+            left[path[-1]] = replacement_slot
+        else:
+            right[path[-1]] = replacement_slot
+        parent_slot = self.head
+        for i in range(len(path) - 1, -1, -1):
+            # The subtree entered from current_slot has decreased in height
+            current_slot = path[i]
+            inc = -directions[i]
+            if i:
+                parent_slot = path[i - 1]
+            if balance[current_slot] == 0:
+                balance[current_slot] = inc
+                return
+            if balance[current_slot] == -inc:
+                balance[current_slot] = 0
+            else:
+                child_slot = left[current_slot] if inc == -1 else right[current_slot]
+                if balance[child_slot] == -inc:
+                    self._doublerotation(parent_slot, current_slot)
+                elif balance[child_slot] == 0:
+                    # The height of the rotated subtree is unchanged, so rebalancing stops here
+                    self._singlerotation(parent_slot, current_slot, delete=True)
+                    return
+                else:
+                    self._singlerotation(parent_slot, current_slot, delete=True)
+
+    def find(self, value):
+        """
+        Public routine for looking up value in the tree
+        :param value: Value to be found
+        :return: (True, ArenaNode of the node holding value) if found; otherwise (False, None)
+        """
+        key = value if self.key_func is None else self.key_func(value)
+        less_than_func = self.less_than_func
+        keys, left, right = self.keys, self.left, self.right
+        current_slot = self.head
+        while current_slot != NIL:
+            if less_than_func(key, keys[current_slot]):
+                current_slot = left[current_slot]
+            elif less_than_func(keys[current_slot], key):
+                current_slot = right[current_slot]
+            else:
+                return True, ArenaNode(self, current_slot)
+        return _NOT_FOUND
+
+    def inorder(self):
+        values, left, right = self.values, self.left, self.right
+        result = []
+        stack = []
+        current_slot = self.head
+        while stack or current_slot != NIL:
+            if current_slot != NIL:
+                stack.append(current_slot)
+                current_slot = left[current_slot]
+            else:
+                current_slot = stack.pop()
+                result.append(values[current_slot])
+                current_slot = right[current_slot]
+        return result
+
+    def preorder(self):
+        values, left, right = self.values, self.left, self.right
+        result = []
+        stack = [self.head] if self.head != NIL else []
+        while stack:
+            current_slot = stack.pop()
+            result.append(values[current_slot])
+            if right[current_slot] != NIL:
+                stack.append(right[current_slot])
+            if left[current_slot] != NIL:
+                stack.append(left[current_slot])
+        return result
+
+    def postorder(self):
+        # Reversed preorder with the right subtree visited before the left one
+        values, left, right = self.values, self.left, self.right
+        result = []
+        stack = [self.head] if self.head != NIL else []
+        while stack:
+            current_slot = stack.pop()
+            result.append(values[current_slot])
+            if left[current_slot] != NIL:
+                stack.append(left[current_slot])
+            if right[current_slot] != NIL:
+                stack.append(right[current_slot])
+        result.reverse()
+        return result
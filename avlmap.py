@@ -0,0 +1,195 @@
+"""
+This module implements a sorted map on the AVL tree of avltree.py: each node holds a key and,
+as its value, the payload stored under the key
+"""
+
+import serialization
+from avltree import AVLTree
+
+
+class AVLMap(AVLTree):
+    """
+    The AVLMap class maps keys to payloads, ordered by the keys as AVLTree orders values. It
+    offers the dict methods: map[key], map[key] = payload, del map[key], in, get, pop,
+    setdefault and update, and iterates over the keys like a dict. Each of these descends the
+    tree once. The methods inherited from AVLTree, which return values, return the payloads
+    """
+    def __init__(self, *args, **kwargs):
+        """
+        :param args: Positional parameters, as for AVLTree()
+        :param kwargs: Keyword parameters, as for AVLTree(), but key, as the keys are given,
+            duplicates and lazy_delete
+        :raises ValueError: If a key function, duplicates="count" or lazy_delete is given
+        """
+        super().__init__(*args, **kwargs)
+        if self.key_func is not None:
+            raise ValueError("AVLMap takes no key function; the keys are given")
+        if self.multiset:
+            raise ValueError("AVLMap keeps one payload per key; duplicates must be 'ignore'")
+        if self.lazy_delete:
+            raise ValueError("AVLMap deletes eagerly; lazy_delete is not supported")
+
+    @classmethod
+    def from_sorted(cls, iterable, *args, **kwargs):
+        """
+        Public routine for building a perfectly balanced map in O(n) without comparing keys
+        :param iterable: The (key, payload) pairs in increasing order of the keys and without
+            duplicate keys. It is read once
+        :param args: Positional parameters of the map, as for AVLMap()
+        :param kwargs: Keyword parameters of the map, as for AVLMap()
+        :return: The new map
+        """
+        tree = cls(*args, **kwargs)
+        items = list(iterable)
+        tree._rebuild([payload for _, payload in items], [key for key, _ in items])
+        return tree
+
+    @classmethod
+    def from_iterable(cls, iterable, *args, **kwargs):
+        """
+        Public routine for building a perfectly balanced map of (key, payload) pairs in any
+        order. Of equal keys the last is kept, as by dict
+        :param iterable: The (key, payload) pairs. It is read once
+        :param args: Positional parameters of the map, as for AVLMap()
+        :param kwargs: Keyword parameters of the map, as for AVLMap()
+        :return: The new map
+        """
+        tree = cls(*args, **kwargs)
+        items = list(iterable)
+        items.reverse()  # The sort is stable, so the last pair of equal keys comes first
+        keys, order = tree._sorted_batch([key for key, _ in items])
+        less_than_func = tree.less_than_func
+        distinct = [i for n, i in enumerate(order)
+                    if n == 0 or less_than_func(keys[order[n - 1]], keys[i])]
+        tree._rebuild([items[i][1] for i in distinct], [keys[i] for i in distinct])
+        return tree
+
+    def insert(self, value):
+        raise ValueError("AVLMap stores payloads by key: use map[key] = payload")
+
+    def insert_many(self, iterable):
+        raise ValueError("AVLMap stores payloads by key: use map.update(pairs)")
+
+    def __getitem__(self, key):
+        found, node = self.find_method(self.head, key)
+        if not found:
+            raise KeyError(key)
+        return node.value
+
+    def __setitem__(self, key, payload):
+        if self.head is None:
+            self.head = self.node_class(payload, key)
+            self.length = 1
+            self.snapshot = None
+            return
+        path, directions, node = self.descent_method(self.head, key)
+        if node is not None:
+            node.value = payload
+            if self.monoid is not None:
+                self._refresh_aggregates(path, node)
+            return
+        self._insert_at(path, directions, key, payload)
+        if self.length is not None:
+            self.length += 1
+        self.snapshot = None
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def __contains__(self, key):
+        found, _ = self.find_method(self.head, key)
+        return found
+
+    def get(self, key, default=None):
+        """
+        Public routine for getting the payload of key
+        :param key: The key
+        :param default: Returned if key is not in the map
+        :return: The payload of key, or default
+        """
+        found, node = self.find_method(self.head, key)
+        return node.value if found else default
+
+    def pop(self, key, *default):
+        """
+        Public routine for removing key from the map
+        :param key: The key
+        :param default: Returned if key is not in the map, if given
+        :return: The payload of key, or default
+        :raises KeyError: If key is not in the map and no default is given
+        """
+        path, directions, node = self.descent_method(self.head, key)
+        if node is None:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        payload = node.value
+        self._delete_at(path, directions, node)
+        if self.length is not None:
+            self.length -= 1
+        self.snapshot = None
+        return payload
+
+    def setdefault(self, key, default=None):
+        """
+        Public routine for getting the payload of key, storing default under key first, if key
+        is not in the map
+        :param key: The key
+        :param default: The payload stored, if key is not in the map
+        :return: The payload of key
+        """
+        if self.head is None:
+            self[key] = default
+            return default
+        path, directions, node = self.descent_method(self.head, key)
+        if node is not None:
+            return node.value
+        self._insert_at(path, directions, key, default)
+        if self.length is not None:
+            self.length += 1
+        self.snapshot = None
+        return default
+
+    def update(self, other):
+        """
+        Public routine for storing the payloads of other, overwriting those of equal keys
+        :param other: Mapping, or iterable of (key, payload) pairs
+        :return: None
+        """
+        items = other.items() if hasattr(other, "items") else other
+        for key, payload in items:
+            self[key] = payload
+
+    def __iter__(self):
+        return self.keys()
+
+    def __reversed__(self):
+        return (node.key for node in self._iter_nodes(reverse=True))
+
+    def keys(self):
+        """
+        Public routine for iterating over the keys in increasing order
+        :return: Generator of the keys
+        """
+        return (node.key for node in self._iter_nodes())
+
+    def values(self):
+        """
+        Public routine for iterating over the payloads in increasing order of their keys
+        :return: Generator of the payloads
+        """
+        return (node.value for node in self._iter_nodes())
+
+    def items(self):
+        """
+        Public routine for iterating over the (key, payload) pairs in increasing order
+        :return: Generator of the pairs
+        """
+        return ((node.key, node.value) for node in self._iter_nodes())
+
+    def dump(self, path, codec=None):
+        """
+        Public routine for writing the map to a binary file, cf. AVLTree.dump. The payloads are
+        pickled, so load and MappedAVLTree return them
+        """
+        serialization.dump_nodes(self.head, path, True, codec)
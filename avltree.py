@@ -1,37 +1,347 @@
 """
 This module is a naive implementation of an AVL tree, which is a balanced binary tree,
 cf. https://en.wikipedia.org/wiki/AVL_tree
-It allows for composite data types by having the less_than_func as a parameter.
+It allows for composite data types by having the less_than_func as a parameter, or by
+ordering the values on a key function.
 """
 
-from node import AVLNode
+import contextlib
+import functools
+import gc
+import itertools
+import math
+import operator
+
+import serialization
+from cache import attach_cache
+from node import AVLNode, CountedAVLNode, SizedAVLNode, SizedCountedAVLNode, aggregated_node_class
+from stats import TreeStats
+
+try:
+    import numpy
+except ImportError:  # numpy is optional; only needed for vectorised lookups
+    numpy = None
+
+# Returned by find on a miss. Shared, so a failed lookup allocates nothing
+_NOT_FOUND = (False, None)
+
+# Outcomes of the values of insert_many and delete_many
+INSERTED = "inserted"
+DUPLICATE = "duplicate"
+DELETED = "deleted"
+MISSING = "missing"
+
+# insert_many and delete_many rebuild the tree, when the batch has at least 1/BATCH_REBUILD_RATIO
+# as many values as the tree; below that, the values are inserted or deleted one by one
+BATCH_REBUILD_RATIO = 2
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    """
+    Pauses the cyclic garbage collector while many nodes are created at once. The nodes hold no
+    reference cycles, and the collector would otherwise traverse the growing tree repeatedly
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _range_bounds(less_than_func, key_func, low, high, inclusive, reverse):
+    """
+    Returns the two tests of a range query on keys: whether a key is within the bound, where the
+    iteration starts, and within the bound, where it ends. Cf. AVLTree.range for the parameters
+    """
+    low_inclusive, high_inclusive = inclusive
+    low_key = low if low is None or key_func is None else key_func(low)
+    high_key = high if high is None or key_func is None else key_func(high)
+
+    def above_low(key):
+        if low is None:
+            return True
+        if low_inclusive:
+            return not less_than_func(key, low_key)
+        return less_than_func(low_key, key)
+
+    def below_high(key):
+        if high is None:
+            return True
+        if high_inclusive:
+            return not less_than_func(high_key, key)
+        return less_than_func(key, high_key)
+
+    if reverse:
+        return below_high, above_low
+    return above_low, below_high
 
 
 class AVLTree:
     """
     The AVLTree class implements a number of methods on AVL trees, incl. the central methods:
     insert, delete and find, as well as methods for collapsing the tree in a list:
-    preorder, inorder or postorder
+    preorder, inorder or postorder, and their lazy counterparts: iter_preorder, iter_inorder
+    (also iter(tree)) and iter_postorder
     The remaining methods are auxiliary/internal and should not be used outside
     """
-    def __init__(self, less_than_func, iterative=True):
+    def __init__(self, less_than_func=None, iterative=True, key=None, cmp=None,
+                 order_statistics=False, stats=False, stats_callback=None, duplicates="ignore",
+                 monoid=None, cache=None, cache_size=1024, lazy_delete=False,
+                 compaction_threshold=0.5):
         """
         - head (the head of the tree) is initialised to None
-        - to_be_deleted_value_node is only used when deleting from the tree and then it points
-        to the node holding the value to be deleted
-        - inc is the increment factor indicating whether the subtree has increased in height.
-        Is in the interval [-1..1]
-        :param less_than_func: Function taking two parameters of same type as values in the tree.
+        - node_class is the class of the nodes created for the values inserted
+        - multiset is True, if the nodes count the multiplicities of their values
+        - counted is True, if the nodes have a count: in a multiset, and with lazy_delete, where a
+        count of 0 marks a tombstone
+        - tombstones is the number of nodes, whose values are deleted, but which are kept until
+        the tree is compacted
+        - augmented is True, if the nodes keep fields computed from their subtrees: sizes or
+        aggregates
+        - length is the number of values in the tree. It is None, when it is not known after a
+        split, until it is counted
+        - configuration holds the parameters given, for creating trees alike
+        - statistics holds the counters of an instrumented tree; None if not instrumented
+        - cache maps the keys found recently to their nodes; None if lookups are not cached
+        - snapshot is the sorted array of keys used by vectorised lookups. It is built on demand
+        and reset by any modification of the tree
+        The tree is ordered on the keys of the values. Without key, the key of a value is the value
+        itself. The key is computed once, when the value is inserted, and kept in the node.
+        Keys are compared with cmp, if given; else with less_than_func, if given; else with the
+        native < and == operators
+        :param less_than_func: Function taking two parameters of same type as keys in the tree.
             Returns True if and only if the first parameter is evaluated to be less then the second
+        :param iterative: If True, insert, delete and find are loop based; otherwise recursive
+        :param key: Function taking a value and returning its key
+        :param cmp: Function taking two keys and returning a negative number, zero or a positive
+            number, if the first is less than, equal to or greater than the second, respectively
+        :param order_statistics: If True, each node keeps the size of its subtree, which enables
+            rank, select and percentile in O(log n)
+        :param stats: If True, the tree counts comparisons, rotations and nodes visited, and
+            times insert, delete and find, cf. stats()
+        :param stats_callback: Function called after each timed operation, cf. TreeStats
+        :param duplicates: "ignore" to keep the first of equal values, as a set does; "count" to
+            count the values equal to the value of a node in the node, as a multiset does. Then
+            delete removes one of them, count(value) tells how many there are, and the iterators
+            and order statistics include each of them
+        :param monoid: If given, each node keeps the aggregate by monoid of the values in its
+            subtree, which enables aggregate(low, high) in O(log n), cf. monoid.Monoid
+        :param cache: "lru" or "tinylfu" to cache the nodes found by find, and the lookups built
+            on it, so lookups of hot keys skip the descent, cf. cache.py and cache_info(). The
+            keys must be hashable
+        :param cache_size: The maximum number of keys cached
+        :param lazy_delete: If True, delete marks the node of the value as a tombstone in
+            O(log n) without restructuring the tree, and the tree is compacted, cf. compact(),
+            when the tombstones make up more than compaction_threshold of its nodes. Lookups,
+            iterators, len and order statistics skip the tombstones, and inserting a value
+            revives its tombstone. It implies order_statistics, as the subtree sizes, which
+            count the live values only, let min, max, floor, ceiling and so on step over the
+            tombstones in O(log n). Deletion is loop based also with iterative=False
+        :param compaction_threshold: The fraction of tombstones among the nodes, above which
+            delete compacts the tree; None to compact only on demand
         """
+        if less_than_func is not None and cmp is not None:
+            raise ValueError("Only one of less_than_func and cmp can be given!")
+        if duplicates not in ("ignore", "count"):
+            raise ValueError(f"duplicates must be 'ignore' or 'count', not {duplicates!r}")
+        self.configuration = dict(less_than_func=less_than_func, iterative=iterative, key=key,
+                                  cmp=cmp, order_statistics=order_statistics, stats=stats,
+                                  stats_callback=stats_callback, duplicates=duplicates,
+                                  monoid=monoid, cache=cache, cache_size=cache_size,
+                                  lazy_delete=lazy_delete,
+                                  compaction_threshold=compaction_threshold)
         self.head = None
-        self.less_than_func = less_than_func
-        self.to_be_deleted_value_node = None
-        self.inc = 0
+        order_statistics = order_statistics or lazy_delete
+        self.order_statistics = order_statistics
+        self.multiset = duplicates == "count"
+        self.lazy_delete = lazy_delete
+        self.compaction_threshold = compaction_threshold
+        self.tombstones = 0
+        self.counted = self.multiset or lazy_delete
+        if self.counted:
+            self.node_class = SizedCountedAVLNode if order_statistics else CountedAVLNode
+            self._update_size = self._update_counted_size
+        else:
+            self.node_class = SizedAVLNode if order_statistics else AVLNode
+        self.monoid = monoid
+        if monoid is not None:
+            self.node_class = aggregated_node_class(self.node_class, monoid)
+        self.augmented = order_statistics or monoid is not None
+        self.length = 0
+        self.snapshot = None
+        self.key_func = key
+        self.cmp_func = cmp
+        if cmp is not None:
+            # The recursive methods, and the auxiliary ones, compare by less_than_func
+            self.less_than_func = lambda x, y: cmp(x, y) < 0
+            self.descent_method = self._descend_cmp
+            iterative_find = self._iterative_find_cmp
+        elif less_than_func is not None:
+            self.less_than_func = less_than_func
+            self.descent_method = self._descend
+            iterative_find = self._iterative_find
+        else:
+            self.less_than_func = operator.lt
+            self.descent_method = self._descend_native
+            iterative_find = self._iterative_find_native
         if iterative:
             self.insertion_method = self._iterative_insert
+            self.deletion_method = self._iterative_delete
+            self.find_method = iterative_find
         else:
-            self.insertion_method = self._recursive_insert
+            self.insertion_method = self._recursive_insert_value
+            self.deletion_method = self._recursive_delete
+            self.find_method = self._recursive_find
+        if lazy_delete:
+            self.deletion_method = self._lazy_delete
+        self.statistics = None
+        if stats or stats_callback is not None:
+            self.statistics = TreeStats(stats_callback)
+            self.statistics.instrument(self)
+        self.cache = None
+        if cache is not None:
+            self.cache = attach_cache(self, cache, cache_size)
+        if lazy_delete:
+            # Outermost, so tombstones are not found by way of the cache either
+            self._find_any = self.find_method
+            self.find_method = self._find_live
+
+    def stats(self):
+        """
+        Public routine for reading the counters of an instrumented tree: comparisons, single
+        and double rotations, nodes visited, current and maximum height, and for each of insert,
+        delete and find the number of calls, nodes visited and a latency histogram
+        :return: dict of the counters
+        :raises ValueError: If the tree is not instrumented
+        """
+        if self.statistics is None:
+            raise ValueError("stats requires a tree with stats=True")
+        return self.statistics.as_dict(self)
+
+    def cache_info(self):
+        """
+        Public routine for reading the counters of the lookup cache: policy, capacity, number
+        of keys cached, hits, misses, hit ratio and evictions, and for TinyLFU the keys not
+        admitted
+        :return: dict of the counters
+        :raises ValueError: If the tree has no cache
+        """
+        if self.cache is None:
+            raise ValueError("cache_info requires a tree with a cache")
+        return self.cache.info()
+
+    @staticmethod
+    def _update_size(node):
+        """
+        Internal routine for recomputing the subtree size of node from its children
+        :param node: A node of an order statistics tree
+        :return: None
+        """
+        node.size = 1
+        if node.left:
+            node.size += node.left.size
+        if node.right:
+            node.size += node.right.size
+
+    @staticmethod
+    def _update_counted_size(node):
+        """
+        As _update_size, but counting the multiplicity of the value of node
+        """
+        node.size = node.count
+        if node.left:
+            node.size += node.left.size
+        if node.right:
+            node.size += node.right.size
+
+    def _measure(self, node):
+        """
+        Internal routine for the aggregate of the value of node alone, of all its occurrences
+        :param node: A node of a tree with a monoid
+        :return: The aggregate
+        """
+        aggregate = self.monoid.measure(node.value)
+        if self.counted and node.count != 1:
+            aggregate = self.monoid.repeat(aggregate, node.count)
+        return aggregate
+
+    def _update_aggregate(self, node):
+        """
+        Internal routine for recomputing the aggregate of node from its value and its children
+        :param node: A node of a tree with a monoid
+        :return: None
+        """
+        monoid = self.monoid
+        aggregate = self._measure(node)
+        if node.left:
+            aggregate = monoid.combine(node.left.agg, aggregate)
+        if node.right:
+            aggregate = monoid.combine(aggregate, node.right.agg)
+        node.agg = aggregate
+
+    def _update_fields(self, node):
+        """
+        Internal routine for recomputing the subtree size and the aggregate of node, as far as
+        the tree keeps them, from its children
+        :param node: A node of an augmented tree
+        :return: None
+        """
+        if self.order_statistics:
+            self._update_size(node)
+        if self.monoid is not None:
+            self._update_aggregate(node)
+
+    def _refresh_aggregates(self, path, node=None):
+        """
+        Internal routine for recomputing the aggregates of node and of the nodes of path above
+        it, bottom up
+        :param path: The nodes from the head down to the parent of node
+        :param node: The node, whose value or subtree has changed; None for the last of path
+        :return: None
+        """
+        if node is not None:
+            self._update_aggregate(node)
+        for path_node in reversed(path):
+            self._update_aggregate(path_node)
+
+    def _update_all_aggregates(self):
+        """
+        Internal routine for recomputing the aggregates of all nodes in O(n), e.g. of nodes
+        created without them
+        :return: None
+        """
+        preorder_nodes = []
+        stack = [self.head] if self.head is not None else []
+        while stack:
+            node = stack.pop()
+            preorder_nodes.append(node)
+            if node.right is not None:
+                stack.append(node.right)
+            if node.left is not None:
+                stack.append(node.left)
+        # In preorder the children come after their parent
+        for node in reversed(preorder_nodes):
+            self._update_aggregate(node)
+
+    def _add_occurrences(self, path, node, change):
+        """
+        Internal routine for changing the multiplicity of the value of node, in a multiset or a
+        tree with lazy_delete
+        :param path: The nodes from the head down to the parent of node
+        :param node: The node
+        :param change: The change of the multiplicity
+        :return: None
+        """
+        node.count += change
+        if self.order_statistics:
+            node.size += change
+            for path_node in path:
+                path_node.size += change
+        if self.monoid is not None:
+            self._refresh_aggregates(path, node)
 
     def _adjust_pointers(self, parent_node, current_node, new_node):
         """
@@ -69,12 +379,14 @@ class AVLTree:
             new_top_node.left = current_node
         # Adjust balance values
         if delete and new_top_node.balance == 0:
-            # Special case for adjusting self.inc (based on balance factor of current_node
+            # Special case of a deletion, where the height of the rotated subtree is unchanged
             new_top_node.balance = -current_node.balance
-            self.inc = 0
         else:
             current_node.balance = 0
             new_top_node.balance = 0
+        if self.augmented:
+            self._update_fields(current_node)
+            self._update_fields(new_top_node)
         # Adjust the parent node's pointer to the new top node
         self._adjust_pointers(parent_node, current_node, new_top_node)
 
@@ -115,124 +427,206 @@ class AVLTree:
         else:
             raise ValueError("AVL invariance broken!!")
         new_top_node.balance = 0
+        if self.augmented:
+            self._update_fields(current_node)
+            self._update_fields(remain_node)
+            self._update_fields(new_top_node)
         # Adjust the pointer to the new top node
         self._adjust_pointers(parent_node, current_node, new_top_node)
 
-    def _find_parent(self, child_node):
+    def _descend(self, current_node, key):
         """
-        Internal routine for finding the parent of child_node. Only used in iterative case
-        :param child_node: A node in the tree
-        :return: The node pointing to child_node. Returns head if child_node is head
+        Internal routine for walking down the tree from current_node looking for key,
+        comparing by less_than_func
+        :param current_node: The node to start from
+        :param key: The key looked for
+        :return: (path, directions, node), where node is the node holding key or None if key is
+            not in the tree. path holds the nodes passed above node (on a miss, all nodes visited)
+            and directions the side taken at each of them: -1 for left, 1 for right
         """
-        if child_node == self.head:
-            return self.head
-        candidate = self.head
-        while True:
-            if child_node in {candidate.left, candidate.right}:
-                return candidate
-            if self.less_than_func(child_node.value, candidate.value):
-                candidate = candidate.left
-            elif self.less_than_func(candidate.value, child_node.value):
-                candidate = candidate.right
+        less_than_func = self.less_than_func
+        path = []
+        directions = []
+        while current_node is not None:
+            node_key = current_node.key
+            if less_than_func(key, node_key):
+                path.append(current_node)
+                directions.append(-1)
+                current_node = current_node.left
+            elif less_than_func(node_key, key):
+                path.append(current_node)
+                directions.append(1)
+                current_node = current_node.right
+            else:
+                break
+        return path, directions, current_node
+
+    def _descend_native(self, current_node, key):
+        """
+        As _descend, but comparing by the native < and == operators
+        """
+        path = []
+        directions = []
+        while current_node is not None:
+            node_key = current_node.key
+            if key < node_key:
+                path.append(current_node)
+                directions.append(-1)
+                current_node = current_node.left
+            elif key == node_key:
+                break
+            else:
+                path.append(current_node)
+                directions.append(1)
+                current_node = current_node.right
+        return path, directions, current_node
 
-    def _iterative_insert(self, parent_node, current_node, value):
+    def _descend_cmp(self, current_node, key):
+        """
+        As _descend, but comparing by a single call of cmp per level
+        """
+        cmp = self.cmp_func
+        path = []
+        directions = []
+        while current_node is not None:
+            order = cmp(key, current_node.key)
+            if order < 0:
+                path.append(current_node)
+                directions.append(-1)
+                current_node = current_node.left
+            elif order > 0:
+                path.append(current_node)
+                directions.append(1)
+                current_node = current_node.right
+            else:
+                break
+        return path, directions, current_node
+
+    def _iterative_insert(self, parent_node, current_node, key, value):
         """
         The modules version of the insertion in to an AVL tree. It maintains the tree balanced
         (i.e. maintains the AVL invariant) by adjusting the balance factors of affected nodes
-        and rebalancing the tree, as necessary
+        and rebalancing the tree, as necessary.
+        The nodes passed on the way down are recorded on a stack, which is then retraced to
+        propagate the height change, so each level is compared at most once (twice using
+        less_than_func)
         :param parent_node: The node pointing to current_node
         :param current_node: The current place in the tree
+        :param key: The key of value
+        :param value: The new value to be inserted in the tree
+        :return: True if value was inserted; False if an equal value was in the tree already
+        """
+        path, directions, current_node = self.descent_method(current_node, key)
+        if current_node is not None:  # key equal to current_node.key
+            if self.lazy_delete and not current_node.count:
+                self._revive(path, current_node, key, value)
+                return True
+            if self.multiset:
+                self._add_occurrences(path, current_node, 1)
+                return True
+            return False  # value shall be ignored
+        self._insert_at(path, directions, key, value)
+        return True
+
+    def _insert_at(self, path, directions, key, value):
+        """
+        Internal routine for attaching a new node below the last node of path, and retracing
+        path to rebalance the tree
+        :param path: The nodes from the head down to the parent of the new node
+        :param directions: The side taken at each node of path: -1 for left, 1 for right
+        :param key: The key of value
         :param value: The new value to be inserted in the tree
         :return: None
         """
-        place_found = False
-        while not place_found:
-            # Find where value fits in the tree and insert a node there with value
-            if self.less_than_func(value, current_node.value):
-                if current_node.left:
-                    parent_node = current_node
-                    current_node = current_node.left
-                else:
-                    current_node.left = AVLNode(value)
-                    self.inc = -1
-                    place_found = True
-            elif self.less_than_func(current_node.value, value):
-                if current_node.right:
-                    parent_node = current_node
-                    current_node = current_node.right
-                else:
-                    current_node.right = AVLNode(value)
-                    self.inc = 1
-                    place_found = True
-            else:  # value equal to current_node.value; value shall be ignored
-                self.inc = 0
-                place_found = True
-        while self.inc != 0:
-            # height of subtree changed
+        if directions[-1] == -1:
+            path[-1].left = self.node_class(value, key)
+        else:
+            path[-1].right = self.node_class(value, key)
+        if self.order_statistics:
+            for node in path:
+                node.size += 1
+        if self.monoid is not None:
+            self._refresh_aggregates(path)
+        parent_node = path[0]
+        for i in range(len(path) - 1, -1, -1):
+            # height of the subtree entered from current_node increased
+            current_node = path[i]
+            inc = directions[i]
+            if i:
+                parent_node = path[i - 1]
             if current_node.balance == 0:
-                current_node.balance = self.inc
-                if current_node == parent_node.left:
-                    self.inc = -abs(self.inc)
-                else:
-                    self.inc = abs(self.inc)
-            elif current_node.balance == -self.inc:
+                current_node.balance = inc
+            elif current_node.balance == -inc:
                 current_node.balance = 0
-                self.inc = 0
-            elif current_node.balance == self.inc:
-                if (self.inc == -1 and current_node.left.balance == -current_node.balance) or \
-                        (self.inc == 1 and current_node.right.balance == -current_node.balance):
+                return
+            else:
+                child_node = current_node.left if inc == -1 else current_node.right
+                if child_node.balance == -inc:
                     self._doublerotation(parent_node, current_node)
                 else:
                     self._singlerotation(parent_node, current_node)
-                self.inc = 0
-            if current_node == self.head:
-                break
-            current_node = parent_node
-            parent_node = self._find_parent(parent_node)
+                return
 
-    def _recursive_insert(self, parent_node, current_node, value):
+    def _recursive_insert(self, parent_node, current_node, key, value):
         """
         The recursive version of the insertion in to an AVL tree. It maintains the tree balanced
         (i.e. maintains the AVL invariant) by adjusting the balance factors of affected nodes
-        and rebalancing the tree, as necessary
+        and rebalancing the tree, as necessary.
+        The height change is handed up as a return value rather than kept on the tree, so
+        concurrent operations on separate trees, or versions, do not share any state
         :param parent_node: The node pointing to current_node
         :param current_node: The current place in the tree
+        :param key: The key of value
         :param value: The new value to be inserted in the tree
-        :return: None
-
+        :return: (inserted, grown): inserted is True if value was inserted, and False if an
+            equal value was in the tree already; grown is True if the height of the subtree
+            rooted at current_node increased
         """
         # Find where value fits in the tree and insert a node there with value
-        if self.less_than_func(value, current_node.value):
+        if self.less_than_func(key, current_node.key):
+            inc = -1
             if current_node.left:
-                self._recursive_insert(current_node, current_node.left, value)
-                self.inc = -abs(self.inc)
+                inserted, grown = self._recursive_insert(current_node, current_node.left, key,
+                                                         value)
             else:
-                current_node.left = AVLNode(value)
-                self.inc = -1
-        elif self.less_than_func(current_node.value, value):
+                current_node.left = self.node_class(value, key)
+                inserted = grown = True
+        elif self.less_than_func(current_node.key, key):
+            inc = 1
             if current_node.right:
-                self._recursive_insert(current_node, current_node.right, value)
-                self.inc = abs(self.inc)
+                inserted, grown = self._recursive_insert(current_node, current_node.right, key,
+                                                         value)
             else:
                 # base case: place found
-                current_node.right = AVLNode(value)
-                self.inc = 1
+                current_node.right = self.node_class(value, key)
+                inserted = grown = True
+        elif self.lazy_delete and not current_node.count:  # a tombstone; value replaces it
+            self._revive((), current_node, key, value)
+            return True, False
+        elif self.multiset:  # value exists already (equal to current_node.value); count it
+            self._add_occurrences((), current_node, 1)
+            return True, False
         else:  # value exists already (equal to current_node.value); value shall be ignored
-            self.inc = 0
+            return False, False
+        if inserted and self.order_statistics:
+            current_node.size += 1
+        if inserted and self.monoid is not None:
+            self._update_aggregate(current_node)
+        if not grown:
+            return inserted, False
         # If needed, re-balance the tree
-        if self.inc != 0:
-            if current_node.balance == 0:
-                current_node.balance = self.inc
-            elif current_node.balance == -self.inc:
-                current_node.balance = 0
-                self.inc = 0
-            elif current_node.balance == self.inc:
-                if (self.inc == -1 and current_node.left.balance == -current_node.balance) or \
-                        (self.inc == 1 and current_node.right.balance == -current_node.balance):
-                    self._doublerotation(parent_node, current_node)
-                else:
-                    self._singlerotation(parent_node, current_node)
-                self.inc = 0
+        if current_node.balance == 0:
+            current_node.balance = inc
+            return True, True
+        if current_node.balance == -inc:
+            current_node.balance = 0
+        else:
+            child_node = current_node.left if inc == -1 else current_node.right
+            if child_node.balance == -inc:
+                self._doublerotation(parent_node, current_node)
+            else:
+                self._singlerotation(parent_node, current_node)
+        return True, False
 
     def insert(self, value):
         """
@@ -241,99 +635,1744 @@ class AVLTree:
         :param value: Value to be inserted in tree
         :return: None
         """
+        key = value if self.key_func is None else self.key_func(value)
         if not self.head:
-            self.head = AVLNode(value)
-        else:
-            self.insertion_method(self.head, self.head, value)
+            self.head = self.node_class(value, key)
+            self.length = 1
+            self.snapshot = None
+        elif self.insertion_method(self.head, self.head, key, value):
+            if self.length is not None:
+                self.length += 1
+            self.snapshot = None
+
+    def _recursive_insert_value(self, parent_node, current_node, key, value):
+        """
+        The entry point of the recursive insertion, cf. _recursive_insert
+        :return: True if value was inserted; False if an equal value was in the tree already
+        """
+        inserted, _ = self._recursive_insert(parent_node, current_node, key, value)
+        return inserted
 
-    def _recursive_delete(self, parent_node, current_node, value):
-        if self.to_be_deleted_value_node:  # Value to be deleted found further up in the tree
+    def _recursive_delete(self, parent_node, current_node, key, to_be_deleted_value_node=None):
+        """
+        The recursive version of the deletion from an AVL tree. A node with a left subtree gets
+        the value of its in-order predecessor, and the predecessor's node is removed instead
+        :param parent_node: The node pointing to current_node
+        :param current_node: The current place in the tree
+        :param key: The key of the value to be deleted from the tree
+        :param to_be_deleted_value_node: The node holding the value to be deleted, once found
+            further up in the tree; the descent then follows the path to its predecessor
+        :return: True if the height of the subtree rooted at current_node decreased
+        """
+        if to_be_deleted_value_node is not None:  # Value to be deleted found further up
             if current_node.right:
-                self._recursive_delete(current_node, current_node.right, value)
-                self.inc = -abs(self.inc)
-            else:
-                self.to_be_deleted_value_node.value = current_node.value
-                if parent_node.left == current_node:
-                    self.inc = 1
-                elif parent_node.right == current_node:
-                    self.inc = -1
+                shrunk = self._recursive_delete(current_node, current_node.right, key,
+                                                to_be_deleted_value_node)
+                inc = -1
+            else:
+                if self.cache is not None:
+                    # The node of the predecessor leaves the tree, while its value stays
+                    self.cache.discard(current_node.key)
+                to_be_deleted_value_node.value = current_node.value
+                to_be_deleted_value_node.key = current_node.key
+                if self.multiset:
+                    to_be_deleted_value_node.count = current_node.count
                 self._adjust_pointers(parent_node, current_node, current_node.left)
-                return  # No need to re-balance the potential subtree of the deleted node
+                return True  # No need to re-balance the potential subtree of the deleted node
+        elif current_node:
+            if self.less_than_func(key, current_node.key):
+                shrunk = self._recursive_delete(current_node, current_node.left, key)
+                inc = 1
+            elif self.less_than_func(current_node.key, key):
+                shrunk = self._recursive_delete(current_node, current_node.right, key)
+                inc = -1
+            else:
+                # Value to be deleted is in current node
+                if self.multiset and current_node.count > 1:
+                    self._add_occurrences((), current_node, -1)
+                    return False
+                if self.cache is not None:
+                    self.cache.discard(current_node.key)
+                if not current_node.left:
+                    self._adjust_pointers(parent_node, current_node, current_node.right)
+                    return True  # No need to re-balance the potential subtree of the deleted node
+                shrunk = self._recursive_delete(current_node, current_node.left, key,
+                                                current_node)
+                inc = 1
         else:
-            if current_node:
-                if self.less_than_func(value, current_node.value):
-                    self._recursive_delete(current_node, current_node.left, value)
-                    self.inc = abs(self.inc)
-                elif self.less_than_func(current_node.value, value):
-                    self._recursive_delete(current_node, current_node.right, value)
-                    self.inc = -abs(self.inc)
-                else:
-                    # Value to be deleted is in current node
-                    self.to_be_deleted_value_node = current_node
-                    if not current_node.left:
-                        if parent_node.left == current_node:
-                            self.inc = 1
-                        elif parent_node.right == current_node:
-                            self.inc = -1
-                        self._adjust_pointers(parent_node, current_node, current_node.right)
-                        return  # No need to re-balance the potential subtree of the deleted node
-                    self._recursive_delete(current_node, current_node.left, value)
-                    self.inc = abs(self.inc)
-            else:
-                raise ValueError(f"{value} not found in tree!")
-        if self.inc != 0:
-            # If needed, re-balance the tree
+            raise ValueError(f"{key} not found in tree!")
+        if self.order_statistics:
+            if to_be_deleted_value_node is not None and self.multiset:
+                # The moved predecessor has left the subtree with all of its values
+                current_node.size -= to_be_deleted_value_node.count
+            else:
+                current_node.size -= 1
+        if self.monoid is not None:
+            self._update_aggregate(current_node)
+        if not shrunk:
+            return False
+        # If needed, re-balance the tree
+        if current_node.balance == 0:
+            current_node.balance = inc
+            return False
+        if current_node.balance == -inc:
+            current_node.balance = 0
+            return True
+        child_node = current_node.left if inc == -1 else current_node.right
+        if child_node.balance == -inc:
+            self._doublerotation(parent_node, current_node)
+            return True
+        # The height of the rotated subtree is unchanged, if the child was balanced
+        shrunk = child_node.balance != 0
+        self._singlerotation(parent_node, current_node, delete=True)
+        return shrunk
+
+    def _iterative_delete(self, parent_node, current_node, key):
+        """
+        The loop based version of the deletion from an AVL tree. The nodes passed on the way down
+        are recorded on a stack together with the direction taken, which is then retraced to
+        rebalance the tree. As in _recursive_delete, a node with a left subtree gets the value
+        of its in-order predecessor, and the predecessor's node is removed instead, so both
+        versions leave the tree in the same shape
+        :param parent_node: The node pointing to current_node
+        :param current_node: The current place in the tree
+        :param key: The key of the value to be deleted from the tree
+        :return: None
+        """
+        path, directions, current_node = self.descent_method(current_node, key)
+        if current_node is None:
+            raise ValueError(f"{key} not found in tree!")
+        if self.multiset and current_node.count > 1:
+            self._add_occurrences(path, current_node, -1)
+            return
+        self._delete_at(path, directions, current_node)
+
+    def _delete_at(self, path, directions, current_node, copying=False):
+        """
+        Internal routine for removing current_node, or the node of its in-order predecessor,
+        and retracing path to rebalance the tree
+        :param path: The nodes from the head down to the parent of current_node
+        :param directions: The side taken at each node of path: -1 for left, 1 for right
+        :param current_node: The node holding the value to be deleted
+        :param copying: If True, path and current_node are private copies, cf. _copying_delete,
+            and every other node about to be modified is copied first
+        :return: None
+        """
+        # The nodes of path above target_index lose one value; those below it lose the moved
+        # predecessor with all of its values
+        target_index = len(path)
+        moved_count = 1
+        if self.cache is not None:
+            self.cache.discard(current_node.key)
+        if current_node.left is None:
+            replacement_node = current_node.right
+        else:
+            # Move the value of the in-order predecessor up, and remove the predecessor's node
+            to_be_deleted_value_node = current_node
+            path.append(current_node)
+            directions.append(-1)
+            current_node = current_node.left
+            if copying:
+                current_node = to_be_deleted_value_node.left = current_node.copy()
+            while current_node.right is not None:
+                path.append(current_node)
+                directions.append(1)
+                current_node = current_node.right
+                if copying:
+                    current_node = path[-1].right = current_node.copy()
+            if self.cache is not None:
+                # The node of the predecessor leaves the tree, while its value stays
+                self.cache.discard(current_node.key)
+            to_be_deleted_value_node.value = current_node.value
+            to_be_deleted_value_node.key = current_node.key
+            if self.multiset:
+                moved_count = to_be_deleted_value_node.count = current_node.count
+            replacement_node = current_node.left
+        if not path:
+            self.head = replacement_node
+            return
+        if self.order_statistics:
+            for i, node in enumerate(path):
+                node.size -= 1 if i <= target_index else moved_count
+        if directions[-1] == -1:
+            path[-1].left = replacement_node
+        else:
+            path[-1].right = replacement_node
+        if self.monoid is not None:
+            self._refresh_aggregates(path)
+        parent_node = path[0]
+        for i in range(len(path) - 1, -1, -1):
+            # The subtree entered from current_node has decreased in height
+            current_node = path[i]
+            inc = -directions[i]
+            if i:
+                parent_node = path[i - 1]
             if current_node.balance == 0:
-                current_node.balance = self.inc
-                self.inc = 0
-            elif current_node.balance == -self.inc:
+                current_node.balance = inc
+                return
+            if current_node.balance == -inc:
                 current_node.balance = 0
-                self.inc = -1
-            elif current_node.balance == self.inc:
-                if (self.inc == -1 and current_node.left.balance == -current_node.balance) or \
-                        (self.inc == 1 and current_node.right.balance == -current_node.balance):
-                    self._doublerotation(parent_node, current_node)
-                    self.inc = -1
-                else:
-                    self._singlerotation(parent_node, current_node, delete=True)
+                continue
+            if inc == -1:
+                child_node = current_node.left
+                if copying:
+                    child_node = current_node.left = child_node.copy()
+            else:
+                child_node = current_node.right
+                if copying:
+                    child_node = current_node.right = child_node.copy()
+            if child_node.balance == -inc:
+                if copying:
+                    # The inner grandchild becomes the top of the rotated subtree
+                    if inc == -1:
+                        child_node.right = child_node.right.copy()
+                    else:
+                        child_node.left = child_node.left.copy()
+                self._doublerotation(parent_node, current_node)
+            elif child_node.balance == 0:
+                # The height of the rotated subtree is unchanged, so rebalancing stops here
+                self._singlerotation(parent_node, current_node, delete=True)
+                return
+            else:
+                self._singlerotation(parent_node, current_node, delete=True)
 
     def delete(self, value):
+        """
+        Public routine for deleting value from the tree. Uses modules or recursive approach
+        :param value: Value to be deleted from the tree
+        :return: None
+        :raises ValueError: If the tree is empty or value is not in the tree
+        """
+        if not self.head:
+            raise ValueError("Trying to delete from an empty tree!")
+        key = value if self.key_func is None else self.key_func(value)
+        self.deletion_method(self.head, self.head, key)
+        if self.length is not None:
+            self.length -= 1
+        self.snapshot = None
+        if self.tombstones and self._compaction_due():
+            self.compact()
+
+    def _lazy_delete(self, parent_node, current_node, key):
+        """
+        The lazy version of the deletion: the count of the node holding key is decremented,
+        and so are the subtree sizes on the path. A node left with a count of 0 is a tombstone,
+        which stays in the tree until it is compacted or its value is inserted again
+        :param parent_node: The node pointing to current_node
+        :param current_node: The current place in the tree
+        :param key: The key of the value to be deleted from the tree
+        :return: None
+        """
+        path, _, current_node = self.descent_method(current_node, key)
+        if current_node is None or not current_node.count:
+            raise ValueError(f"{key} not found in tree!")
+        self._add_occurrences(path, current_node, -1)
+        if not current_node.count:
+            self.tombstones += 1
+
+    def _revive(self, path, node, key, value):
+        """
+        Internal routine for inserting value in to its tombstone
+        :param path: The nodes from the head down to the parent of node
+        :param node: The tombstone, whose key is equal to key
+        :param key: The key of value
+        :param value: The value
+        :return: None
+        """
+        node.value = value
+        node.key = key
+        self.tombstones -= 1
+        self._add_occurrences(path, node, 1)
+
+    def _find_live(self, current_node, key):
+        """
+        As the find method of the tree, but not finding tombstones
+        """
+        found, node = self._find_any(current_node, key)
+        if found and not node.count:
+            return _NOT_FOUND
+        return found, node
+
+    def _compaction_due(self):
+        """
+        Internal routine for telling whether the tombstones exceed compaction_threshold
+        :return: True if the tree should be compacted
+        """
+        if self.compaction_threshold is None:
+            return False
+        return self.tombstones > self.compaction_threshold * (len(self) + self.tombstones)
+
+    def compact(self):
+        """
+        Public routine for removing the tombstones of a tree with lazy_delete, by rebuilding
+        a perfectly balanced tree of the live values in O(n). The nodes are replaced, so nodes
+        found before are no longer part of the tree. Without tombstones, the tree is kept
+        :return: None
+        """
+        if not self.tombstones:
+            return
+        nodes = list(self._iter_nodes())
+        counts = [node.count for node in nodes] if self.multiset else None
+        self._rebuild([node.value for node in nodes], [node.key for node in nodes], counts)
+
+    def _copy_path(self, path, directions):
+        """
+        Internal routine for replacing the nodes of path by copies linked to each other, and
+        making the first copy the head of the tree. The nodes of path are left unchanged, as
+        are the subtrees hanging off the path, which the copies share
+        :param path: The nodes from the head downwards, cf. _descend
+        :param directions: The side taken at each node of path but the last
+        :return: list of the copies
+        """
+        copies = [node.copy() for node in path]
+        for i in range(1, len(copies)):
+            if directions[i - 1] == -1:
+                copies[i - 1].left = copies[i]
+            else:
+                copies[i - 1].right = copies[i]
+        self.head = copies[0]
+        return copies
+
+    def _copying_insert(self, key, value):
+        """
+        Internal routine for inserting value by path copying: no node reachable from the head
+        before the insertion is modified, so readers holding the former head keep seeing a
+        consistent tree. Only the O(log n) nodes on the path, and those rotated, are new
+        :param key: The key of value
+        :param value: The new value to be inserted in the tree
+        :return: True if value was inserted; False if an equal value was in the tree already
+        """
+        if self.head is None:
+            self.head = self.node_class(value, key)
+            return True
+        path, directions, node = self.descent_method(self.head, key)
+        if node is not None:
+            tombstone = self.lazy_delete and not node.count
+            if not (tombstone or self.multiset):
+                return False
+            path = self._copy_path(path + [node], directions)
+            node = path.pop()
+            if tombstone:
+                self._revive(path, node, key, value)
+            else:
+                self._add_occurrences(path, node, 1)
+            return True
+        # The rotations only touch nodes of the path and the new node
+        self._insert_at(self._copy_path(path, directions), directions, key, value)
+        return True
+
+    def _copying_delete(self, key):
+        """
+        Internal routine for deleting the value with key by path copying, cf. _copying_insert.
+        Besides the path, the path down to the in-order predecessor and the children rotated up
+        during rebalancing are copied
+        :param key: The key of the value to be deleted from the tree
+        :return: None
+        :raises ValueError: If key is not in the tree
+        """
+        path, directions, node = self.descent_method(self.head, key)
+        if node is None or self.lazy_delete and not node.count:
+            raise ValueError(f"{key} not found in tree!")
+        path = self._copy_path(path + [node], directions)
+        node = path.pop()
+        if self.lazy_delete or self.multiset and node.count > 1:
+            self._add_occurrences(path, node, -1)
+            if not node.count:
+                self.tombstones += 1
+            return
+        self._delete_at(path, directions, node, copying=True)
+
+    def _version(self):
+        """
+        Internal routine for creating a tree alike, which shares the nodes of this tree
+        :return: AVLTree
+        """
+        if self.statistics is None:
+            tree = self._empty_like()
+        else:
+            # Instrumented with the statistics of this tree, so the versions count as one tree
+            tree = type(self)(**dict(self.configuration, stats=False, stats_callback=None))
+            tree.configuration = self.configuration
+            tree.statistics = self.statistics
+            self.statistics.instrument(tree)
+        tree.head = self.head
+        tree.length = self.length
+        tree.tombstones = self.tombstones
+        return tree
+
+    def _inserted_version(self, value):
+        """
+        Internal routine for creating a new version of the tree with value inserted, by path
+        copying. This tree is left unchanged
+        :param value: Value to be inserted
+        :return: The new version; this tree itself, if an equal value is in the tree already
+        """
+        key = value if self.key_func is None else self.key_func(value)
+        if self.head is not None and not self.multiset:
+            found, _ = self.find_method(self.head, key)
+            if found:
+                return self
+        version = self._version()
+        version._copying_insert(key, value)
+        if version.length is not None:
+            version.length += 1
+        return version
+
+    def _deleted_version(self, value):
+        """
+        Internal routine for creating a new version of the tree with value deleted, by path
+        copying. This tree is left unchanged
+        :param value: Value to be deleted
+        :return: The new version
+        :raises ValueError: If the tree is empty or value is not in the tree
+        """
         if not self.head:
             raise ValueError("Trying to delete from an empty tree!")
-        self.to_be_deleted_value_node = None
-        self._recursive_delete(self.head, self.head, value)
+        key = value if self.key_func is None else self.key_func(value)
+        version = self._version()
+        version._copying_delete(key)
+        if version.length is not None:
+            version.length -= 1
+        if version.tombstones and version._compaction_due():
+            version.compact()
+        return version
+
+    def _iterative_find(self, current_node, key):
+        """
+        The loop based version of the lookup
+        :param current_node: The node to start the search from
+        :param key: The key of the value to be found
+        :return: (True, node holding the value) if found; otherwise (False, None)
+        """
+        less_than_func = self.less_than_func
+        while current_node is not None:
+            if less_than_func(key, current_node.key):
+                current_node = current_node.left
+            elif less_than_func(current_node.key, key):
+                current_node = current_node.right
+            else:
+                return True, current_node
+        return _NOT_FOUND
 
-    def _recursive_find(self, current_node, value):
+    def _iterative_find_native(self, current_node, key):
+        """
+        As _iterative_find, but comparing by the native < and == operators
+        """
+        while current_node is not None:
+            node_key = current_node.key
+            if key < node_key:
+                current_node = current_node.left
+            elif key == node_key:
+                return True, current_node
+            else:
+                current_node = current_node.right
+        return _NOT_FOUND
+
+    def _iterative_find_cmp(self, current_node, key):
+        """
+        As _iterative_find, but comparing by a single call of cmp per level
+        """
+        cmp = self.cmp_func
+        while current_node is not None:
+            order = cmp(key, current_node.key)
+            if order < 0:
+                current_node = current_node.left
+            elif order > 0:
+                current_node = current_node.right
+            else:
+                return True, current_node
+        return _NOT_FOUND
+
+    def _recursive_find(self, current_node, key):
         if current_node:
-            if self.less_than_func(value, current_node.value):
-                return self._recursive_find(current_node.left, value)
-            if self.less_than_func(current_node.value, value):
-                return self._recursive_find(current_node.right, value)
+            if self.less_than_func(key, current_node.key):
+                return self._recursive_find(current_node.left, key)
+            if self.less_than_func(current_node.key, key):
+                return self._recursive_find(current_node.right, key)
             return True, current_node
-        return False, None
+        return _NOT_FOUND
 
     def find(self, value):
-        if self.head:
-            return self._recursive_find(self.head, value)
-        return False, None
+        """
+        Public routine for looking up value in the tree. Uses modules or recursive approach
+        :param value: Value to be found
+        :return: (True, node holding value) if found; otherwise (False, None)
+        """
+        if self.key_func is None:
+            return self.find_method(self.head, value)
+        return self.find_method(self.head, self.key_func(value))
+
+    def count(self, value):
+        """
+        Public routine for counting the values in the tree equal to value, in O(log n)
+        :param value: Value to be counted
+        :return: The number of equal values; at most 1, unless the tree is a multiset
+        """
+        found, node = self.find(value)
+        if not found:
+            return 0
+        return node.count if self.multiset else 1
+
+    def _find_sorted(self, keys):
+        """
+        Internal routine for looking up keys in increasing order. The descent for a key resumes
+        from where the descent for the previous key ended, climbing only as far up as needed,
+        so close keys share most of the work
+        :param keys: The keys in increasing order
+        :return: List of the nodes holding the keys; None for the keys not in the tree
+        """
+        less_than_func = self.less_than_func
+        nodes = []
+        # The nodes where the last descent went left. Their keys bound the keys of the nodes
+        # visited after them from above
+        left_turn_nodes = []
+        last_node = self.head
+        for key in keys:
+            node = last_node
+            while left_turn_nodes and not less_than_func(key, left_turn_nodes[-1].key):
+                # key is not in the left subtree of the node; resume from the node itself
+                node = left_turn_nodes.pop()
+            found_node = None
+            while node is not None:
+                last_node = node
+                if less_than_func(key, node.key):
+                    left_turn_nodes.append(node)
+                    node = node.left
+                elif less_than_func(node.key, key):
+                    node = node.right
+                else:
+                    found_node = node
+                    break
+            nodes.append(found_node)
+        return nodes
+
+    def _iter_nodes(self, reverse=False):
+        """
+        Internal routine for iterating over the nodes of the tree in increasing order, but the
+        tombstones
+        :param reverse: If True, in decreasing order
+        :return: Generator of the nodes
+        """
+        tombstones = self.tombstones
+        stack = []
+        node = self.head
+        while True:
+            while node is not None:
+                stack.append(node)
+                node = node.right if reverse else node.left
+            if not stack:
+                return
+            node = stack.pop()
+            if not tombstones or node.count:
+                yield node
+            node = node.left if reverse else node.right
+
+    def _numpy_lookup(self, probes):
+        """
+        Internal routine for looking up a numpy array of keys in the sorted array of the keys
+        of the tree, which is kept in self.snapshot until the tree is modified
+        :param probes: numpy array of keys
+        :return: numpy array of the index of each probe in the sorted keys; -1 if not found
+        """
+        if self.less_than_func is not operator.lt or self.cmp_func is not None:
+            raise ValueError("numpy lookups require a tree comparing keys natively!")
+        if self.snapshot is None:
+            snapshot = numpy.array([node.key for node in self._iter_nodes()])
+            if snapshot.size and snapshot.dtype.kind not in "biuf":
+                raise ValueError("numpy lookups require a tree of numbers!")
+            snapshot.flags.writeable = False
+            self.snapshot = snapshot
+        snapshot = self.snapshot
+        indices = numpy.searchsorted(snapshot, probes)
+        if not snapshot.size:
+            return numpy.full(indices.shape, -1, dtype=numpy.intp)
+        found = snapshot[numpy.minimum(indices, snapshot.size - 1)] == probes
+        return numpy.where(found, indices, -1)
+
+    def find_many(self, values, presorted=False):
+        """
+        Public routine for looking up many values at once
+        :param values: Iterable of values. A numpy array is taken as keys to be looked up in a
+            tree of numbers, which are compared natively
+        :param presorted: If True, values must be in increasing order, and the lookups share
+            the descents through the tree
+        :return: List of the nodes holding the values, with None for each value not in the tree.
+            For a numpy array: array of the positions of the keys in sorted order; -1 if not
+            found
+        """
+        if numpy is not None and isinstance(values, numpy.ndarray):
+            return self._numpy_lookup(values)
+        key_func = self.key_func
+        keys = values if key_func is None else (key_func(value) for value in values)
+        if presorted:
+            nodes = self._find_sorted(keys)
+            if self.tombstones:
+                return [node if node is not None and node.count else None for node in nodes]
+            return nodes
+        find_method = self.find_method
+        head = self.head
+        return [find_method(head, key)[1] for key in keys]
+
+    def contains_many(self, values, presorted=False):
+        """
+        Public routine for checking the membership of many values at once. Cf. find_many
+        :param values: Iterable of values, or numpy array of keys
+        :param presorted: If True, values must be in increasing order
+        :return: List of booleans; for a numpy array, a boolean array
+        """
+        if numpy is not None and isinstance(values, numpy.ndarray):
+            return self._numpy_lookup(values) >= 0
+        return [node is not None for node in self.find_many(values, presorted)]
+
+    def _sorted_batch(self, values):
+        """
+        Internal routine for ordering a batch of values by the keys and comparison of the tree
+        :param values: list of the values
+        :return: (keys of the values, the indices of the values in sorted order). The sort is
+            stable, so of equal values the first comes first
+        """
+        keys = values if self.key_func is None else [self.key_func(value) for value in values]
+        sort_key = self._sort_key()
+        if sort_key is None:
+            order = sorted(range(len(values)), key=keys.__getitem__)
+        else:
+            order = sorted(range(len(values)), key=lambda i: sort_key(keys[i]))
+        return keys, order
+
+    def _rebuild(self, values, keys, counts=None):
+        """
+        Internal routine for replacing the nodes of the tree by a perfectly balanced tree
+        :param values: The values in increasing order and without duplicates
+        :param keys: The keys of values
+        :param counts: The multiplicities of the values, in a multiset; None for all ones
+        :return: None
+        """
+        with _gc_paused():
+            self.head, _ = self._build_balanced(values, keys, 0, len(values), counts)
+        self.length = len(values) if counts is None else sum(counts)
+        self.tombstones = 0
+        self.snapshot = None
+        if self.cache is not None:
+            self.cache.clear()
+
+    def insert_many(self, iterable):
+        """
+        Public routine for inserting a batch of values. A batch large relative to the tree is
+        sorted and merged with the values of the tree, and the tree is rebuilt in
+        O(n + m log m) for m values; a smaller one is inserted value by value. Of equal values
+        the first is kept, as insert does. The nodes are replaced by a rebuild, so nodes found
+        before are no longer part of the tree
+        :param iterable: The values
+        :return: List of the outcome for each value: INSERTED or DUPLICATE. In a multiset,
+            each value is INSERTED
+        """
+        values = list(iterable)
+        # A multiset counts equal values in their node, so there is nothing to merge
+        if len(values) * BATCH_REBUILD_RATIO < len(self) or self.multiset:
+            outcomes = []
+            key_func = self.key_func
+            # The length is known, as counted by len
+            for value in values:
+                key = value if key_func is None else key_func(value)
+                if not self.head:
+                    self.head = self.node_class(value, key)
+                elif not self.insertion_method(self.head, self.head, key, value):
+                    outcomes.append(DUPLICATE)
+                    continue
+                self.length += 1
+                outcomes.append(INSERTED)
+            if INSERTED in outcomes:
+                self.snapshot = None
+            return outcomes
+        keys, order = self._sorted_batch(values)
+        less_than_func = self.less_than_func
+        outcomes = [DUPLICATE] * len(values)
+        merged_values = []
+        merged_keys = []
+        nodes = self._iter_nodes()
+        node = next(nodes, None)
+        for i in order:
+            key = keys[i]
+            while node is not None and less_than_func(node.key, key):
+                merged_values.append(node.value)
+                merged_keys.append(node.key)
+                node = next(nodes, None)
+            if node is not None and not less_than_func(key, node.key):
+                continue  # equal to a value of the tree
+            if merged_keys and not less_than_func(merged_keys[-1], key):
+                continue  # equal to a preceding value of the batch
+            merged_values.append(values[i])
+            merged_keys.append(key)
+            outcomes[i] = INSERTED
+        while node is not None:
+            merged_values.append(node.value)
+            merged_keys.append(node.key)
+            node = next(nodes, None)
+        self._rebuild(merged_values, merged_keys)
+        return outcomes
+
+    def delete_many(self, iterable):
+        """
+        Public routine for deleting a batch of values. Unlike delete, a value not in the tree is
+        reported rather than raising ValueError. As for insert_many, a large batch rebuilds the
+        tree from a sorted merge
+        :param iterable: The values
+        :return: List of the outcome for each value: DELETED or MISSING. Of equal values in the
+            batch, only the first can be DELETED, but in a multiset
+        """
+        values = list(iterable)
+        if len(values) * BATCH_REBUILD_RATIO < len(self) or self.multiset:
+            outcomes = []
+            key_func = self.key_func
+            for value in values:
+                key = value if key_func is None else key_func(value)
+                try:
+                    self.deletion_method(self.head, self.head, key)
+                except ValueError:  # raised before the tree is modified
+                    outcomes.append(MISSING)
+                    continue
+                self.length -= 1
+                outcomes.append(DELETED)
+            if DELETED in outcomes:
+                self.snapshot = None
+            if self.tombstones and self._compaction_due():
+                self.compact()
+            return outcomes
+        keys, order = self._sorted_batch(values)
+        less_than_func = self.less_than_func
+        outcomes = [MISSING] * len(values)
+        kept_values = []
+        kept_keys = []
+        position = 0
+        for node in self._iter_nodes():
+            while position < len(order) and less_than_func(keys[order[position]], node.key):
+                position += 1
+            if position < len(order) and not less_than_func(node.key, keys[order[position]]):
+                outcomes[order[position]] = DELETED
+                position += 1
+                continue
+            kept_values.append(node.value)
+            kept_keys.append(node.key)
+        self._rebuild(kept_values, kept_keys)
+        return outcomes
+
+    def _build_balanced(self, values, keys, low, high, counts=None):
+        """
+        Internal routine for building a perfectly balanced subtree of the values in
+        values[low:high], which are in increasing order and distinct
+        :param values: The values
+        :param keys: The keys of the values
+        :param low: Index of the first value of the subtree
+        :param high: Index after the last value of the subtree
+        :param counts: The multiplicities of the values, in a multiset; None for all ones
+        :return: (subtree root node, height of the subtree)
+        """
+        if low == high:
+            return None, 0
+        middle = (low + high) // 2
+        left_node, left_height = self._build_balanced(values, keys, low, middle, counts)
+        right_node, right_height = self._build_balanced(values, keys, middle + 1, high, counts)
+        node = self.node_class(values[middle], keys[middle])
+        node.left = left_node
+        node.right = right_node
+        node.balance = right_height - left_height
+        if counts is not None:
+            node.count = counts[middle]
+            if self.order_statistics:
+                self._update_size(node)
+        elif self.order_statistics:
+            node.size = high - low
+        if self.monoid is not None:
+            self._update_aggregate(node)
+        return node, max(left_height, right_height) + 1
+
+    @classmethod
+    def from_sorted(cls, iterable, *args, **kwargs):
+        """
+        Public routine for building a perfectly balanced tree in O(n) without comparing values
+        :param iterable: The values in increasing order and without duplicates. It is read once
+        :param args: Positional parameters of the tree, as for AVLTree()
+        :param kwargs: Keyword parameters of the tree, as for AVLTree()
+        :return: The new tree
+        """
+        tree = cls(*args, **kwargs)
+        values = iterable if isinstance(iterable, list) else list(iterable)
+        keys = values if tree.key_func is None else [tree.key_func(value) for value in values]
+        with _gc_paused():
+            tree.head, _ = tree._build_balanced(values, keys, 0, len(values))
+        tree.length = len(values)
+        return tree
+
+    @classmethod
+    def from_iterable(cls, iterable, *args, **kwargs):
+        """
+        Public routine for building a perfectly balanced tree of values in any order. The values
+        are sorted (by the keys and comparison of the tree) and of equal values the first is kept,
+        as insert does
+        :param iterable: The values. It is read once
+        :param args: Positional parameters of the tree, as for AVLTree()
+        :param kwargs: Keyword parameters of the tree, as for AVLTree()
+        :return: The new tree
+        """
+        tree = cls(*args, **kwargs)
+        values, keys, counts = tree._sorted_distinct(list(iterable))
+        tree._rebuild(values, keys, counts)
+        return tree
+
+    def _sort_key(self):
+        """
+        Internal routine for getting the key function sorting keys as the tree orders them
+        :return: The key function; None for the native ordering
+        """
+        if self.cmp_func is not None:
+            return functools.cmp_to_key(self.cmp_func)
+        if self.less_than_func is not operator.lt:
+            # Sorting only asks whether one key is less than another, i.e. cmp(x, y) < 0
+            less_than_func = self.less_than_func
+            return functools.cmp_to_key(lambda x, y: -1 if less_than_func(x, y) else 0)
+        return None
+
+    def _sorted_distinct(self, values):
+        """
+        Internal routine for sorting values by the keys and comparison of the tree, keeping the
+        first of equal values, as insert does
+        :param values: list of the values, which may be sorted in place
+        :return: (values, keys, counts), values and keys sorted; keys is values without a key
+            function. In a multiset, counts holds the multiplicity of each value; otherwise it
+            is None
+        """
+        sort_key = self._sort_key()
+        if self.key_func is None:
+            values.sort(key=sort_key)
+            keys = values
+        else:
+            keys = [self.key_func(value) for value in values]
+            if sort_key is None:
+                order = sorted(range(len(values)), key=keys.__getitem__)
+            else:
+                order = sorted(range(len(values)), key=lambda i: sort_key(keys[i]))
+            values = [values[i] for i in order]
+            keys = [keys[i] for i in order]
+        # The sort is stable, so the first of equal values comes first. A key is distinct from
+        # the preceding one if and only if it is greater
+        less_than_func = self.less_than_func
+        distinct = [i for i in range(len(keys)) if i == 0 or less_than_func(keys[i - 1], keys[i])]
+        counts = None
+        if self.multiset:
+            counts = [end - start for start, end in zip(distinct, distinct[1:] + [len(keys)])]
+        if len(distinct) < len(values):
+            values = [values[i] for i in distinct]
+            keys = values if self.key_func is None else [keys[i] for i in distinct]
+        return values, keys, counts
+
+    def dump(self, path, codec=None):
+        """
+        Public routine for writing the tree to a binary file, keeping its shape, in O(n) without
+        comparing values. Cf. serialization for the format, and load and MappedAVLTree for
+        reading it
+        :param path: The path of the file
+        :param codec: "int64", "float64" or "pickle" for the keys; None for the most compact one
+            able to hold them. Values other than the keys are pickled
+        :return: None
+        :raises ValueError: If the keys cannot be written with codec, or the tree is a multiset
+        """
+        if self.multiset:
+            raise ValueError("dump does not support trees with duplicates='count'")
+        # The format has no count, so the tombstones are left out, as if the tree was compacted
+        serialization.dump_nodes(self.head, path, self.key_func is not None, codec,
+                                 skip_tombstones=bool(self.tombstones))
+
+    @classmethod
+    def load(cls, path, *args, **kwargs):
+        """
+        Public routine for reading a tree written by dump in O(n), without comparing values.
+        The tree must be ordered as the tree dumped; the ordering is not checked
+        :param path: The path of the file
+        :param args: Positional parameters of the tree, as for AVLTree()
+        :param kwargs: Keyword parameters of the tree, as for AVLTree()
+        :return: The new tree
+        :raises ValueError: If the file does not hold a tree
+        """
+        tree = cls(*args, **kwargs)
+        with _gc_paused():
+            tree.head, tree.length = serialization.load_nodes(path, tree.node_class,
+                                                              tree.order_statistics)
+        if tree.monoid is not None:
+            tree._update_all_aggregates()
+        return tree
+
+    def __len__(self):
+        if self.length is None:
+            if self.counted:
+                self.length = sum(node.count for node in self._iter_nodes())
+            else:
+                self.length = sum(1 for _ in self._iter_nodes())
+        return self.length
+
+    def _check_order_statistics(self, method_name):
+        if not self.order_statistics:
+            raise ValueError(f"{method_name} requires a tree with order_statistics=True")
+
+    def rank(self, value):
+        """
+        Public routine for counting the values in the tree less than value, in O(log n).
+        Requires order_statistics=True
+        :param value: Value, which needs not be in the tree
+        :return: The number of values in the tree less than value
+        """
+        self._check_order_statistics("rank")
+        return self._rank_key(value if self.key_func is None else self.key_func(value), False)
+
+    def _rank_key(self, key, inclusive):
+        """
+        Internal routine for counting the values less than key, or less than or equal to key
+        :param key: The key to compare with
+        :param inclusive: If True, the values with a key equal to key are counted as well
+        :return: The number of values
+        """
+        less_than_func = self.less_than_func
+        rank = 0
+        node = self.head
+        while node is not None:
+            if less_than_func(key, node.key):
+                node = node.left
+            else:
+                # The values of node and its left subtree
+                node_rank = node.size - (node.right.size if node.right else 0)
+                if not less_than_func(node.key, key):
+                    if inclusive:
+                        return rank + node_rank
+                    return rank + (node.left.size if node.left else 0)
+                rank += node_rank
+                node = node.right
+        return rank
+
+    def select(self, index):
+        """
+        Public routine for finding the value with the given index in the sorted order of the
+        values, in O(log n). Requires order_statistics=True
+        :param index: Index of the value; negative indices count from the end, as for lists
+        :return: The value
+        :raises IndexError: If index is out of range
+        """
+        self._check_order_statistics("select")
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Index {index} out of range!")
+        return self._select_node(index).value
+
+    def _select_node(self, index):
+        """
+        Internal routine for finding the node of the value with the given index
+        :param index: Index of the value in [0..len(self))
+        :return: The node
+        """
+        node = self.head
+        while True:
+            left_size = node.left.size if node.left else 0
+            if index < left_size:
+                node = node.left
+            else:
+                # The values of node and its left subtree
+                index -= node.size - (node.right.size if node.right else 0)
+                if index < 0:
+                    return node
+                node = node.right
+
+    def percentile(self, percent):
+        """
+        Public routine for finding the value at the given percentile by the nearest-rank method,
+        in O(log n). Requires order_statistics=True
+        :param percent: The percentile in the interval [0..100]
+        :return: The smallest value, which at least percent percent of the values are less than
+            or equal to
+        :raises ValueError: If the tree is empty or percent is outside [0..100]
+        """
+        self._check_order_statistics("percentile")
+        if not 0 <= percent <= 100:
+            raise ValueError(f"Percentile {percent} outside [0..100]!")
+        if not len(self):
+            raise ValueError("Percentile of an empty tree!")
+        return self.select(max(math.ceil(percent * len(self) / 100) - 1, 0))
+
+    def _floor_node(self, key, strict):
+        """
+        Internal routine for finding the node with the greatest key less than (or equal to) key
+        :param key: The key to compare with
+        :param strict: If True, the key of the node must be less than key
+        :return: The node, or None if there is no such node
+        """
+        if self.tombstones:
+            # Step over the tombstones by the subtree sizes, which count the live values only
+            rank = self._rank_key(key, not strict)
+            return self._select_node(rank - 1) if rank else None
+        less_than_func = self.less_than_func
+        floor_node = None
+        node = self.head
+        while node is not None:
+            if less_than_func(node.key, key):
+                floor_node = node
+                node = node.right
+            elif strict or less_than_func(key, node.key):
+                node = node.left
+            else:
+                return node
+        return floor_node
+
+    def _ceiling_node(self, key, strict):
+        """
+        Internal routine for finding the node with the least key greater than (or equal to) key
+        :param key: The key to compare with
+        :param strict: If True, the key of the node must be greater than key
+        :return: The node, or None if there is no such node
+        """
+        if self.tombstones:
+            rank = self._rank_key(key, strict)
+            return self._select_node(rank) if rank < len(self) else None
+        less_than_func = self.less_than_func
+        ceiling_node = None
+        node = self.head
+        while node is not None:
+            if less_than_func(key, node.key):
+                ceiling_node = node
+                node = node.left
+            elif strict or less_than_func(node.key, key):
+                node = node.right
+            else:
+                return node
+        return ceiling_node
+
+    def floor(self, value):
+        """
+        Public routine for finding the greatest value in the tree less than or equal to value
+        :param value: Value, which needs not be in the tree
+        :return: The value found, or None if there is none
+        """
+        node = self._floor_node(value if self.key_func is None else self.key_func(value), False)
+        return node.value if node else None
+
+    def ceiling(self, value):
+        """
+        Public routine for finding the least value in the tree greater than or equal to value
+        :param value: Value, which needs not be in the tree
+        :return: The value found, or None if there is none
+        """
+        node = self._ceiling_node(value if self.key_func is None else self.key_func(value), False)
+        return node.value if node else None
+
+    def predecessor(self, value):
+        """
+        Public routine for finding the greatest value in the tree less than value
+        :param value: Value, which needs not be in the tree
+        :return: The value found, or None if there is none
+        """
+        node = self._floor_node(value if self.key_func is None else self.key_func(value), True)
+        return node.value if node else None
+
+    def successor(self, value):
+        """
+        Public routine for finding the least value in the tree greater than value
+        :param value: Value, which needs not be in the tree
+        :return: The value found, or None if there is none
+        """
+        node = self._ceiling_node(value if self.key_func is None else self.key_func(value), True)
+        return node.value if node else None
+
+    def min(self):
+        """
+        Public routine for finding the least value in the tree
+        :return: The least value
+        :raises ValueError: If the tree is empty
+        """
+        node = self.head
+        if node is None or not len(self):
+            raise ValueError("min of an empty tree!")
+        if self.tombstones:
+            return self._select_node(0).value
+        while node.left is not None:
+            node = node.left
+        return node.value
+
+    def max(self):
+        """
+        Public routine for finding the greatest value in the tree
+        :return: The greatest value
+        :raises ValueError: If the tree is empty
+        """
+        node = self.head
+        if node is None or not len(self):
+            raise ValueError("max of an empty tree!")
+        if self.tombstones:
+            return self._select_node(len(self) - 1).value
+        while node.right is not None:
+            node = node.right
+        return node.value
+
+    def range(self, low=None, high=None, inclusive=(True, False), reverse=False):
+        """
+        Public routine for iterating over the values between low and high in sorted order.
+        Subtrees outside the bounds are never entered, so the cost is O(log n + k) for k values.
+        The tree must not be modified while iterating
+        :param low: The lower bound; None for no lower bound
+        :param high: The upper bound; None for no upper bound
+        :param inclusive: Pair telling whether values equal to low and high, respectively, are
+            included
+        :param reverse: If True, the values are yielded in decreasing order
+        :return: Generator of the values
+        """
+        within_start, within_end = _range_bounds(self.less_than_func, self.key_func, low, high,
+                                                 inclusive, reverse)
+        # The stack holds the nodes within the starting bound, whose values and far subtrees are
+        # still to be visited, the nearest to the start on top
+        stack = []
+        node = self.head
+        while node is not None:
+            if within_start(node.key):
+                stack.append(node)
+                node = node.right if reverse else node.left
+            else:
+                node = node.left if reverse else node.right
+        counted = self.counted
+        while stack:
+            node = stack.pop()
+            if not within_end(node.key):
+                return
+            if counted:
+                yield from itertools.repeat(node.value, node.count)
+            else:
+                yield node.value
+            node = node.left if reverse else node.right
+            while node is not None:
+                stack.append(node)
+                node = node.right if reverse else node.left
+
+    def aggregate(self, low=None, high=None, inclusive=(True, False)):
+        """
+        Public routine for aggregating the values between low and high by the monoid of the tree
+        in O(log n): the stored aggregates cover whole subtrees within the bounds, so only the
+        two paths to the bounds are combined
+        :param low: The lower bound; None for no lower bound
+        :param high: The upper bound; None for no upper bound
+        :param inclusive: Pair telling whether values equal to low and high, respectively, are
+            included
+        :return: The aggregate of the values in increasing order; the identity of the monoid, if
+            there are none
+        :raises ValueError: If the tree has no monoid
+        """
+        monoid = self.monoid
+        if monoid is None:
+            raise ValueError("aggregate needs a tree constructed with a monoid")
+        above_low, below_high = _range_bounds(self.less_than_func, self.key_func, low, high,
+                                              inclusive, False)
+        combine = monoid.combine
+        identity = monoid.identity
+        # Descend to the highest node within the bounds, where the paths to the bounds fork
+        split_node = self.head
+        while split_node is not None:
+            if not above_low(split_node.key):
+                split_node = split_node.right
+            elif not below_high(split_node.key):
+                split_node = split_node.left
+            else:
+                break
+        if split_node is None:
+            return identity
+        # Below the fork every right subtree on the path to low is within the bounds, and so is
+        # every left subtree on the path to high
+        left = identity
+        node = split_node.left
+        while node is not None:
+            if above_low(node.key):
+                within = self._measure(node)
+                if node.right is not None:
+                    within = combine(within, node.right.agg)
+                left = combine(within, left)
+                node = node.left
+            else:
+                node = node.right
+        right = identity
+        node = split_node.right
+        while node is not None:
+            if below_high(node.key):
+                within = self._measure(node)
+                if node.left is not None:
+                    within = combine(node.left.agg, within)
+                right = combine(right, within)
+                node = node.right
+            else:
+                node = node.left
+        return combine(combine(left, self._measure(split_node)), right)
+
+    @staticmethod
+    def _height(node):
+        """
+        Internal routine for finding the height of a subtree in O(log n) by following the
+        balance factors down the higher side
+        :param node: The root node of the subtree
+        :return: The height; 0 for an empty subtree
+        """
+        height = 0
+        while node is not None:
+            height += 1
+            node = node.left if node.balance < 0 else node.right
+        return height
+
+    def _rebalance_joined(self, node, left_height, right_height):
+        """
+        Internal routine for setting the balance factor of node, whose subtrees have been
+        replaced, and rotating if they differ in height by two
+        :param node: The node
+        :param left_height: Height of the left subtree of node
+        :param right_height: Height of the right subtree of node
+        :return: (root node of the rebalanced subtree, its height)
+        """
+        balance = right_height - left_height
+        if -1 <= balance <= 1:
+            node.balance = balance
+            if self.augmented:
+                self._update_fields(node)
+            return node, max(left_height, right_height) + 1
+        if balance > 0:
+            node.balance = 1
+            child_node = node.right
+        else:
+            node.balance = -1
+            child_node = node.left
+        # The rotation helpers re-point the parent of the rotated node, so a holder node stands
+        # in. A plain node, as a monoid might not measure None
+        holder_node = AVLNode(None, None)
+        holder_node.left = node
+        height = max(left_height, right_height)
+        if child_node.balance == -node.balance:
+            self._doublerotation(holder_node, node)
+        else:
+            if child_node.balance == 0:
+                height += 1
+            self._singlerotation(holder_node, node, delete=True)
+        return holder_node.left, height
+
+    def _join_nodes(self, left_node, left_height, pivot_node, right_node, right_height):
+        """
+        Internal routine for joining two subtrees and a pivot node, all keys of the left subtree
+        being less than the key of pivot_node, which is less than all keys of the right subtree.
+        The pivot is placed down the side of the higher subtree, where the heights match, and the
+        tree is rebalanced on the way back up, so it takes O(difference in height)
+        :param left_node: The root node of the left subtree
+        :param left_height: Height of the left subtree
+        :param pivot_node: A node not in the tree
+        :param right_node: The root node of the right subtree
+        :param right_height: Height of the right subtree
+        :return: (root node of the joined subtree, its height)
+        """
+        if left_height > right_height + 1:
+            outer_height = left_height - 1 if left_node.balance <= 0 else left_height - 2
+            inner_height = left_height - 1 if left_node.balance >= 0 else left_height - 2
+            left_node.right, inner_height = self._join_nodes(left_node.right, inner_height,
+                                                             pivot_node, right_node, right_height)
+            return self._rebalance_joined(left_node, outer_height, inner_height)
+        if right_height > left_height + 1:
+            outer_height = right_height - 1 if right_node.balance >= 0 else right_height - 2
+            inner_height = right_height - 1 if right_node.balance <= 0 else right_height - 2
+            right_node.left, inner_height = self._join_nodes(left_node, left_height, pivot_node,
+                                                             right_node.left, inner_height)
+            return self._rebalance_joined(right_node, inner_height, outer_height)
+        pivot_node.left = left_node
+        pivot_node.right = right_node
+        pivot_node.balance = right_height - left_height
+        if self.augmented:
+            self._update_fields(pivot_node)
+        return pivot_node, max(left_height, right_height) + 1
+
+    def _split_first(self, node, height):
+        """
+        Internal routine for removing the node with the least key from a non-empty subtree
+        :param node: The root node of the subtree
+        :param height: Height of the subtree
+        :return: (the removed node, root node of the remaining subtree, its height)
+        """
+        right_node = node.right
+        right_height = height - 1 if node.balance >= 0 else height - 2
+        if node.left is None:
+            node.right = None
+            return node, right_node, right_height
+        left_height = height - 1 if node.balance <= 0 else height - 2
+        first_node, left_node, left_height = self._split_first(node.left, left_height)
+        node, height = self._join_nodes(left_node, left_height, node, right_node, right_height)
+        return first_node, node, height
+
+    def _join_nodes_without_pivot(self, left_node, left_height, right_node, right_height):
+        """
+        Internal routine for joining two subtrees, all keys of the left subtree being less than
+        all keys of the right subtree. Cf. _join_nodes
+        :return: (root node of the joined subtree, its height)
+        """
+        if left_node is None:
+            return right_node, right_height
+        if right_node is None:
+            return left_node, left_height
+        pivot_node, right_node, right_height = self._split_first(right_node, right_height)
+        return self._join_nodes(left_node, left_height, pivot_node, right_node, right_height)
+
+    def _split_nodes(self, node, height, key):
+        """
+        Internal routine for splitting a subtree in the nodes with keys less than key, the node
+        with key, and the nodes with keys greater than key. Each node on the way down to key is
+        joined on to the side it belongs to, which in total takes O(log n)
+        :param node: The root node of the subtree
+        :param height: Height of the subtree
+        :param key: The key to split by
+        :return: (root node of the left subtree, its height, the node with key or None,
+            root node of the right subtree, its height)
+        """
+        if node is None:
+            return None, 0, None, None, 0
+        left_node, right_node = node.left, node.right
+        left_height = height - 1 if node.balance <= 0 else height - 2
+        right_height = height - 1 if node.balance >= 0 else height - 2
+        if self.less_than_func(key, node.key):
+            split_left, split_left_height, found_node, split_right, split_right_height = \
+                self._split_nodes(left_node, left_height, key)
+            split_right, split_right_height = self._join_nodes(split_right, split_right_height,
+                                                               node, right_node, right_height)
+            return split_left, split_left_height, found_node, split_right, split_right_height
+        if self.less_than_func(node.key, key):
+            split_left, split_left_height, found_node, split_right, split_right_height = \
+                self._split_nodes(right_node, right_height, key)
+            split_left, split_left_height = self._join_nodes(left_node, left_height, node,
+                                                             split_left, split_left_height)
+            return split_left, split_left_height, found_node, split_right, split_right_height
+        node.left = node.right = None
+        node.balance = 0
+        if self.augmented:
+            self._update_fields(node)
+        return left_node, left_height, node, right_node, right_height
+
+    def _union_nodes(self, node1, height1, node2, height2):
+        """
+        Internal routine for the union of two subtrees. The second is split by the key of the root
+        of the first, and the unions of the halves are joined by that root, so of equal keys the
+        node of the first subtree is kept. Takes O(m log(n/m + 1)) for subtrees of m <= n nodes
+        :return: (root node of the union, its height)
+        """
+        if node1 is None:
+            return node2, height2
+        if node2 is None:
+            return node1, height1
+        left_node, right_node = node1.left, node1.right
+        left_height = height1 - 1 if node1.balance <= 0 else height1 - 2
+        right_height = height1 - 1 if node1.balance >= 0 else height1 - 2
+        split_left, split_left_height, _, split_right, split_right_height = \
+            self._split_nodes(node2, height2, node1.key)
+        left_node, left_height = self._union_nodes(left_node, left_height,
+                                                   split_left, split_left_height)
+        right_node, right_height = self._union_nodes(right_node, right_height,
+                                                     split_right, split_right_height)
+        return self._join_nodes(left_node, left_height, node1, right_node, right_height)
+
+    def _intersection_nodes(self, node1, height1, node2, height2):
+        """
+        Internal routine for the intersection of two subtrees, keeping the nodes of the first.
+        Cf. _union_nodes
+        :return: (root node of the intersection, its height)
+        """
+        if node1 is None or node2 is None:
+            return None, 0
+        left_node, right_node = node1.left, node1.right
+        left_height = height1 - 1 if node1.balance <= 0 else height1 - 2
+        right_height = height1 - 1 if node1.balance >= 0 else height1 - 2
+        split_left, split_left_height, found_node, split_right, split_right_height = \
+            self._split_nodes(node2, height2, node1.key)
+        left_node, left_height = self._intersection_nodes(left_node, left_height,
+                                                          split_left, split_left_height)
+        right_node, right_height = self._intersection_nodes(right_node, right_height,
+                                                            split_right, split_right_height)
+        if found_node is None:
+            return self._join_nodes_without_pivot(left_node, left_height, right_node, right_height)
+        return self._join_nodes(left_node, left_height, node1, right_node, right_height)
+
+    def _difference_nodes(self, node1, height1, node2, height2):
+        """
+        Internal routine for the nodes of the first subtree with keys not in the second.
+        The first is split by the key of the root of the second. Cf. _union_nodes
+        :return: (root node of the difference, its height)
+        """
+        if node1 is None or node2 is None:
+            return node1, height1
+        left_node, right_node = node2.left, node2.right
+        left_height = height2 - 1 if node2.balance <= 0 else height2 - 2
+        right_height = height2 - 1 if node2.balance >= 0 else height2 - 2
+        split_left, split_left_height, _, split_right, split_right_height = \
+            self._split_nodes(node1, height1, node2.key)
+        left_node, left_height = self._difference_nodes(split_left, split_left_height,
+                                                        left_node, left_height)
+        right_node, right_height = self._difference_nodes(split_right, split_right_height,
+                                                          right_node, right_height)
+        return self._join_nodes_without_pivot(left_node, left_height, right_node, right_height)
+
+    def _symmetric_difference_nodes(self, node1, height1, node2, height2):
+        """
+        Internal routine for the nodes with keys in exactly one of two subtrees.
+        Cf. _union_nodes
+        :return: (root node of the symmetric difference, its height)
+        """
+        if node1 is None:
+            return node2, height2
+        if node2 is None:
+            return node1, height1
+        left_node, right_node = node1.left, node1.right
+        left_height = height1 - 1 if node1.balance <= 0 else height1 - 2
+        right_height = height1 - 1 if node1.balance >= 0 else height1 - 2
+        split_left, split_left_height, found_node, split_right, split_right_height = \
+            self._split_nodes(node2, height2, node1.key)
+        left_node, left_height = self._symmetric_difference_nodes(
+            left_node, left_height, split_left, split_left_height)
+        right_node, right_height = self._symmetric_difference_nodes(
+            right_node, right_height, split_right, split_right_height)
+        if found_node is None:
+            return self._join_nodes(left_node, left_height, node1, right_node, right_height)
+        return self._join_nodes_without_pivot(left_node, left_height, right_node, right_height)
+
+    def _copy_nodes(self, node):
+        """
+        Internal routine for copying a subtree in to nodes of this tree's node class
+        :param node: The root node of the subtree
+        :return: The root node of the copy
+        """
+        if node is None:
+            return None
+        copy_node = self.node_class(node.value, node.key)
+        copy_node.balance = node.balance
+        if self.multiset:
+            copy_node.count = getattr(node, "count", 1)
+        copy_node.left = self._copy_nodes(node.left)
+        copy_node.right = self._copy_nodes(node.right)
+        if self.augmented:
+            self._update_fields(copy_node)
+        return copy_node
+
+    def _copy_live_nodes(self, tree):
+        """
+        Internal routine for copying the nodes of tree, but its tombstones, in to nodes of this
+        tree's node class, leaving tree unchanged. Without tombstones the shape is kept;
+        otherwise the copy is perfectly balanced, as if tree was compacted
+        :param tree: Tree ordered alike
+        :return: The root node of the copy
+        """
+        if not tree.tombstones:
+            return self._copy_nodes(tree.head)
+        nodes = list(tree._iter_nodes())
+        counts = [node.count for node in nodes] if self.multiset else None
+        head, _ = self._build_balanced([node.value for node in nodes],
+                                       [node.key for node in nodes], 0, len(nodes), counts)
+        return head
+
+    def _empty_like(self):
+        """
+        Internal routine for creating an empty tree of the same class and configuration
+        :return: The new tree
+        """
+        return type(self)(**self.configuration)
+
+    def _take_head(self, head, length=None):
+        """
+        Internal routine for letting the tree consist of the subtree of head
+        :param head: The new head node
+        :param length: Number of nodes in the subtree, if known
+        :return: None
+        """
+        self.head = head
+        if head is None:
+            length = 0
+        elif self.order_statistics:
+            length = head.size
+        self.length = length
+        self.snapshot = None
+        if self.cache is not None:
+            self.cache.clear()
+
+    def join(self, pivot, right_tree):
+        """
+        Public routine for joining two trees and a value in between them in O(log n), as
+        AVLTree.join(left_tree, pivot, right_tree). The nodes of both trees are moved to the new
+        tree, leaving both trees empty
+        :param pivot: A value greater than all values of this tree and less than all values of
+            right_tree
+        :param right_tree: Tree ordered alike
+        :return: The new tree
+        :raises ValueError: If the values are not in order
+        """
+        self.compact()
+        right_tree.compact()
+        key = pivot if self.key_func is None else self.key_func(pivot)
+        # The greatest node of this tree, and the least node of right_tree
+        left_node = self.head
+        while left_node is not None and left_node.right is not None:
+            left_node = left_node.right
+        right_node = right_tree.head
+        while right_node is not None and right_node.left is not None:
+            right_node = right_node.left
+        if left_node is not None and not self.less_than_func(left_node.key, key) or \
+                right_node is not None and not self.less_than_func(key, right_node.key):
+            raise ValueError(f"{pivot} is not between the values of the trees!")
+        length = None
+        if self.length is not None and right_tree.length is not None:
+            length = self.length + right_tree.length + 1
+        tree = self._empty_like()
+        head, _ = tree._join_nodes(self.head, self._height(self.head), tree.node_class(pivot, key),
+                                   right_tree.head, right_tree._height(right_tree.head))
+        tree._take_head(head, length)
+        self._take_head(None)
+        right_tree._take_head(None)
+        return tree
+
+    def split(self, value):
+        """
+        Public routine for splitting the tree in the values less than value and those greater
+        than value in O(log n). The nodes are moved to the new trees, leaving this tree empty
+        :param value: Value to split by, which needs not be in the tree
+        :return: (tree of the lesser values, the node holding value or None, tree of the
+            greater values)
+        """
+        self.compact()
+        key = value if self.key_func is None else self.key_func(value)
+        left_node, _, found_node, right_node, _ = self._split_nodes(self.head,
+                                                                    self._height(self.head), key)
+        left_tree = self._empty_like()
+        left_tree._take_head(left_node)
+        right_tree = self._empty_like()
+        right_tree._take_head(right_node)
+        self._take_head(None)
+        return left_tree, found_node, right_tree
+
+    def _set_operation(self, other, nodes_method_name):
+        """
+        Internal routine for a set operation on copies of the two trees
+        :param other: Tree ordered alike
+        :param nodes_method_name: Name of the routine combining the subtrees
+        :return: The new tree
+        """
+        tree = self._empty_like()
+        with _gc_paused():
+            node1 = tree._copy_live_nodes(self)
+            node2 = tree._copy_live_nodes(other)
+        nodes_method = getattr(tree, nodes_method_name)
+        head, _ = nodes_method(node1, tree._height(node1), node2, tree._height(node2))
+        tree._take_head(head)
+        return tree
+
+    def union(self, other):
+        """
+        Public routine for the union of this tree and other. Of equal values the one in this
+        tree is kept. The trees are copied, and the copies combined by splits and joins with
+        O(m log(n/m + 1)) comparisons for trees of m <= n values
+        :param other: Tree ordered alike
+        :return: New tree of the values in either tree
+        """
+        return self._set_operation(other, "_union_nodes")
+
+    def update(self, other):
+        """
+        Public routine for adding the values of other to this tree in place. Only other is
+        copied, so for a smaller other the work is proportional to its size. Cf. union
+        :param other: Tree ordered alike
+        :return: None
+        """
+        # The tombstones of this tree would be taken for values
+        self.compact()
+        with _gc_paused():
+            node2 = self._copy_live_nodes(other)
+        head, _ = self._union_nodes(self.head, self._height(self.head), node2, self._height(node2))
+        self._take_head(head)
+
+    def intersection(self, other):
+        """
+        Public routine for the intersection of this tree and other. Cf. union
+        :param other: Tree ordered alike
+        :return: New tree of the values of this tree, which are also in other
+        """
+        return self._set_operation(other, "_intersection_nodes")
+
+    def difference(self, other):
+        """
+        Public routine for the difference of this tree and other. Cf. union
+        :param other: Tree ordered alike
+        :return: New tree of the values of this tree, which are not in other
+        """
+        return self._set_operation(other, "_difference_nodes")
+
+    def symmetric_difference(self, other):
+        """
+        Public routine for the symmetric difference of this tree and other. Cf. union
+        :param other: Tree ordered alike
+        :return: New tree of the values in exactly one of the trees
+        """
+        return self._set_operation(other, "_symmetric_difference_nodes")
+
+    def iter_inorder(self):
+        """
+        Public routine for iterating over the values of the tree in increasing order. It uses an
+        explicit stack of at most the height of the tree, so values are yielded lazily in O(n)
+        total. The tree must not be modified while iterating
+        :return: Generator of the values
+        """
+        counted = self.counted
+        stack = []
+        node = self.head
+        while True:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                return
+            node = stack.pop()
+            if counted:
+                yield from itertools.repeat(node.value, node.count)
+            else:
+                yield node.value
+            node = node.right
+
+    def iter_reversed(self):
+        """
+        Public routine for iterating over the values of the tree in decreasing order.
+        Cf. iter_inorder
+        :return: Generator of the values
+        """
+        counted = self.counted
+        stack = []
+        node = self.head
+        while True:
+            while node is not None:
+                stack.append(node)
+                node = node.right
+            if not stack:
+                return
+            node = stack.pop()
+            if counted:
+                yield from itertools.repeat(node.value, node.count)
+            else:
+                yield node.value
+            node = node.left
+
+    def iter_preorder(self):
+        """
+        Public routine for iterating over the values of the tree in preorder. Cf. iter_inorder
+        :return: Generator of the values
+        """
+        counted = self.counted
+        stack = [self.head] if self.head is not None else []
+        while stack:
+            node = stack.pop()
+            if counted:
+                yield from itertools.repeat(node.value, node.count)
+            else:
+                yield node.value
+            if node.right is not None:
+                stack.append(node.right)
+            if node.left is not None:
+                stack.append(node.left)
+
+    def iter_postorder(self):
+        """
+        Public routine for iterating over the values of the tree in postorder. Cf. iter_inorder
+        :return: Generator of the values
+        """
+        counted = self.counted
+        stack = []
+        node = self.head
+        last_node = None
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                top_node = stack[-1]
+                if top_node.right is not None and top_node.right is not last_node:
+                    # Descend in to the right subtree, unless it has just been visited
+                    node = top_node.right
+                else:
+                    if counted:
+                        yield from itertools.repeat(top_node.value, top_node.count)
+                    else:
+                        yield top_node.value
+                    last_node = stack.pop()
+
+    def __iter__(self):
+        return self.iter_inorder()
+
+    def __reversed__(self):
+        return self.iter_reversed()
 
     def inorder(self):
-        def _inorder_rec(node):
-            if node:
-                return _inorder_rec(node.left) + [node.value] + _inorder_rec(node.right)
-            return []
-        return _inorder_rec(self.head)
+        return list(self.iter_inorder())
 
     def preorder(self):
-        def _preorder_rec(node):
-            if node:
-                return [node.value] + _preorder_rec(node.left) + _preorder_rec(node.right)
-            return []
-        return _preorder_rec(self.head)
+        return list(self.iter_preorder())
 
     def postorder(self):
-        def _postorder_rec(node):
-            if node:
-                return _postorder_rec(node.left) + _postorder_rec(node.right) + [node.value]
-            return []
-        return _postorder_rec(self.head)
+        return list(self.iter_postorder())
+
+
+def validate(tree):
+    """
+    Checks the invariants of tree in O(n), without recursion: the keys are strictly increasing
+    in order (and equal to the key function of their values), the balance factors are the
+    differences of the heights of the subtrees, and the subtree sizes, the aggregates, the
+    counts, the number of tombstones and the length agree with the nodes
+    :param tree: An AVLTree
+    :return: None
+    :raises ValueError: If an invariant is broken, naming the value of the node concerned
+    """
+    less_than_func = tree.less_than_func
+    key_func = tree.key_func
+    monoid = tree.monoid
+    counted = tree.counted
+    # The (height, total count, least node, greatest node) of the subtrees finished, but whose
+    # parents are not
+    results = []
+    tombstones = 0
+    stack = [(tree.head, False)] if tree.head is not None else []
+    while stack:
+        node, children_done = stack.pop()
+        if not children_done:
+            stack.append((node, True))
+            for child in (node.right, node.left):
+                if child is not None:
+                    stack.append((child, False))
+            continue
+        right = results.pop() if node.right is not None else (0, 0, node, node)
+        left = results.pop() if node.left is not None else (0, 0, node, node)
+        if key_func is not None and key_func(node.value) != node.key:
+            raise ValueError(f"Key of {node.value!r} differs from its key function!")
+        if node.left is not None and not less_than_func(left[3].key, node.key):
+            raise ValueError(f"Left subtree of {node.value!r} holds {left[3].value!r}!")
+        if node.right is not None and not less_than_func(node.key, right[2].key):
+            raise ValueError(f"Right subtree of {node.value!r} holds {right[2].value!r}!")
+        if node.balance != right[0] - left[0]:
+            raise ValueError(f"Balance of {node.value!r} is {node.balance}, but its subtrees "
+                             f"are {left[0]} and {right[0]} high!")
+        if node.balance not in (-1, 0, 1):
+            raise ValueError(f"{node.value!r} is out of balance!")
+        count = node.count if counted else 1
+        if count < (0 if tree.lazy_delete else 1):
+            raise ValueError(f"Count of {node.value!r} is {count}!")
+        if not count:
+            tombstones += 1
+        total = left[1] + count + right[1]
+        if tree.order_statistics and node.size != total:
+            raise ValueError(f"Size of {node.value!r} is {node.size}, but should be {total}!")
+        if monoid is not None:
+            aggregate = tree._measure(node)
+            if node.left is not None:
+                aggregate = monoid.combine(node.left.agg, aggregate)
+            if node.right is not None:
+                aggregate = monoid.combine(aggregate, node.right.agg)
+            if node.agg != aggregate:
+                raise ValueError(f"Aggregate of {node.value!r} is {node.agg!r}, but should be "
+                                 f"{aggregate!r}!")
+        results.append((max(left[0], right[0]) + 1, total, left[2], right[3]))
+    total = results[0][1] if results else 0
+    if tree.length is not None and tree.length != total:
+        raise ValueError(f"Length is {tree.length}, but the tree holds {total} values!")
+    if tombstones != tree.tombstones:
+        raise ValueError(f"{tree.tombstones} tombstones counted, but {tombstones} found!")
@@ -0,0 +1,52 @@
+"""
+Compares range sums by AVLTree.aggregate on a tree with the SUM monoid against summing the
+values yielded by range, for ranges of growing width, and the cost of keeping the aggregates
+on insertion.
+Usage: python bench/aggregate.py [number of values]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avltree import AVLTree  # noqa: E402
+from monoid import SUM  # noqa: E402
+
+
+def insert_all(values, **kwargs):
+    tree = AVLTree(**kwargs)
+    start = time.perf_counter()
+    for value in values:
+        tree.insert(value)
+    return tree, len(values) / (time.perf_counter() - start)
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+    rnd = random.Random(42)
+    values = rnd.sample(range(10 * size), size)
+    plain, plain_rate = insert_all(values)
+    tree, aggregate_rate = insert_all(values, monoid=SUM)
+    print(f"{size} values; insertions per second")
+    print(f"{'without monoid':<24}{plain_rate:>12.0f}")
+    print(f"{'with SUM':<24}{aggregate_rate:>12.0f}")
+    print("range sums per second")
+    print(f"{'width':>10}{'sum(range)':>14}{'aggregate':>14}")
+    for width in (10, 100, 1000, 10000):
+        lows = [rnd.randrange(10 * size) for _ in range(200)]
+        start = time.perf_counter()
+        for low in lows:
+            sum(plain.range(low, low + 10 * width))
+        scan_rate = len(lows) / (time.perf_counter() - start)
+        start = time.perf_counter()
+        for low in lows:
+            tree.aggregate(low, low + 10 * width)
+        aggregate_rate = len(lows) / (time.perf_counter() - start)
+        print(f"{width:>10}{scan_rate:>14.0f}{aggregate_rate:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
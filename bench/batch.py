@@ -0,0 +1,42 @@
+"""
+Compares insert_many and delete_many by a sorted merge and rebuild against value by value
+updates, for batches of growing size relative to the tree, to place BATCH_REBUILD_RATIO.
+Usage: python bench/batch.py [number of values in the tree]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import avltree  # noqa: E402
+from avltree import AVLTree  # noqa: E402
+
+# BATCH_REBUILD_RATIO forcing either strategy
+STRATEGIES = {"rebuild": float("inf"), "one by one": 0}
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+    rnd = random.Random(42)
+    values = rnd.sample(range(100 * size), size)
+    print(f"{size} values in the tree; seconds per batch")
+    print(f"{'batch':>10}{'strategy':>12}{'insert_many':>14}{'delete_many':>14}")
+    for fraction in (0.01, 0.05, 0.1, 0.25, 0.5, 1.0):
+        batch = rnd.sample(range(100 * size), int(size * fraction))
+        for name, ratio in STRATEGIES.items():
+            avltree.BATCH_REBUILD_RATIO = ratio
+            tree = AVLTree.from_iterable(values)
+            start = time.perf_counter()
+            tree.insert_many(batch)
+            insert_time = time.perf_counter() - start
+            start = time.perf_counter()
+            tree.delete_many(batch)
+            delete_time = time.perf_counter() - start
+            print(f"{len(batch):>10}{name:>12}{insert_time:>14.3f}{delete_time:>14.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Compares the ways of getting a tree at process start: re-inserting all values, building it by
+from_sorted, loading a file written by dump, and mapping that file with MappedAVLTree (which
+also reports the time of the first lookups, as the pages are read on demand).
+Usage: python bench/cold_start.py [number of values]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avltree import AVLTree  # noqa: E402
+from mapped_avltree import MappedAVLTree  # noqa: E402
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def reinsert(values):
+    tree = AVLTree()
+    for value in values:
+        tree.insert(value)
+    return tree
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    values = random.Random(42).sample(range(10 * size), size)
+    probes = random.Random(7).sample(values, 1000)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tree.avl")
+        tree, insert_time = timed(lambda: reinsert(values))
+        _, sorted_time = timed(lambda: AVLTree.from_sorted(sorted(values)))
+        _, dump_time = timed(lambda: tree.dump(path))
+        _, load_time = timed(lambda: AVLTree.load(path))
+        mapped, map_time = timed(lambda: MappedAVLTree(path))
+        _, probe_time = timed(lambda: [mapped.find(value) for value in probes])
+        mapped.close()
+        file_size = os.path.getsize(path)
+    print(f"{size} values; file of {file_size / size:.1f} bytes per value")
+    print(f"{'re-insert':<24}{insert_time:>10.3f}s")
+    print(f"{'sort + from_sorted':<24}{sorted_time:>10.3f}s")
+    print(f"{'dump':<24}{dump_time:>10.3f}s")
+    print(f"{'load':<24}{load_time:>10.3f}s")
+    print(f"{'map':<24}{map_time:>10.6f}s")
+    print(f"{'map: 1000 finds':<24}{probe_time:>10.6f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Counts the calls made to less_than_func while building a tree, comparing the stack based
+iterative insertion against the former iterative insertion, which re-walked the tree from
+the head (via _find_parent) for every level the height change was propagated upwards.
+Usage: python bench/comparator_calls.py [number of elements]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avltree import AVLTree  # noqa: E402
+from node import AVLNode  # noqa: E402
+
+
+class CountingLessThan:
+    """
+    Wraps a less_than_func and counts the number of times it is called
+    """
+    def __init__(self, less_than_func):
+        self.less_than_func = less_than_func
+        self.calls = 0
+
+    def __call__(self, x, y):
+        self.calls += 1
+        return self.less_than_func(x, y)
+
+
+class LegacyAVLTree(AVLTree):
+    """
+    AVLTree with the iterative insertion as it was before the descent path was recorded
+    """
+    def _find_parent(self, child_node):
+        if child_node == self.head:
+            return self.head
+        candidate = self.head
+        while True:
+            if child_node in {candidate.left, candidate.right}:
+                return candidate
+            if self.less_than_func(child_node.value, candidate.value):
+                candidate = candidate.left
+            elif self.less_than_func(candidate.value, child_node.value):
+                candidate = candidate.right
+
+    def _iterative_insert(self, parent_node, current_node, key, value):
+        place_found = False
+        while not place_found:
+            if self.less_than_func(value, current_node.value):
+                if current_node.left:
+                    parent_node = current_node
+                    current_node = current_node.left
+                else:
+                    current_node.left = AVLNode(value, value)
+                    self.inc = -1
+                    place_found = True
+            elif self.less_than_func(current_node.value, value):
+                if current_node.right:
+                    parent_node = current_node
+                    current_node = current_node.right
+                else:
+                    current_node.right = AVLNode(value, value)
+                    self.inc = 1
+                    place_found = True
+            else:
+                self.inc = 0
+                place_found = True
+        while self.inc != 0:
+            if current_node.balance == 0:
+                current_node.balance = self.inc
+                if current_node == parent_node.left:
+                    self.inc = -abs(self.inc)
+                else:
+                    self.inc = abs(self.inc)
+            elif current_node.balance == -self.inc:
+                current_node.balance = 0
+                self.inc = 0
+            elif current_node.balance == self.inc:
+                if (self.inc == -1 and current_node.left.balance == -current_node.balance) or \
+                        (self.inc == 1 and current_node.right.balance == -current_node.balance):
+                    self._doublerotation(parent_node, current_node)
+                else:
+                    self._singlerotation(parent_node, current_node)
+                self.inc = 0
+            if current_node == self.head:
+                break
+            current_node = parent_node
+            parent_node = self._find_parent(parent_node)
+
+
+def run(tree_class, values):
+    less_than_func = CountingLessThan(lambda x, y: x < y)
+    tree = tree_class(less_than_func)
+    start = time.perf_counter()
+    for value in values:
+        tree.insert(value)
+    elapsed = time.perf_counter() - start
+    return less_than_func.calls, elapsed
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    values = random.Random(42).sample(range(100 * size), size)
+    print(f"Inserting {size} random values")
+    print(f"{'implementation':<16}{'comparisons':>16}{'per insert':>12}{'seconds':>10}")
+    for name, tree_class in (("legacy", LegacyAVLTree), ("path stack", AVLTree)):
+        calls, elapsed = run(tree_class, values)
+        print(f"{name:<16}{calls:>16}{calls / size:>12.1f}{elapsed:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Stress test of ConcurrentAVLTree: reader threads look up random values while writer threads
+insert and delete their own values, for a fixed duration. Reports the operations per second of
+the readers and the writers, for the readers-writer lock and for snapshot reads, and checks
+the final tree against the values the writers left in it.
+Usage: python bench/concurrency.py [readers] [writers] [seconds] [initial size]
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from concurrent_avltree import ConcurrentAVLTree  # noqa: E402
+
+
+def reader(tree, universe, stop, counts, index):
+    rnd = random.Random(index)
+    operations = 0
+    while not stop.is_set():
+        for _ in range(100):
+            tree.find(rnd.randrange(universe))
+        operations += 100
+    counts[index] = operations
+
+
+def writer(tree, writers, universe, stop, counts, index, remaining):
+    # Each writer owns the values congruent to its index, so its bookkeeping is exact
+    rnd = random.Random(-index - 1)
+    own = set()
+    operations = 0
+    while not stop.is_set():
+        value = rnd.randrange(index, universe, writers)
+        if value in own:
+            tree.delete(value)
+            own.discard(value)
+        else:
+            tree.insert(value)
+            own.add(value)
+        operations += 1
+    counts[index] = operations
+    remaining.update(own)
+
+
+def run(snapshot_reads, readers, writers, seconds, size):
+    universe = 4 * size
+    tree = ConcurrentAVLTree(snapshot_reads=snapshot_reads)
+    initial = range(universe + 1, universe + 1 + size)  # read-only background values
+    for value in initial:
+        tree.insert(value)
+    stop = threading.Event()
+    reads = [0] * readers
+    writes = [0] * writers
+    remaining = set()
+    threads = [threading.Thread(target=reader, args=(tree, universe, stop, reads, i))
+               for i in range(readers)]
+    threads += [threading.Thread(target=writer,
+                                 args=(tree, writers, universe, stop, writes, i, remaining))
+                for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    consistent = tree.inorder() == sorted(remaining) + list(initial)
+    return sum(reads) / seconds, sum(writes) / seconds, consistent
+
+
+def main():
+    readers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 2.0
+    size = int(sys.argv[4]) if len(sys.argv) > 4 else 10 ** 4
+    print(f"{readers} readers, {writers} writers, {seconds}s, {size} values; "
+          f"operations per second")
+    print(f"{'mode':<16}{'reads':>12}{'writes':>12}{'consistent':>12}")
+    for name, snapshot_reads in (("rw lock", False), ("snapshot reads", True)):
+        read_rate, write_rate, consistent = run(snapshot_reads, readers, writers, seconds, size)
+        print(f"{name:<16}{read_rate:>12.0f}{write_rate:>12.0f}{str(consistent):>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Compares the throughput of inserting and deleting values in a DurableAVLTree under each sync
+policy, against a plain AVLTree. Half the operations are deletions of values inserted before.
+Usage: python bench/durability.py [number of operations] [directory]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avltree import AVLTree  # noqa: E402
+from durable_avltree import DurableAVLTree  # noqa: E402
+
+POLICIES = ("always", 1, 10, 100, "none")
+
+
+def operations(size, seed=42):
+    rnd = random.Random(seed)
+    values = rnd.sample(range(10 * size), size // 2)
+    deletions = rnd.sample(values, len(values))
+    return values, deletions
+
+
+def run(tree, values, deletions):
+    start = time.perf_counter()
+    for value in values:
+        tree.insert(value)
+    for value in deletions:
+        tree.delete(value)
+    if isinstance(tree, DurableAVLTree):
+        tree.close()
+    return time.perf_counter() - start
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2 * 10 ** 4
+    parent = sys.argv[2] if len(sys.argv) > 2 else None
+    values, deletions = operations(size)
+    print(f"{len(values) + len(deletions)} operations")
+    print(f"{'sync':<12}{'ops/s':>12}")
+    seconds = run(AVLTree(), values, deletions)
+    print(f"{'in memory':<12}{(len(values) + len(deletions)) / seconds:>12.0f}")
+    for policy in POLICIES:
+        with tempfile.TemporaryDirectory(dir=parent) as directory:
+            seconds = run(DurableAVLTree(directory, sync=policy), values, deletions)
+        name = f"{policy} ms" if isinstance(policy, int) else policy
+        print(f"{name:<12}{(len(values) + len(deletions)) / seconds:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares the throughput of inserting and finding dict records (as in test_insert_dict_values)
+ordered by a composite less_than_func against key mode with native comparison of tuple keys,
+and key mode with a three-way cmp function.
+Usage: python bench/key_mode.py [number of records]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avltree import AVLTree  # noqa: E402
+
+
+def date_less_than_func(d1, d2):
+    return d1["year"] < d2["year"] or \
+        (d1["year"] == d2["year"] and d1["month"] < d2["month"]) or \
+        (d1["year"] == d2["year"] and d1["month"] == d2["month"] and d1["day"] < d2["day"]) or \
+        (d1["year"] == d2["year"] and d1["month"] == d2["month"] and d1["day"] == d2["day"] and
+         d1["pid"] < d2["pid"])
+
+
+def date_key(d):
+    return d["year"], d["month"], d["day"], d["pid"]
+
+
+def tuple_cmp(x, y):
+    return (x > y) - (x < y)
+
+
+MODES = {
+    "less_than_func": lambda iterative: AVLTree(date_less_than_func, iterative=iterative),
+    "key": lambda iterative: AVLTree(key=date_key, iterative=iterative),
+    "key + cmp": lambda iterative: AVLTree(key=date_key, cmp=tuple_cmp, iterative=iterative),
+}
+
+
+def records(size, seed=42):
+    rnd = random.Random(seed)
+    return [{"Name": f"Person {i}", "year": rnd.randint(1900, 2020), "month": rnd.randint(1, 12),
+             "day": rnd.randint(1, 28), "pid": rnd.randint(1, 10 ** 6)} for i in range(size)]
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+    values = records(size)
+    print(f"{size} records; operations per second")
+    print(f"{'mode':<16}{'iterative':>10}{'insert':>12}{'find':>12}")
+    for iterative in (True, False):
+        for name, factory in MODES.items():
+            tree = factory(iterative)
+            start = time.perf_counter()
+            for value in values:
+                tree.insert(value)
+            insert_rate = size / (time.perf_counter() - start)
+            start = time.perf_counter()
+            for value in values:
+                tree.find(value)
+            find_rate = size / (time.perf_counter() - start)
+            print(f"{name:<16}{str(iterative):>10}{insert_rate:>12.0f}{find_rate:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Compares deleting a growing fraction of the values of a tree eagerly against lazy deletion
+with tombstones, compacted once at the end (on demand) or whenever the tombstones exceed the
+default threshold (automatic). Both trees keep subtree sizes, as lazy deletion implies them.
+The times include the compactions; the batch, where the lazy variants catch up with eager
+deletion, is the break-even point.
+Usage: python bench/lazy_delete.py [number of values]
+"""
+
+import gc
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avltree import AVLTree  # noqa: E402
+
+VARIANTS = {
+    "eager": dict(order_statistics=True),
+    "lazy, on demand": dict(lazy_delete=True, compaction_threshold=None),
+    "lazy, automatic": dict(lazy_delete=True),
+}
+
+
+def delete_all(values, batch, kwargs):
+    tree = AVLTree.from_iterable(values, **kwargs)
+    gc.collect()
+    start = time.perf_counter()
+    for value in batch:
+        tree.delete(value)
+    tree.compact()
+    return time.perf_counter() - start
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+    rnd = random.Random(42)
+    values = rnd.sample(range(10 * size), size)
+    print(f"{size} values; seconds to delete a batch, including compaction")
+    print(f"{'batch':>10}" + "".join(f"{name:>18}" for name in VARIANTS))
+    for fraction in (0.01, 0.1, 0.25, 0.5, 0.6, 0.75, 0.9):
+        batch = rnd.sample(values, int(size * fraction))
+        times = [delete_all(values, batch, kwargs) for kwargs in VARIANTS.values()]
+        print(f"{len(batch):>10}" + "".join(f"{seconds:>18.3f}" for seconds in times))
+
+
+if __name__ == '__main__':
+    main()
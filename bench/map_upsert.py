@@ -0,0 +1,47 @@
+"""
+Compares updating payloads with AVLMap (one descent, in place) against the former workaround:
+(key, payload) values in an AVLTree ordered on the key, updated by find, delete and insert.
+Usage: python bench/map_upsert.py [number of keys]
+"""
+
+import operator
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avlmap import AVLMap  # noqa: E402
+from avltree import AVLTree  # noqa: E402
+
+
+def tree_upsert(tree, key, payload):
+    found, node = tree.find((key, None))
+    if found:
+        tree.delete(node.value)
+    tree.insert((key, payload))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+    rnd = random.Random(42)
+    keys = rnd.sample(range(10 * size), size)
+    updates = [rnd.choice(keys) for _ in range(size)]
+    tree = AVLTree.from_iterable(((key, 0) for key in keys), key=operator.itemgetter(0))
+    avl_map = AVLMap.from_iterable((key, 0) for key in keys)
+    start = time.perf_counter()
+    for i, key in enumerate(updates):
+        tree_upsert(tree, key, i)
+    tree_rate = size / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for i, key in enumerate(updates):
+        avl_map[key] = i
+    map_rate = size / (time.perf_counter() - start)
+    print(f"{size} keys; updates per second")
+    print(f"{'find + delete + insert':<24}{tree_rate:>12.0f}")
+    print(f"{'AVLMap upsert':<24}{map_rate:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
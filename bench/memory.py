@@ -0,0 +1,67 @@
+"""
+Compares the memory used by the nodes of a tree of integers in three layouts, measured with
+tracemalloc: nodes with a per-instance __dict__ (as AVLNode was before __slots__), AVLNode
+with __slots__ and the parallel arrays of ArenaAVLTree.
+Usage: python bench/memory.py [number of elements]
+"""
+
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from arena import ArenaAVLTree  # noqa: E402
+from avltree import AVLTree  # noqa: E402
+
+
+class DictAVLNode:
+    """
+    A node with the attributes of AVLNode kept in a per-instance __dict__
+    """
+    def __init__(self, value, key):
+        self.value = value
+        self.key = key
+        self.left = None
+        self.right = None
+        self.balance = 0
+
+
+def dict_node_tree():
+    tree = AVLTree()
+    tree.node_class = DictAVLNode
+    return tree
+
+
+LAYOUTS = {
+    "__dict__ nodes": dict_node_tree,
+    "__slots__ nodes": AVLTree,
+    "arena": ArenaAVLTree,
+}
+
+
+def measure(factory, values):
+    tracemalloc.start()
+    tree = factory()
+    for value in values:
+        tree.insert(value)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tree, current, peak
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    # The values are allocated before tracing starts, so only the tree structure is measured
+    values = random.Random(42).sample(range(100 * size), size)
+    print(f"{size} integers")
+    print(f"{'layout':<18}{'current MiB':>14}{'peak MiB':>12}{'bytes/node':>12}")
+    for name, factory in LAYOUTS.items():
+        tree, current, peak = measure(factory, values)
+        del tree
+        print(f"{name:<18}{current / 2 ** 20:>14.1f}{peak / 2 ** 20:>12.1f}{current / size:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares the cost of keeping a snapshot after every update: a new version of a
+PersistentAVLTree, against a deep copy of an AVLTree and a copy of its values by inorder().
+Reports the memory retained per snapshot (by tracemalloc) and the time per update and snapshot.
+Usage: python bench/persistent.py [number of values] [number of updates]
+"""
+
+import copy
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avltree import AVLTree  # noqa: E402
+from persistent_avltree import PersistentAVLTree  # noqa: E402
+
+
+def persistent_versions(tree, updates):
+    versions = []
+    for value, insert in updates:
+        tree = tree.insert(value) if insert else tree.delete(value)
+        versions.append(tree)
+    return versions
+
+
+def copied_snapshots(snapshot):
+    def run(tree, updates):
+        snapshots = []
+        for value, insert in updates:
+            if insert:
+                tree.insert(value)
+            else:
+                tree.delete(value)
+            snapshots.append(snapshot(tree))
+        return snapshots
+    return run
+
+
+STRATEGIES = {
+    "persistent": (PersistentAVLTree, persistent_versions),
+    "deepcopy": (AVLTree, copied_snapshots(copy.deepcopy)),
+    "inorder list": (AVLTree, copied_snapshots(AVLTree.inorder)),
+}
+
+
+def workload(size, count, seed=42):
+    rnd = random.Random(seed)
+    values = rnd.sample(range(10 * size), size)
+    present = set(values)
+    updates = []
+    for _ in range(count):
+        if rnd.random() < 0.5:
+            value = rnd.choice(values)
+            updates.append((value, value not in present))
+            present.symmetric_difference_update((value,))
+        else:
+            value = rnd.randrange(10 * size, 20 * size)
+            updates.append((value, value not in present))
+            present.symmetric_difference_update((value,))
+    return values, updates
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    values, updates = workload(size, count)
+    print(f"{size} values, {count} updates, a snapshot after each")
+    print(f"{'strategy':<14}{'bytes/snapshot':>16}{'us/update':>12}")
+    for name, (tree_class, run) in STRATEGIES.items():
+        tree = tree_class.from_sorted(sorted(values))
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        snapshots = run(tree, updates)
+        elapsed = time.perf_counter() - start
+        retained = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        print(f"{name:<14}{retained / len(snapshots):>16.0f}{elapsed / count * 1e6:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Compares building a tree of random integers by inserting them one by one, by from_iterable, and
+by ShardedAVLTree.build with worker processes followed by concatenate.
+Usage: python bench/sharded.py [number of values] [number of workers]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avltree import AVLTree  # noqa: E402
+from sharded_avltree import ShardedAVLTree  # noqa: E402
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def insert_all(values):
+    tree = AVLTree()
+    for value in values:
+        tree.insert(value)
+    return tree
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    values = [random.randrange(10 * size) for _ in range(size)]
+    print(f"{size} values, {workers} workers; seconds")
+    _, insert_time = timed(lambda: insert_all(values))
+    print(f"{'insert':<24}{insert_time:>10.3f}")
+    _, iterable_time = timed(lambda: AVLTree.from_iterable(values))
+    print(f"{'from_iterable':<24}{iterable_time:>10.3f}")
+    sharded, build_time = timed(lambda: ShardedAVLTree.build(values, shards=workers,
+                                                             max_workers=workers))
+    print(f"{'sharded build':<24}{build_time:>10.3f}")
+    _, concatenate_time = timed(sharded.concatenate)
+    print(f"{'concatenate':<24}{concatenate_time:>10.6f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Benchmark suite for the AVLTree operations: insert, delete, find and the traversals, for the
+iterative and the recursive methods, over sorted, reverse sorted, random and Zipf skewed
+workloads. For each case it reports operations per second, calls of less_than_func, single and
+double rotations, and optionally the peak memory, and it can write the results as JSON, so
+results of two commits can be compared with --baseline.
+Usage: python bench/suite.py [--sizes 1000 10000 ...] [--output results.json] [--memory]
+       [--baseline old_results.json]
+It can also be run by pytest-benchmark: pytest bench/test_bench.py
+"""
+
+import argparse
+import bisect
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avltree import AVLTree  # noqa: E402
+
+OPERATIONS = ("insert", "delete", "find", "inorder", "preorder", "postorder")
+WORKLOADS = ("sorted", "reversed", "random", "zipf")
+METHODS = {"iterative": True, "recursive": False}
+DEFAULT_SIZES = (10 ** 3, 10 ** 4, 10 ** 5)
+SEED = 42
+
+
+class CountingLessThan:
+    """
+    Wraps a less_than_func and counts the number of times it is called
+    """
+    def __init__(self, less_than_func):
+        self.less_than_func = less_than_func
+        self.calls = 0
+
+    def __call__(self, x, y):
+        self.calls += 1
+        return self.less_than_func(x, y)
+
+
+class RotationCounter:
+    """
+    Counts the rotations of a tree by wrapping its rotation methods on the instance
+    """
+    def __init__(self, tree):
+        self.single = 0
+        self.double = 0
+        singlerotation = tree._singlerotation
+        doublerotation = tree._doublerotation
+
+        def counting_singlerotation(*args, **kwargs):
+            self.single += 1
+            return singlerotation(*args, **kwargs)
+
+        def counting_doublerotation(*args, **kwargs):
+            self.double += 1
+            return doublerotation(*args, **kwargs)
+
+        tree._singlerotation = counting_singlerotation
+        tree._doublerotation = counting_doublerotation
+
+
+def zipf_values(size, exponent=1.1, seed=SEED):
+    """
+    Draws size values from range(size), the value of rank r being drawn with probability
+    proportional to 1 / r ** exponent. The ranks are mapped to values in random order, so the
+    frequent values are spread over the tree
+    """
+    rnd = random.Random(seed)
+    cumulative_weights = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, size + 1)))
+    total = cumulative_weights[-1]
+    values = list(range(size))
+    rnd.shuffle(values)
+    return [values[bisect.bisect(cumulative_weights, rnd.random() * total)] for _ in range(size)]
+
+
+def workload_values(workload, size):
+    """
+    :return: The values of the workload in the order they are inserted (and deleted and found)
+    """
+    if workload == "sorted":
+        return list(range(size))
+    if workload == "reversed":
+        return list(range(size - 1, -1, -1))
+    if workload == "random":
+        return random.Random(SEED).sample(range(size), size)
+    if workload == "zipf":
+        return zipf_values(size)
+    raise ValueError(f"Unknown workload {workload}!")
+
+
+def build_tree(iterative, values):
+    less_than_func = CountingLessThan(lambda x, y: x < y)
+    tree = AVLTree(less_than_func, iterative=iterative)
+    rotations = RotationCounter(tree)
+    for value in values:
+        tree.insert(value)
+    return tree, less_than_func, rotations
+
+
+def prepare(operation, iterative, values):
+    """
+    Sets up a case
+    :return: (function running the operation once, its number of operations, the tree,
+        less_than_func counter, rotation counter)
+    """
+    if operation == "insert":
+        less_than_func = CountingLessThan(lambda x, y: x < y)
+        tree = AVLTree(less_than_func, iterative=iterative)
+        rotations = RotationCounter(tree)
+
+        def run():
+            for value in values:
+                tree.insert(value)
+        return run, len(values), tree, less_than_func, rotations
+    tree, less_than_func, rotations = build_tree(iterative, values)
+    if operation == "delete":
+        distinct_values = list(dict.fromkeys(values))
+
+        def run():
+            for value in distinct_values:
+                tree.delete(value)
+        count = len(distinct_values)
+    elif operation == "find":
+        def run():
+            for value in values:
+                tree.find(value)
+        count = len(values)
+    else:
+        iterator = getattr(tree, "iter_" + operation)
+
+        def run():
+            for _ in iterator():
+                pass
+        count = len(tree)
+    less_than_func.calls = 0
+    rotations.single = rotations.double = 0
+    return run, count, tree, less_than_func, rotations
+
+
+def run_case(operation, method, workload, size, memory=False):
+    values = workload_values(workload, size)
+    iterative = METHODS[method]
+    run, count, tree, less_than_func, rotations = prepare(operation, iterative, values)
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    result = {
+        "operation": operation, "method": method, "workload": workload, "size": size,
+        "operations": count, "seconds": seconds, "ops_per_second": count / seconds if seconds else None,
+        "comparisons": less_than_func.calls, "single_rotations": rotations.single,
+        "double_rotations": rotations.double,
+    }
+    if memory:
+        # A separate run, as tracing slows down the operations considerably
+        run, *_ = prepare(operation, iterative, values)
+        tracemalloc.start()
+        run()
+        result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_id(result):
+    return result["operation"], result["method"], result["workload"], result["size"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--operations", nargs="+", choices=OPERATIONS, default=OPERATIONS)
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=WORKLOADS)
+    parser.add_argument("--methods", nargs="+", choices=list(METHODS), default=list(METHODS))
+    parser.add_argument("--memory", action="store_true", help="also measure the peak memory")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare the operations per second with")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = {case_id(result): result for result in json.load(baseline_file)["results"]}
+    results = []
+    print(f"{'operation':<10}{'method':<10}{'workload':<10}{'size':>9}{'ops/s':>12}{'comparisons':>13}"
+          f"{'single':>9}{'double':>9}{'peak MiB':>10}{'vs base':>9}")
+    for size, workload, method, operation in itertools.product(args.sizes, args.workloads, args.methods,
+                                                               args.operations):
+        result = run_case(operation, method, workload, size, args.memory)
+        results.append(result)
+        peak = f"{result['peak_memory'] / 2 ** 20:.1f}" if "peak_memory" in result else "-"
+        base = baseline.get(case_id(result))
+        ratio = f"{result['ops_per_second'] / base['ops_per_second']:.2f}" \
+            if base and base["ops_per_second"] and result["ops_per_second"] else "-"
+        print(f"{operation:<10}{method:<10}{workload:<10}{size:>9}{result['ops_per_second'] or 0:>12.0f}"
+              f"{result['comparisons']:>13}{result['single_rotations']:>9}{result['double_rotations']:>9}"
+              f"{peak:>10}{ratio:>9}")
+    if args.output:
+        document = {
+            "meta": {
+                "commit": git_commit(),
+                "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "seed": SEED,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as output_file:
+            json.dump(document, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
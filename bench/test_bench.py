@@ -0,0 +1,35 @@
+"""
+The benchmark suite run by pytest-benchmark, at sizes small enough for a regular test run:
+pytest bench/test_bench.py --benchmark-json=results.json
+"""
+
+import itertools
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from suite import METHODS, OPERATIONS, WORKLOADS, prepare, workload_values  # noqa: E402
+
+SIZES = (10 ** 3, 10 ** 4)
+
+
+@pytest.mark.parametrize("size,workload,method,operation",
+                         list(itertools.product(SIZES, WORKLOADS, METHODS, OPERATIONS)))
+def test_operation(benchmark, size, workload, method, operation):
+    values = workload_values(workload, size)
+
+    def setup():
+        run, *_ = prepare(operation, METHODS[method], values)
+        return (run,), {}
+
+    def run_once(run):
+        run()
+
+    benchmark.pedantic(run_once, setup=setup, rounds=5)
+    _, count, *_ = prepare(operation, METHODS[method], values)
+    benchmark.extra_info["operations"] = count
@@ -0,0 +1,52 @@
+"""
+Compares find on a tree without a cache, with an LRU cache and with a TinyLFU cache, for keys
+drawn from a Zipf distribution, ordered by a Python comparator. Every tenth lookup is of a key
+taken in order from a scan over all keys, which LRU lets flush hot keys and TinyLFU does not.
+Usage: python bench/zipf_cache.py [number of keys] [cache size] [Zipf exponent]
+"""
+
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avltree import AVLTree  # noqa: E402
+
+
+def less_than(x, y):
+    return x < y
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+    cache_size = int(sys.argv[2]) if len(sys.argv) > 2 else size // 100
+    exponent = float(sys.argv[3]) if len(sys.argv) > 3 else 1.1
+    rnd = random.Random(42)
+    keys = rnd.sample(range(10 * size), size)
+    weights = [1 / rank ** exponent for rank in range(1, size + 1)]
+    lookups = rnd.choices(keys, weights, k=2 * size)
+    scan = itertools.cycle(sorted(keys))
+    for i in range(0, len(lookups), 10):
+        lookups[i] = next(scan)
+    print(f"{size} keys, Zipf exponent {exponent}, cache of {cache_size}; best of three runs")
+    print(f"{'cache':<10}{'lookups/s':>12}{'hit ratio':>12}")
+    for policy in (None, "lru", "tinylfu"):
+        tree = AVLTree.from_iterable(keys, less_than_func=less_than, cache=policy,
+                                     cache_size=cache_size)
+        find = tree.find
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            for key in lookups:
+                find(key)
+            best = min(best, time.perf_counter() - start)
+        rate = len(lookups) / best
+        hit_ratio = tree.cache_info()["hit_ratio"] if policy is not None else 0.0
+        print(f"{str(policy):<10}{rate:>12.0f}{hit_ratio:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
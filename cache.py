@@ -0,0 +1,236 @@
+"""
+This module implements the optional lookup cache of an AVLTree: a bounded map from the keys
+found recently to the nodes holding them, so a lookup of a hot key skips the descent through the
+tree. As with the instrumentation in stats.py, the cached tree has a wrapping find method bound
+on the instance, so a tree without a cache runs the plain methods without any overhead.
+The nodes are cached under their own keys. The tree keeps the cache consistent: a deletion
+discards the key of the node deleted, and the key of the in-order predecessor, whose value moves
+to another node; a rebuild clears the cache.
+Two eviction policies are offered:
+- "lru" evicts the least recently used key
+- "tinylfu" admits a new key only if it has been looked up more often than the key, which
+it would evict, according to a compact frequency sketch. A scan of cold keys then cannot
+flush the hot ones
+"""
+
+from collections import OrderedDict
+
+# The frequency sketch of TinyLFUCache has four counters per key
+# A counter of the frequency sketch saturates at this value
+MAX_FREQUENCY = 15
+# The frequencies are halved after this many lookups per key of capacity, so they follow changes
+# in the popularity of the keys
+SAMPLE_FACTOR = 10
+
+
+class LRUCache:
+    """
+    The LRUCache class maps keys to nodes, evicting the least recently used key when full
+    """
+    policy = "lru"
+
+    def __init__(self, capacity):
+        """
+        - entries maps the keys to the nodes, the least recently used first
+        - hits, misses and evictions count the lookups and the keys evicted
+        :param capacity: The maximum number of keys cached
+        :raises ValueError: If capacity is not positive
+        """
+        if capacity < 1:
+            raise ValueError(f"The capacity of a cache must be positive, not {capacity}")
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Public routine for looking up key
+        :param key: The key, which must be hashable
+        :return: The node holding key; None if key is not cached
+        """
+        node = self.entries.get(key)
+        if node is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return node
+
+    def put(self, key, node):
+        """
+        Public routine for caching the node found for key, after a miss
+        :param key: The key
+        :param node: The node holding key
+        :return: None
+        """
+        entries = self.entries
+        entries[key] = node
+        if len(entries) > self.capacity:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, key):
+        """
+        Public routine for removing key from the cache, if cached
+        :param key: The key
+        :return: None
+        """
+        self.entries.pop(key, None)
+
+    def clear(self):
+        """
+        Public routine for removing all keys. The counters are kept
+        :return: None
+        """
+        self.entries.clear()
+
+    def info(self):
+        """
+        Public routine for collecting the counters
+        :return: dict of the counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            "policy": self.policy,
+            "capacity": self.capacity,
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class TinyLFUCache(LRUCache):
+    """
+    The TinyLFUCache class is an LRUCache, which admits a new key when full only if the key has
+    been looked up more often than the least recently used key. The frequencies are estimated
+    by a count-min sketch: four small counters per key, of which the least is taken
+    """
+    policy = "tinylfu"
+
+    def __init__(self, capacity):
+        """
+        - sketch holds the counters, a power of two of them, at least four per key of capacity
+        - lookups counts the lookups since the frequencies were last halved
+        - rejections counts the keys not admitted
+        - missed_key and missed_frequency are the key of the last miss and its frequency
+        :param capacity: The maximum number of keys cached
+        :raises ValueError: If capacity is not positive
+        """
+        super().__init__(capacity)
+        bits = max(4 * capacity - 1, 1).bit_length()
+        self.mask = (1 << bits) - 1
+        # The four slices of a 64 bit hash overlap, if the sketch is larger than 2 ** 16
+        self.shift = min(bits, (64 - bits) // 3)
+        self.sketch = [0] * (1 << bits)
+        self.sample_size = SAMPLE_FACTOR * capacity
+        self.lookups = 0
+        self.rejections = 0
+        self.missed_key = None
+        self.missed_frequency = 0
+
+    def _slots(self, key):
+        """
+        Internal routine for the positions of the counters of key in the sketch: four slices of
+        the bits of a well mixed hash of key. The hash of an int is the int itself, while that
+        of a tuple mixes the hashes of its items
+        :return: Tuple of the four positions
+        """
+        mixed_hash = hash((key,))
+        mask = self.mask
+        shift = self.shift
+        return (mixed_hash & mask, (mixed_hash >> shift) & mask,
+                (mixed_hash >> 2 * shift) & mask, (mixed_hash >> 3 * shift) & mask)
+
+    def _frequency(self, key):
+        """
+        Internal routine for estimating the number of recent lookups of key
+        :return: The least of the counters of key
+        """
+        sketch = self.sketch
+        first, second, third, fourth = self._slots(key)
+        return min(sketch[first], sketch[second], sketch[third], sketch[fourth])
+
+    def get(self, key):
+        # Every lookup is counted, so the keys cached keep their frequencies as the counters age
+        sketch = self.sketch
+        frequency = MAX_FREQUENCY
+        for slot in self._slots(key):
+            counter = sketch[slot]
+            if counter < MAX_FREQUENCY:
+                counter = sketch[slot] = counter + 1
+            if counter < frequency:
+                frequency = counter
+        self.lookups += 1
+        if self.lookups >= self.sample_size:
+            self.sketch = [counter >> 1 for counter in sketch]
+            self.lookups = 0
+        node = self.entries.get(key)
+        if node is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return node
+        self.misses += 1
+        # Kept for put, which follows the miss
+        self.missed_key = key
+        self.missed_frequency = frequency
+        return None
+
+    def put(self, key, node):
+        entries = self.entries
+        if len(entries) >= self.capacity and key not in entries:
+            victim = next(iter(entries))
+            if key is self.missed_key:
+                frequency = self.missed_frequency
+            else:
+                frequency = self._frequency(key)
+            if frequency <= self._frequency(victim):
+                self.rejections += 1
+                return
+            del entries[victim]
+            self.evictions += 1
+        entries[key] = node
+
+    def info(self):
+        info = super().info()
+        info["rejections"] = self.rejections
+        return info
+
+
+POLICIES = {"lru": LRUCache, "tinylfu": TinyLFUCache}
+
+
+def attach_cache(tree, policy, capacity):
+    """
+    Creates a cache and binds a find method on tree, which looks the key up in the cache before
+    descending, and caches the node found on a miss. Keys not in the tree are not cached, so an
+    insertion needs not invalidate anything
+    :param tree: The AVLTree
+    :param policy: "lru" or "tinylfu"
+    :param capacity: The maximum number of keys cached
+    :return: The cache
+    :raises ValueError: If policy is unknown
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"cache must be one of {', '.join(map(repr, POLICIES))}, not {policy!r}")
+    cache = POLICIES[policy](capacity)
+    find_method = tree.find_method
+    get = cache.get
+    put = cache.put
+
+    def cached_find(current_node, key):
+        node = get(key)
+        if node is not None:
+            return True, node
+        found, node = find_method(current_node, key)
+        if found:
+            # Under the key of the node, which the deletions discard: key may be equal to it by
+            # the ordering of the tree, but not by == and hash
+            put(node.key, node)
+        return found, node
+
+    tree.find_method = cached_find
+    return cache
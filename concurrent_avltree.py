@@ -0,0 +1,240 @@
+"""
+This module makes the AVL tree of avltree.py safe to share between threads. Two modes are
+offered:
+- a readers-writer lock: any number of readers, or a single writer, at a time
+- snapshot reads (read-copy-update): writers create a new version of the tree by path copying
+and publish it with a single assignment, while readers work on the version current when they
+started, without taking any lock
+"""
+
+import contextlib
+import threading
+
+from avltree import AVLTree
+
+
+class ReadWriteLock:
+    """
+    A readers-writer lock built on threading.Condition. Waiting writers take precedence over
+    new readers, so a steady stream of readers cannot starve the writers. The lock is not
+    reentrant
+    """
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writing = False
+        self.waiting_writers = 0
+
+    def acquire_read(self):
+        with self.condition:
+            while self.writing or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writing or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writing = True
+
+    def release_write(self):
+        with self.condition:
+            self.writing = False
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def read_locked(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write_locked(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class ConcurrentAVLTree:
+    """
+    The ConcurrentAVLTree class wraps an AVLTree for use by several threads. Values are
+    returned rather than nodes, as a node may be changed by a later deletion.
+    With snapshot_reads, iterators and range queries are lazy and see the version of the tree
+    current when they were created; otherwise they are materialised under the read lock
+    """
+    def __init__(self, *args, snapshot_reads=False, **kwargs):
+        """
+        - tree is the wrapped tree. With snapshot_reads, it is replaced by a new version on each
+        modification, and its nodes are never modified once published
+        - lock guards tree against concurrent modification; None with snapshot_reads
+        - write_lock serialises the writers with snapshot_reads; None otherwise
+        :param args: Positional parameters of AVLTree
+        :param snapshot_reads: If True, readers take no lock, cf. the module documentation
+        :param kwargs: Keyword parameters of AVLTree, but cache: a lookup updates the cache, so
+            concurrent readers would modify it
+        :raises ValueError: If a cache is given
+        """
+        if kwargs.get("cache") is not None:
+            raise ValueError("ConcurrentAVLTree does not support a lookup cache")
+        self.tree = AVLTree(*args, **kwargs)
+        self.snapshot_reads = snapshot_reads
+        if snapshot_reads:
+            self.lock = None
+            self.write_lock = threading.Lock()
+        else:
+            self.lock = ReadWriteLock()
+            self.write_lock = None
+
+    def snapshot(self):
+        """
+        Public routine for getting the current version of the tree. With snapshot_reads, the
+        version is never modified and can be read at leisure; it must not be modified either
+        :return: AVLTree
+        :raises ValueError: If the tree is not in snapshot_reads mode
+        """
+        if not self.snapshot_reads:
+            raise ValueError("snapshot requires a tree with snapshot_reads=True")
+        return self.tree
+
+    def _read(self, method_name, *args, materialise=False):
+        """
+        Internal routine for calling a read-only method of the current tree
+        :param method_name: The name of the AVLTree method
+        :param args: The parameters of the method
+        :param materialise: If True, the result is an iterator to be collected in a list, unless
+            it is read from a snapshot
+        :return: The result of the method
+        """
+        if self.lock is None:
+            return getattr(self.tree, method_name)(*args)
+        with self.lock.read_locked():
+            result = getattr(self.tree, method_name)(*args)
+            return list(result) if materialise else result
+
+    def insert(self, value):
+        """
+        Public routine for inserting value in to the tree, cf. AVLTree.insert
+        :param value: Value to be inserted in tree
+        :return: None
+        """
+        if self.lock is None:
+            with self.write_lock:
+                self.tree = self.tree._inserted_version(value)
+        else:
+            with self.lock.write_locked():
+                self.tree.insert(value)
+
+    def delete(self, value):
+        """
+        Public routine for deleting value from the tree, cf. AVLTree.delete
+        :param value: Value to be deleted from the tree
+        :return: None
+        :raises ValueError: If the tree is empty or value is not in the tree
+        """
+        if self.lock is None:
+            with self.write_lock:
+                self.tree = self.tree._deleted_version(value)
+        else:
+            with self.lock.write_locked():
+                self.tree.delete(value)
+
+    def compact(self):
+        """
+        Public routine for removing the tombstones of a tree with lazy_delete, cf.
+        AVLTree.compact. With compaction_threshold=None, a maintenance thread can call it while
+        the tree is in use: with snapshot_reads, the compacted version is built aside, so
+        readers are not blocked meanwhile
+        :return: None
+        """
+        if self.lock is None:
+            with self.write_lock:
+                version = self.tree._version()
+                version.compact()
+                self.tree = version
+        else:
+            with self.lock.write_locked():
+                self.tree.compact()
+
+    def find(self, value):
+        """
+        Public routine for looking up value in the tree
+        :param value: Value to be found
+        :return: (True, the value in the tree equal to value) if found; otherwise (False, None)
+        """
+        if self.lock is None:
+            found, node = self.tree.find(value)
+        else:
+            with self.lock.read_locked():
+                found, node = self.tree.find(value)
+                if not found:
+                    return False, None
+                return True, node.value
+        return (True, node.value) if found else (False, None)
+
+    def __contains__(self, value):
+        found, _ = self.find(value)
+        return found
+
+    def contains_many(self, values, presorted=False):
+        """
+        Public routine for looking up many values at once, cf. AVLTree.contains_many
+        """
+        return self._read("contains_many", values, presorted)
+
+    def __len__(self):
+        return self._read("__len__")
+
+    def __iter__(self):
+        return iter(self._read("iter_inorder", materialise=True))
+
+    def __reversed__(self):
+        return iter(self._read("iter_reversed", materialise=True))
+
+    def inorder(self):
+        return self._read("inorder")
+
+    def preorder(self):
+        return self._read("preorder")
+
+    def postorder(self):
+        return self._read("postorder")
+
+    def range(self, low=None, high=None, inclusive=(True, False), reverse=False):
+        """
+        Public routine for the values between low and high, cf. AVLTree.range
+        :return: iterator over the values
+        """
+        return iter(self._read("range", low, high, inclusive, reverse, materialise=True))
+
+    def floor(self, value):
+        return self._read("floor", value)
+
+    def ceiling(self, value):
+        return self._read("ceiling", value)
+
+    def predecessor(self, value):
+        return self._read("predecessor", value)
+
+    def successor(self, value):
+        return self._read("successor", value)
+
+    def min(self):
+        return self._read("min")
+
+    def max(self):
+        return self._read("max")
+
+    def aggregate(self, low=None, high=None, inclusive=(True, False)):
+        return self._read("aggregate", low, high, inclusive)
@@ -0,0 +1,337 @@
+"""
+This module makes the AVL tree of avltree.py durable, by a write-ahead log and checkpoints in a
+directory:
+- log.<generation>: the append-only log of the insertions and deletions since the snapshot of
+the generation. A record consists of the length and CRC-32 of its payload, and the payload:
+the operation code followed by the pickled value
+- snapshot.<generation>: the tree at the start of the generation, written by AVLTree.dump.
+Generation 0 starts from the empty tree and has no snapshot
+A checkpoint writes the snapshot of the next generation aside, renames it in to place, and only
+then starts the log of the next generation and removes the files of the previous one. So the
+directory always holds a snapshot and the complete log after it, whenever the process stops.
+Recovery loads the latest snapshot and replays its log up to the first record, which is
+incomplete or corrupt: the tail of a write cut short by a crash. The tail is truncated, so new
+records are appended after the last complete one
+"""
+
+import os
+import pickle
+import struct
+import threading
+import zlib
+
+from avltree import AVLTree
+
+RECORD_HEADER = struct.Struct("<II")
+INSERT = b"i"
+DELETE = b"d"
+LOG_PREFIX = "log."
+SNAPSHOT_PREFIX = "snapshot."
+
+
+def read_log(path):
+    """
+    Returns the operations of the log at path, as (operation code, value) pairs, and the offset
+    where its complete records end
+    """
+    with open(path, "rb") as file:
+        buffer = file.read()
+    operations = []
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(buffer):
+        length, checksum = RECORD_HEADER.unpack_from(buffer, offset)
+        start = offset + RECORD_HEADER.size
+        payload = buffer[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum or not payload:
+            break
+        try:
+            value = pickle.loads(payload[1:])
+        except Exception:  # A corrupt record, which happens to match its checksum
+            break
+        operations.append((payload[:1], value))
+        offset = start + length
+    return operations, offset
+
+
+class DurableAVLTree:
+    """
+    The DurableAVLTree class wraps an AVLTree, whose insertions and deletions are logged to a
+    directory before they are applied, cf. the module documentation. Opening the directory
+    again recovers the tree. The tree can be read through the attribute tree, but must only be
+    modified through DurableAVLTree, by one thread at a time
+    """
+    def __init__(self, directory, *args, sync="always", checkpoint_every=None, codec=None,
+                 **kwargs):
+        """
+        - directory is the directory of the log and snapshots
+        - tree is the recovered tree
+        - generation is the number of the current snapshot and log
+        - operations is the number of operations logged since the last checkpoint
+        - unsynced is the number of operations written, but not yet synced to disk
+        - lock guards the log against the syncing thread
+        - stopped is set by close, to stop the syncing thread; syncer is that thread, or None
+        :param directory: The directory; created if it does not exist
+        :param args: Positional parameters of AVLTree, as for AVLTree.load
+        :param sync: When the log is synced to disk with fsync. Each record is flushed to the
+            operating system as it is logged, so a crash of the process alone loses nothing
+            - "always": before each operation returns, so no returned operation is lost
+            - a positive number of milliseconds: by a thread, every that many milliseconds. The
+            operations in between are committed as a group, and those of the last interval
+            may be lost on a crash of the machine
+            - "none": only by checkpoint, sync and close
+        :param checkpoint_every: The number of operations logged, after which a checkpoint is
+            made; None to checkpoint on demand only
+        :param codec: The codec of the keys of the snapshots, cf. AVLTree.dump
+        :param kwargs: Keyword parameters of AVLTree, as for AVLTree.load, but duplicates: the
+            snapshots have no counts
+        :raises ValueError: If sync is invalid, or duplicates="count" is given
+        """
+        if kwargs.get("duplicates", "ignore") != "ignore":
+            raise ValueError("DurableAVLTree does not support duplicates='count'")
+        if sync not in ("always", "none") and not (isinstance(sync, (int, float))
+                                                   and sync > 0):
+            raise ValueError(f"Invalid sync policy {sync!r}!")
+        self.directory = directory
+        self.sync_policy = sync
+        self.sync_interval = None if isinstance(sync, str) else sync / 1000
+        self.checkpoint_every = checkpoint_every
+        self.codec = codec
+        self.args = args
+        self.kwargs = kwargs
+        os.makedirs(directory, exist_ok=True)
+        self.generation = self._latest_generation()
+        snapshot_path = self._path(SNAPSHOT_PREFIX, self.generation)
+        if os.path.exists(snapshot_path):
+            self.tree = AVLTree.load(snapshot_path, *args, **kwargs)
+        else:
+            self.tree = AVLTree(*args, **kwargs)
+        log_path = self._path(LOG_PREFIX, self.generation)
+        self.operations = 0
+        if os.path.exists(log_path):
+            operations, end = read_log(log_path)
+            self._replay(operations)
+            self.operations = len(operations)
+            with open(log_path, "r+b") as file:
+                file.truncate(end)
+        self.log = open(log_path, "ab")
+        self.unsynced = 0
+        self._remove_stale_files()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.syncer = None
+        if self.sync_interval is not None:
+            self.syncer = threading.Thread(target=self._sync_periodically, daemon=True)
+            self.syncer.start()
+
+    def _path(self, prefix, generation):
+        return os.path.join(self.directory, f"{prefix}{generation}")
+
+    def _latest_generation(self):
+        """
+        Internal routine for finding the generation of the latest snapshot in the directory
+        :return: The generation; 0 if there is no snapshot
+        """
+        generations = [int(name[len(SNAPSHOT_PREFIX):]) for name in os.listdir(self.directory)
+                       if name.startswith(SNAPSHOT_PREFIX)
+                       and name[len(SNAPSHOT_PREFIX):].isdigit()]
+        return max(generations, default=0)
+
+    def _remove_stale_files(self):
+        """
+        Internal routine for removing the files of earlier generations, and snapshots left
+        unfinished by a crash during a checkpoint
+        :return: None
+        """
+        current = (self._path(SNAPSHOT_PREFIX, self.generation),
+                   self._path(LOG_PREFIX, self.generation))
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith((LOG_PREFIX, SNAPSHOT_PREFIX)) and path not in current:
+                os.remove(path)
+
+    def _replay(self, operations):
+        """
+        Internal routine for applying logged operations to the tree
+        :param operations: (operation code, value) pairs, cf. read_log
+        :return: None
+        """
+        tree = self.tree
+        for code, value in operations:
+            if code == INSERT:
+                tree.insert(value)
+            else:
+                tree.delete(value)
+
+    def _append(self, code, value):
+        """
+        Internal routine for logging an operation, flushing it to the operating system, and
+        syncing the log, if the policy says so
+        :param code: INSERT or DELETE
+        :param value: The value of the operation
+        :return: The offset of the record in the log, cf. _retract
+        :raises pickle.PicklingError: If value cannot be pickled; nothing is logged
+        """
+        payload = code + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            offset = self.log.tell()
+            self.log.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self.log.flush()
+            self.unsynced += 1
+            if self.sync_policy == "always":
+                self._sync()
+        self.operations += 1
+        return offset
+
+    def _retract(self, offset):
+        """
+        Internal routine for removing the last record from the log, when the tree rejects its
+        operation, so recovery does not replay it
+        :param offset: The offset of the record, as returned by _append
+        :return: None
+        """
+        with self.lock:
+            self.log.truncate(offset)
+            self.unsynced += 1
+            if self.sync_policy == "always":
+                self._sync()
+        self.operations -= 1
+
+    def _sync_periodically(self):
+        """
+        The loop of the syncing thread of the interval policy
+        :return: None
+        """
+        while not self.stopped.wait(self.sync_interval):
+            with self.lock:
+                if not self.log.closed:
+                    self._sync()
+
+    def _sync(self):
+        """
+        Internal routine for syncing the log, under the lock
+        :return: None
+        """
+        if self.unsynced:
+            os.fsync(self.log.fileno())
+            self.unsynced = 0
+
+    def sync(self):
+        """
+        Public routine for writing the operations logged to disk
+        :return: None
+        """
+        with self.lock:
+            self._sync()
+
+    def _checkpoint_if_due(self):
+        if self.checkpoint_every is not None and self.operations >= self.checkpoint_every:
+            self.checkpoint()
+
+    def insert(self, value):
+        """
+        Public routine for logging the insertion of value, and inserting it in to the tree, cf.
+        AVLTree.insert
+        :param value: Value to be inserted in tree
+        :return: None
+        """
+        offset = self._append(INSERT, value)
+        try:
+            self.tree.insert(value)
+        except Exception:  # e.g. a value, which cannot be compared with those of the tree
+            self._retract(offset)
+            raise
+        self._checkpoint_if_due()
+
+    def delete(self, value):
+        """
+        Public routine for logging the deletion of value, and deleting it from the tree, cf.
+        AVLTree.delete
+        :param value: Value to be deleted from the tree
+        :return: None
+        :raises ValueError: If value is not in the tree; nothing is logged
+        """
+        found, _ = self.tree.find(value)
+        if not found:
+            raise ValueError(f"{value} not found in tree!")
+        offset = self._append(DELETE, value)
+        try:
+            self.tree.delete(value)
+        except Exception:
+            self._retract(offset)
+            raise
+        self._checkpoint_if_due()
+
+    def checkpoint(self):
+        """
+        Public routine for writing a snapshot of the tree and starting an empty log, in O(n)
+        :return: None
+        """
+        generation = self.generation + 1
+        snapshot_path = self._path(SNAPSHOT_PREFIX, generation)
+        temporary_path = snapshot_path + ".tmp"
+        self.tree.dump(temporary_path, self.codec)
+        with open(temporary_path, "rb") as file:
+            os.fsync(file.fileno())
+        os.replace(temporary_path, snapshot_path)
+        self._sync_directory()
+        with self.lock:
+            self.log.close()
+            self.generation = generation
+            self.log = open(self._path(LOG_PREFIX, generation), "ab")
+            self.unsynced = 0
+        self._sync_directory()
+        self.operations = 0
+        self._remove_stale_files()
+
+    def _sync_directory(self):
+        """
+        Internal routine for syncing the entries of the directory, where the platform allows it
+        :return: None
+        """
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        descriptor = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def close(self):
+        """
+        Public routine for syncing and closing the log, and stopping the syncing thread. The
+        tree can still be read
+        :return: None
+        """
+        if self.syncer is not None:
+            self.stopped.set()
+            self.syncer.join()
+            self.syncer = None
+        with self.lock:
+            if not self.log.closed:
+                self._sync()
+                self.log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def find(self, value):
+        """
+        Public routine for looking up value in the tree, cf. AVLTree.find
+        """
+        return self.tree.find(value)
+
+    def __contains__(self, value):
+        found, _ = self.tree.find(value)
+        return found
+
+    def __len__(self):
+        return len(self.tree)
+
+    def __iter__(self):
+        return iter(self.tree)
+
+    def inorder(self):
+        return self.tree.inorder()
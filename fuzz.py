@@ -0,0 +1,127 @@
+"""
+A differential fuzzer of AVLTree: random sequences of operations are applied both to a tree and
+to a sorted list, the reference model, and every result is compared. The tree is checked by
+avltree.validate every validate_every operations, and at the end, so the O(n) validation is
+amortised over many O(log n) operations. A failure raises AssertionError, naming the seed and
+the operation, so it can be reproduced.
+Usage: python fuzz.py [operations] [seed] [validate every] [universe]
+"""
+
+import bisect
+import operator
+import random
+import sys
+
+import avltree
+from avltree import AVLTree, DELETED, DUPLICATE, INSERTED, MISSING
+from monoid import SUM
+
+# The configurations fuzzed by main; each is run with iterative=True and iterative=False. The
+# values are non-negative ints, so each configuration orders them as the reference does
+CONFIGURATIONS = {
+    "plain": {},
+    "less_than_func": dict(less_than_func=operator.lt),
+    "cmp": dict(cmp=lambda x, y: (x > y) - (x < y)),
+    "key": dict(key=abs),
+    "order_statistics": dict(order_statistics=True, monoid=SUM),
+    "multiset": dict(duplicates="count", order_statistics=True),
+    "lazy_delete": dict(lazy_delete=True, compaction_threshold=0.3),
+    "cache": dict(cache="lru", cache_size=16),
+}
+
+
+def fuzz(operations, seed=0, validate_every=100, universe=1000, **kwargs):
+    """
+    Applies random operations to an AVLTree and to a sorted list, and compares their results
+    :param operations: The number of operations
+    :param seed: The seed of the random operations
+    :param validate_every: The number of operations between validations of the tree
+    :param universe: The values are drawn from range(universe)
+    :param kwargs: Keyword parameters of the tree, as for AVLTree()
+    :return: The tree
+    :raises AssertionError: If the tree and the reference differ
+    :raises ValueError: If the tree is found invalid, cf. avltree.validate
+    """
+    rnd = random.Random(seed)
+    tree = AVLTree(**kwargs)
+    multiset = tree.multiset
+    reference = []
+
+    def check(expected, actual, step, operation):
+        if expected != actual:
+            raise AssertionError(f"Seed {seed}, operation {step} ({operation}): expected "
+                                 f"{expected!r}, got {actual!r}")
+
+    for step in range(operations):
+        value = rnd.randrange(universe)
+        index = bisect.bisect_left(reference, value)
+        present = index < len(reference) and reference[index] == value
+        choice = rnd.random()
+        if choice < 0.4:
+            tree.insert(value)
+            if multiset or not present:
+                reference.insert(index, value)
+        elif choice < 0.7:
+            try:
+                tree.delete(value)
+                deleted = True
+            except ValueError:
+                deleted = False
+            check(present, deleted, step, f"delete {value}")
+            if present:
+                del reference[index]
+        elif choice < 0.85:
+            found, node = tree.find(value)
+            check((present, value if present else None), (found, node and node.value), step,
+                  f"find {value}")
+        elif choice < 0.9:
+            check(len(reference), len(tree), step, "len")
+            if reference:
+                check((reference[0], reference[-1]), (tree.min(), tree.max()), step, "min/max")
+        elif choice < 0.95:
+            high = value + rnd.randrange(universe // 10 + 1)
+            expected = reference[index:bisect.bisect_left(reference, high)]
+            check(expected, list(tree.range(value, high)), step, f"range {value} {high}")
+            check(reference[index - 1] if index else None, tree.predecessor(value), step,
+                  f"predecessor {value}")
+        elif choice < 0.975:
+            batch = [rnd.randrange(universe) for _ in range(rnd.randrange(1, 20))]
+            outcomes = tree.insert_many(batch)
+            for batch_value, outcome in zip(batch, outcomes):
+                position = bisect.bisect_left(reference, batch_value)
+                duplicate = position < len(reference) and reference[position] == batch_value
+                check(DUPLICATE if duplicate and not multiset else INSERTED, outcome, step,
+                      f"insert_many {batch_value}")
+                if multiset or not duplicate:
+                    reference.insert(position, batch_value)
+        else:
+            batch = [rnd.randrange(universe) for _ in range(rnd.randrange(1, 20))]
+            outcomes = tree.delete_many(batch)
+            for batch_value, outcome in zip(batch, outcomes):
+                position = bisect.bisect_left(reference, batch_value)
+                present = position < len(reference) and reference[position] == batch_value
+                check(DELETED if present else MISSING, outcome, step,
+                      f"delete_many {batch_value}")
+                if present:
+                    del reference[position]
+        if validate_every and step % validate_every == 0:
+            avltree.validate(tree)
+    avltree.validate(tree)
+    check(reference, tree.inorder(), operations, "inorder")
+    return tree
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 5
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    validate_every = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    universe = int(sys.argv[4]) if len(sys.argv) > 4 else 10 ** 4
+    for name, kwargs in CONFIGURATIONS.items():
+        for iterative in (True, False):
+            tree = fuzz(operations, seed, validate_every, universe, iterative=iterative,
+                        **kwargs)
+            print(f"{name:<18}iterative={iterative!s:<7}{len(tree):>10} values: ok")
+
+
+if __name__ == '__main__':
+    main()
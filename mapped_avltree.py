@@ -0,0 +1,138 @@
+"""
+This module implements a read-only AVL tree on a file written by AVLTree.dump. The file is
+memory mapped and searched in place: a lookup reads only the records of the nodes it passes, so
+opening is O(1), and processes mapping the same file share its pages in the page cache
+"""
+
+import mmap
+import operator
+
+import serialization
+from avltree import _range_bounds
+
+
+class MappedAVLTree:
+    """
+    The MappedAVLTree class answers find and range queries, as AVLTree does, from a file
+    written by AVLTree.dump. It must be ordered as the tree dumped. Lookups return values, as
+    there are no nodes. Use close, or the tree as a context manager, to unmap the file
+    """
+    def __init__(self, path, less_than_func=None, key=None, cmp=None):
+        """
+        :param path: The path of the file
+        :param less_than_func: As for AVLTree()
+        :param key: As for AVLTree()
+        :param cmp: As for AVLTree()
+        :raises ValueError: If the file does not hold a tree
+        """
+        if less_than_func is not None and cmp is not None:
+            raise ValueError("Only one of less_than_func and cmp can be given!")
+        with open(path, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.key_codec, self.value_codec, self.length, self.heap_offset = \
+                serialization.read_header(self.buffer)
+        except ValueError:
+            self.buffer.close()
+            raise
+        self.record = serialization.record_struct(self.key_codec, self.value_codec)
+        self.key_func = key
+        if cmp is not None:
+            self.less_than_func = lambda x, y: cmp(x, y) < 0
+        elif less_than_func is not None:
+            self.less_than_func = less_than_func
+        else:
+            self.less_than_func = operator.lt
+
+    def close(self):
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.length
+
+    def _node(self, index):
+        """
+        Internal routine for reading the record of a node
+        :param index: The index of the node in the table
+        :return: (key, value slot, left index, right index); the value slot is None if the
+            values are the keys
+        """
+        fields = self.record.unpack_from(self.buffer,
+                                         serialization.HEADER.size + index * self.record.size)
+        key = fields[0]
+        if self.key_codec == serialization.PICKLE:
+            key = serialization.read_pickle(self.buffer, self.heap_offset, key)
+        if self.value_codec == serialization.VALUES_ARE_KEYS:
+            return key, None, fields[1], fields[2]
+        return key, fields[1], fields[2], fields[3]
+
+    def _value(self, key, value_slot):
+        """
+        Internal routine for reading the value of a node, cf. _node
+        """
+        if value_slot is None:
+            return key
+        return serialization.read_pickle(self.buffer, self.heap_offset, value_slot)
+
+    def find(self, value):
+        """
+        Public routine for looking up value in the tree
+        :param value: Value to be found
+        :return: (True, the value in the tree equal to value) if found; otherwise (False, None)
+        """
+        key = value if self.key_func is None else self.key_func(value)
+        less_than_func = self.less_than_func
+        index = 0 if self.length else serialization.NIL
+        while index != serialization.NIL:
+            node_key, value_slot, left, right = self._node(index)
+            if less_than_func(key, node_key):
+                index = left
+            elif less_than_func(node_key, key):
+                index = right
+            else:
+                return True, self._value(node_key, value_slot)
+        return False, None
+
+    def __contains__(self, value):
+        found, _ = self.find(value)
+        return found
+
+    def range(self, low=None, high=None, inclusive=(True, False), reverse=False):
+        """
+        Public routine for iterating over the values between low and high, cf. AVLTree.range
+        :return: Generator of the values
+        """
+        within_start, within_end = _range_bounds(self.less_than_func, self.key_func, low, high,
+                                                 inclusive, reverse)
+        nil = serialization.NIL
+        stack = []
+        index = 0 if self.length else nil
+        while index != nil:
+            node = self._node(index)
+            if within_start(node[0]):
+                stack.append(node)
+                index = node[3] if reverse else node[2]
+            else:
+                index = node[2] if reverse else node[3]
+        while stack:
+            key, value_slot, left, right = stack.pop()
+            if not within_end(key):
+                return
+            yield self._value(key, value_slot)
+            index = left if reverse else right
+            while index != nil:
+                node = self._node(index)
+                stack.append(node)
+                index = node[3] if reverse else node[2]
+
+    def __iter__(self):
+        return self.range()
+
+    def __reversed__(self):
+        return self.range(reverse=True)
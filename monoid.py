@@ -0,0 +1,48 @@
+"""
+This module defines the monoids, by which an AVL tree can aggregate the values of its subtrees,
+cf. AVLTree(monoid=...) and AVLTree.aggregate
+"""
+
+import math
+import operator
+
+
+def _itself(value):
+    return value
+
+
+class Monoid:
+    """
+    A monoid: an associative function combining two aggregates, and the identity, which is the
+    aggregate of no values. The aggregate of a single value is its measure
+    """
+    def __init__(self, combine, identity, measure=None):
+        """
+        :param combine: Function taking two aggregates and returning their combination. It must
+            be associative, but needs not be commutative: the first aggregate is of the lesser
+            values
+        :param identity: The aggregate, which combine leaves unchanged
+        :param measure: Function taking a value and returning its aggregate; None for the value
+            itself
+        """
+        self.combine = combine
+        self.identity = identity
+        # A module level function, so the monoid pickles, e.g. to worker processes
+        self.measure = measure if measure is not None else _itself
+
+    def repeat(self, aggregate, times):
+        """
+        Returns the combination of times copies of aggregate, by O(log times) combinations
+        """
+        result = self.identity
+        while times:
+            if times & 1:
+                result = self.combine(result, aggregate)
+            aggregate = self.combine(aggregate, aggregate)
+            times >>= 1
+        return result
+
+
+SUM = Monoid(operator.add, 0)
+MIN = Monoid(min, math.inf)
+MAX = Monoid(max, -math.inf)
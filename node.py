@@ -1,10 +1,28 @@
+import functools
+
+
 class AVLNode:
-    def __init__(self, value):
+    __slots__ = ('value', 'key', 'left', 'right', 'balance')
+
+    def __init__(self, value, key):
         self.value = value
+        self.key = key
         self.left = None
         self.right = None
         self.balance = 0
 
+    def copy(self):
+        """
+        Returns a new node with the same fields, sharing the children of this node
+        """
+        node = self.__class__.__new__(self.__class__)
+        node.value = self.value
+        node.key = self.key
+        node.left = self.left
+        node.right = self.right
+        node.balance = self.balance
+        return node
+
     def __repr__(self):
         if self.balance not in {-1, 0, 1}:
             raise ValueError("Tree invariant is broken")
@@ -18,3 +36,73 @@ class AVLNode:
             right_val = None
         return f'<Node {self.value}>; balance={self.balance}; /' \
                f'(left tree top: {left_val}; right tree top: {right_val})'
+
+
+class SizedAVLNode(AVLNode):
+    """
+    A node, which also keeps the number of nodes in its subtree (itself included)
+    """
+    __slots__ = ('size',)
+
+    def __init__(self, value, key):
+        super().__init__(value, key)
+        self.size = 1
+
+    def copy(self):
+        node = super().copy()
+        node.size = self.size
+        return node
+
+
+class CountedAVLNode(AVLNode):
+    """
+    A node, which also keeps the multiplicity of its value, cf. AVLTree(duplicates="count")
+    """
+    __slots__ = ('count',)
+
+    def __init__(self, value, key):
+        super().__init__(value, key)
+        self.count = 1
+
+    def copy(self):
+        node = super().copy()
+        node.count = self.count
+        return node
+
+
+class SizedCountedAVLNode(SizedAVLNode):
+    """
+    A node, which keeps both the multiplicity of its value and the size of its subtree, which
+    is the sum of the multiplicities in the subtree
+    """
+    __slots__ = ('count',)
+
+    def __init__(self, value, key):
+        super().__init__(value, key)
+        self.count = 1
+
+    def copy(self):
+        node = super().copy()
+        node.count = self.count
+        return node
+
+
+@functools.lru_cache(maxsize=None)
+def aggregated_node_class(node_class, monoid):
+    """
+    Returns the subclass of node_class, whose nodes also keep the aggregate by monoid of the
+    values in their subtree. A new node is a leaf, so its aggregate is the measure of its value
+    """
+    measure = monoid.measure
+
+    def __init__(self, value, key):
+        node_class.__init__(self, value, key)
+        self.agg = measure(value)
+
+    def copy(self):
+        node = node_class.copy(self)
+        node.agg = self.agg
+        return node
+
+    return type("Aggregated" + node_class.__name__, (node_class,),
+                {"__slots__": ("agg",), "__init__": __init__, "copy": copy})
@@ -0,0 +1,101 @@
+"""
+This module implements a persistent AVL tree: insert and delete leave the tree unchanged and
+return a new version of it. A version shares all nodes off the path of the update with the
+version it was made from, so it costs O(log n) new nodes and serves as a snapshot for free
+"""
+
+from avltree import AVLTree, BATCH_REBUILD_RATIO, DELETED, DUPLICATE, INSERTED, MISSING
+
+
+class PersistentAVLTree(AVLTree):
+    """
+    The PersistentAVLTree class is an AVLTree, whose nodes are never modified once they belong
+    to a version. insert, delete, update, insert_many and delete_many return the new version;
+    all read-only methods are those of AVLTree. join and split move nodes, so they are not
+    supported
+    """
+    def insert(self, value):
+        """
+        Public routine for inserting value in a new version of the tree. Only the nodes on the
+        path to value, and those rotated, are copied
+        :param value: Value to be inserted in tree
+        :return: The new version; this version itself, if an equal value is in the tree already
+        """
+        return self._inserted_version(value)
+
+    def delete(self, value):
+        """
+        Public routine for deleting value in a new version of the tree, cf. insert
+        :param value: Value to be deleted from the tree
+        :return: The new version
+        :raises ValueError: If the tree is empty or value is not in the tree
+        """
+        return self._deleted_version(value)
+
+    def insert_many(self, iterable):
+        """
+        Public routine for inserting a batch of values in a new version of the tree, cf.
+        AVLTree.insert_many. A small batch is inserted by path copying, value by value; a large
+        one rebuilds the new version
+        :param iterable: The values
+        :return: (the new version, list of the outcome for each value: INSERTED or DUPLICATE)
+        """
+        values = list(iterable)
+        # len first, so the version shares the length it counts
+        rebuild = len(values) * BATCH_REBUILD_RATIO >= len(self) and not self.multiset
+        version = self._version()
+        if rebuild:
+            # The rebuild replaces the head of the version, and modifies no node
+            return version, AVLTree.insert_many(version, values)
+        outcomes = []
+        key_func = self.key_func
+        for value in values:
+            key = value if key_func is None else key_func(value)
+            if not version._copying_insert(key, value):
+                outcomes.append(DUPLICATE)
+                continue
+            version.length += 1
+            outcomes.append(INSERTED)
+        return version, outcomes
+
+    def delete_many(self, iterable):
+        """
+        Public routine for deleting a batch of values in a new version of the tree, cf.
+        AVLTree.delete_many and insert_many
+        :param iterable: The values
+        :return: (the new version, list of the outcome for each value: DELETED or MISSING)
+        """
+        values = list(iterable)
+        rebuild = len(values) * BATCH_REBUILD_RATIO >= len(self) and not self.multiset
+        version = self._version()
+        if rebuild:
+            return version, AVLTree.delete_many(version, values)
+        outcomes = []
+        key_func = self.key_func
+        for value in values:
+            key = value if key_func is None else key_func(value)
+            try:
+                version._copying_delete(key)
+            except ValueError:  # raised before anything is copied
+                outcomes.append(MISSING)
+                continue
+            version.length -= 1
+            outcomes.append(DELETED)
+        if version.tombstones and version._compaction_due():
+            version.compact()
+        return version, outcomes
+
+    def update(self, other):
+        """
+        Public routine for adding the values of other to a new version of the tree. Unlike
+        insert, the new version shares no nodes with this one, cf. AVLTree.union
+        :param other: Tree ordered alike
+        :return: The new version
+        """
+        return self.union(other)
+
+    def join(self, pivot, right_tree):
+        raise ValueError("join is not supported by PersistentAVLTree")
+
+    def split(self, value):
+        raise ValueError("split is not supported by PersistentAVLTree")
@@ -0,0 +1,224 @@
+"""
+This module implements the binary file format of AVL trees, cf. AVLTree.dump and AVLTree.load.
+A file consists of:
+- a header: magic, format version, the codecs of keys and values, the number of nodes and the
+offset of the heap
+- the node table: one fixed size record per node, in preorder, so the head is record 0. A
+record holds the key slot, the value slot (only if the values are not the keys), the indices of
+the left and right children (-1 for none) and the balance factor
+- the heap: the length prefixed pickles of keys and values, which are not of a fixed size codec
+Fixed size keys (int64, float64) are stored in the record itself, so a tree can be searched in
+the mapped file without deserialising anything but the keys compared, cf. MappedAVLTree
+"""
+
+import pickle
+import struct
+
+MAGIC = b"AVLT"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sBBBxQQ")
+LENGTH = struct.Struct("<I")
+NIL = -1
+
+# Codecs of the key and value slots. VALUES_ARE_KEYS means no value slot
+VALUES_ARE_KEYS = 0
+INT64 = 1
+FLOAT64 = 2
+PICKLE = 3
+CODECS = {"int64": INT64, "float64": FLOAT64, "pickle": PICKLE}
+SLOT_FORMATS = {INT64: "q", FLOAT64: "d", PICKLE: "Q"}
+
+
+def record_struct(key_codec, value_codec):
+    """
+    Returns the struct of the node records for the codecs given
+    """
+    value_slot = "" if value_codec == VALUES_ARE_KEYS else SLOT_FORMATS[value_codec]
+    return struct.Struct("<" + SLOT_FORMATS[key_codec] + value_slot + "iib")
+
+
+def choose_codec(keys):
+    """
+    Returns the most compact codec able to hold all of keys
+    """
+    if all(key.__class__ is int and -2 ** 63 <= key < 2 ** 63 for key in keys):
+        return INT64
+    if all(key.__class__ is float for key in keys):
+        return FLOAT64
+    return PICKLE
+
+
+def read_pickle(buffer, heap_offset, slot):
+    """
+    Returns the object pickled in the heap of buffer at slot
+    """
+    start = heap_offset + slot + LENGTH.size
+    (length,) = LENGTH.unpack_from(buffer, heap_offset + slot)
+    return pickle.loads(buffer[start:start + length])
+
+
+def read_header(buffer):
+    """
+    Returns (key codec, value codec, number of nodes, heap offset) of the file in buffer
+    :raises ValueError: If buffer does not hold a tree of this format version
+    """
+    if len(buffer) < HEADER.size:
+        raise ValueError("Not an AVL tree file!")
+    magic, version, key_codec, value_codec, count, heap_offset = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError("Not an AVL tree file!")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported AVL tree file version {version}!")
+    return key_codec, value_codec, count, heap_offset
+
+
+def shape_records(head):
+    """
+    Returns the records of the tree of head as it is, in preorder, as parallel lists: (nodes,
+    indices of the left children, indices of the right children, balance factors)
+    """
+    nodes = []
+    stack = [head] if head is not None else []
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        if node.right is not None:
+            stack.append(node.right)
+        if node.left is not None:
+            stack.append(node.left)
+    index = {id(node): i for i, node in enumerate(nodes)}
+    lefts = [NIL if node.left is None else index[id(node.left)] for node in nodes]
+    rights = [NIL if node.right is None else index[id(node.right)] for node in nodes]
+    return nodes, lefts, rights, [node.balance for node in nodes]
+
+
+def balanced_records(head):
+    """
+    Returns the records of a perfectly balanced tree of the nodes of the tree of head, which
+    are not tombstones (of count 0), cf. shape_records. The tree itself is not changed
+    """
+    nodes = []
+    stack = []
+    node = head
+    while stack or node is not None:
+        if node is not None:
+            stack.append(node)
+            node = node.left
+        else:
+            node = stack.pop()
+            if getattr(node, "count", 1):
+                nodes.append(node)
+            node = node.right
+    count = len(nodes)
+    records = ([None] * count, [NIL] * count, [NIL] * count, [0] * count)
+    next_index = [0]
+
+    def build(low, high):
+        # Returns (index of the root record of nodes[low:high], height)
+        if low == high:
+            return NIL, 0
+        middle = (low + high) // 2
+        index = next_index[0]
+        next_index[0] += 1
+        left, left_height = build(low, middle)
+        right, right_height = build(middle + 1, high)
+        records[0][index] = nodes[middle]
+        records[1][index] = left
+        records[2][index] = right
+        records[3][index] = right_height - left_height
+        return index, max(left_height, right_height) + 1
+
+    build(0, count)
+    return records
+
+
+def dump_nodes(head, path, with_values, codec=None, skip_tombstones=False):
+    """
+    Writes the tree of head to the file path
+    :param head: The head node of the tree
+    :param path: The path of the file
+    :param with_values: If True, the values are written besides the keys
+    :param codec: "int64", "float64" or "pickle" for the keys; None for the most compact
+    :param skip_tombstones: If True, the nodes of count 0 are left out, and the others are
+        written as a perfectly balanced tree, cf. balanced_records
+    :return: None
+    :raises ValueError: If the keys cannot be written with codec
+    """
+    nodes, lefts, rights, balances = \
+        balanced_records(head) if skip_tombstones else shape_records(head)
+    if codec is None:
+        key_codec = choose_codec([node.key for node in nodes])
+    elif codec in CODECS:
+        key_codec = CODECS[codec]
+    else:
+        raise ValueError(f"Unknown codec {codec}!")
+    value_codec = PICKLE if with_values else VALUES_ARE_KEYS
+    record = record_struct(key_codec, value_codec)
+    table = bytearray(record.size * len(nodes))
+    heap = bytearray()
+
+    def heap_slot(obj):
+        slot = len(heap)
+        blob = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        heap.extend(LENGTH.pack(len(blob)))
+        heap.extend(blob)
+        return slot
+
+    for i, (node, left, right, balance) in enumerate(zip(nodes, lefts, rights, balances)):
+        key = heap_slot(node.key) if key_codec == PICKLE else node.key
+        try:
+            if with_values:
+                record.pack_into(table, i * record.size, key, heap_slot(node.value), left, right,
+                                 balance)
+            else:
+                record.pack_into(table, i * record.size, key, left, right, balance)
+        except struct.error as error:
+            raise ValueError(f"Key {node.key!r} cannot be written as {codec}: {error}") from None
+    heap_offset = HEADER.size + len(table)
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, key_codec, value_codec, len(nodes),
+                               heap_offset))
+        file.write(table)
+        file.write(heap)
+
+
+def load_nodes(path, node_class, sized):
+    """
+    Reads the tree of the file path, without comparing any keys
+    :param path: The path of the file
+    :param node_class: The class of the nodes to be created
+    :param sized: If True, the sizes of the subtrees are set
+    :return: (head node, number of nodes)
+    :raises ValueError: If the file does not hold a tree of this format version
+    """
+    with open(path, "rb") as file:
+        buffer = file.read()
+    key_codec, value_codec, count, heap_offset = read_header(buffer)
+    record = record_struct(key_codec, value_codec)
+    records = record.iter_unpack(memoryview(buffer)[HEADER.size:heap_offset])
+    nodes = []
+    links = []
+    for fields in records:
+        key = fields[0]
+        if key_codec == PICKLE:
+            key = read_pickle(buffer, heap_offset, key)
+        if value_codec == VALUES_ARE_KEYS:
+            node = node_class(key, key)
+            _, left, right, balance = fields
+        else:
+            node = node_class(read_pickle(buffer, heap_offset, fields[1]), key)
+            _, _, left, right, balance = fields
+        node.balance = balance
+        nodes.append(node)
+        links.append((left, right))
+    for node, (left, right) in zip(nodes, links):
+        if left != NIL:
+            node.left = nodes[left]
+        if right != NIL:
+            node.right = nodes[right]
+    if sized:
+        # In preorder the children come after their parent
+        for node in reversed(nodes):
+            node.size = 1 + (node.left.size if node.left else 0) + \
+                (node.right.size if node.right else 0)
+    return (nodes[0] if nodes else None), count
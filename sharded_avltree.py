@@ -0,0 +1,184 @@
+"""
+This module implements a tree partitioned in shards by splitter keys, so that building it from
+many values can be spread over several processes: each worker sorts the values of a shard, and
+the parent builds the shard by from_sorted, which needs no comparisons
+"""
+
+import bisect
+import itertools
+import operator
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from avltree import AVLTree
+
+# Number of sampled keys per shard, from which the splitters are chosen
+SAMPLES_PER_SHARD = 64
+
+
+def _sorted_partition(configuration, values):
+    """
+    Sorts the values of a shard in a worker process, keeping the first of equal values
+    :param configuration: The ordering parameters of the tree: less_than_func, key and cmp.
+        They must be picklable, i.e. not lambdas
+    :param values: list of the values
+    :return: list of the distinct values sorted
+    """
+    values, _, _ = AVLTree(**configuration)._sorted_distinct(values)
+    return values
+
+
+class ShardedAVLTree:
+    """
+    The ShardedAVLTree class holds one AVLTree per shard. Shard i holds the values, whose keys
+    are at least splitters[i - 1] and less than splitters[i]. insert, delete and find are routed
+    to the shard owning the key; concatenate joins the shards in a single tree
+    """
+    def __init__(self, *args, splitters=(), **kwargs):
+        """
+        :param args: Positional parameters of the shards, as for AVLTree()
+        :param splitters: The keys separating the shards, in increasing order
+        :param kwargs: Keyword parameters of the shards, as for AVLTree()
+        :raises ValueError: If the splitters are not in increasing order
+        """
+        self.tree_args = args
+        self.tree_kwargs = kwargs
+        self.shards = [AVLTree(*args, **kwargs) for _ in range(len(splitters) + 1)]
+        prototype = self.shards[0]
+        self.key_func = prototype.key_func
+        self.less_than_func = prototype.less_than_func
+        self.splitters = list(splitters)
+        for lower, upper in zip(self.splitters, self.splitters[1:]):
+            if not self.less_than_func(lower, upper):
+                raise ValueError("The splitters are not in increasing order!")
+
+    @classmethod
+    def build(cls, iterable, *args, shards=None, max_workers=None, **kwargs):
+        """
+        Public routine for building a sharded tree of values in any order. The splitters are
+        sampled from the values, the values are sorted per shard in a pool of max_workers
+        processes, and each shard is built by from_sorted. Of equal values the first is kept
+        :param iterable: The values. It is read once
+        :param args: Positional parameters of the shards, as for AVLTree()
+        :param shards: Number of shards; by default the number of CPUs
+        :param max_workers: Number of worker processes; by default the number of CPUs. With 1,
+            the shards are sorted in this process
+        :param kwargs: Keyword parameters of the shards, as for AVLTree(). less_than_func, key
+            and cmp must be picklable, unless max_workers is 1
+        :return: The new tree
+        :raises ValueError: If the shards are multisets
+        """
+        values = list(iterable)
+        shards = shards or os.cpu_count() or 1
+        prototype = AVLTree(*args, **kwargs)
+        if prototype.multiset:
+            raise ValueError("build does not support trees with duplicates='count'")
+        sample = random.sample(values, min(len(values), shards * SAMPLES_PER_SHARD))
+        _, sample_keys, _ = prototype._sorted_distinct(sample)
+        # The sampled keys are distinct, so distinct quantiles give increasing splitters
+        quantiles = sorted({len(sample_keys) * i // shards for i in range(1, shards)} - {0})
+        tree = cls(*args, splitters=[sample_keys[i] for i in quantiles], **kwargs)
+        partitions = [[] for _ in tree.shards]
+        key_func = tree.key_func
+        for value in values:
+            key = value if key_func is None else key_func(value)
+            partitions[tree._shard_index(key)].append(value)
+        configuration = {name: prototype.configuration[name]
+                         for name in ("less_than_func", "key", "cmp")}
+        if max_workers == 1 or len(partitions) == 1:
+            sorted_partitions = [_sorted_partition(configuration, partition)
+                                 for partition in partitions]
+        else:
+            with ProcessPoolExecutor(max_workers) as executor:
+                sorted_partitions = list(executor.map(_sorted_partition,
+                                                      itertools.repeat(configuration),
+                                                      partitions))
+        tree.shards = [AVLTree.from_sorted(partition, *args, **kwargs)
+                       for partition in sorted_partitions]
+        return tree
+
+    def _shard_index(self, key):
+        """
+        Internal routine for finding the shard owning key by bisecting the splitters
+        :param key: The key
+        :return: The index of the shard
+        """
+        if self.less_than_func is operator.lt:
+            return bisect.bisect_right(self.splitters, key)
+        less_than_func = self.less_than_func
+        low, high = 0, len(self.splitters)
+        while low < high:
+            middle = (low + high) // 2
+            if less_than_func(key, self.splitters[middle]):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def _shard(self, value):
+        """
+        Internal routine for finding the shard owning value
+        """
+        return self.shards[self._shard_index(value if self.key_func is None
+                                             else self.key_func(value))]
+
+    def insert(self, value):
+        """
+        Public routine for inserting value in to the tree, cf. AVLTree.insert
+        """
+        self._shard(value).insert(value)
+
+    def delete(self, value):
+        """
+        Public routine for deleting value from the tree, cf. AVLTree.delete
+        :raises ValueError: If value is not in the tree
+        """
+        shard = self._shard(value)
+        if not shard.head:
+            raise ValueError(f"{value} not found in tree!")
+        shard.delete(value)
+
+    def find(self, value):
+        """
+        Public routine for looking up value in the tree, cf. AVLTree.find
+        :return: (True, node holding value) if found; otherwise (False, None)
+        """
+        return self._shard(value).find(value)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.shards)
+
+    def inorder(self):
+        return list(self)
+
+    def concatenate(self):
+        """
+        Public routine for joining the shards in a single tree in O(log n) per boundary: the
+        node of the least value of each shard is detached and used as the pivot joining it to
+        the shards before it. The nodes are moved to the new tree, leaving the shards empty.
+        Shards with tombstones, cf. AVLTree(lazy_delete=True), are compacted first
+        :return: AVLTree
+        """
+        tree = None
+        for shard in self.shards:
+            shard.compact()
+            if not shard.head:
+                continue
+            if tree is None:
+                tree = shard
+                continue
+            length = None
+            if tree.length is not None and shard.length is not None:
+                length = tree.length + shard.length
+            # Detached rather than deleted, so no tombstone is left, and counts are kept
+            pivot_node, head, height = shard._split_first(shard.head, shard._height(shard.head))
+            head, _ = tree._join_nodes(tree.head, tree._height(tree.head), pivot_node, head,
+                                       height)
+            tree._take_head(head, length)
+            shard._take_head(None)
+        self.shards = [AVLTree(*self.tree_args, **self.tree_kwargs) for _ in self.shards]
+        return tree if tree is not None else AVLTree(*self.tree_args, **self.tree_kwargs)
@@ -0,0 +1,210 @@
+"""
+This module implements the optional instrumentation of an AVLTree: counters of comparisons,
+rotations and nodes visited, the height, and latency histograms of insert, delete and find.
+Instead of testing a flag on every operation, the instrumented tree has wrapping methods
+bound on the instance, so an uninstrumented tree runs the plain methods without any overhead.
+"""
+
+import threading
+import time
+
+# The public operations timed
+TIMED_OPERATIONS = ("insert", "delete", "find")
+# The internal methods creating new versions by path copying, timed as the operations they do,
+# cf. ConcurrentAVLTree and PersistentAVLTree
+VERSION_OPERATIONS = {"_inserted_version": "insert", "_deleted_version": "delete"}
+
+
+class TreeStats:
+    """
+    The TreeStats class holds the counters of an instrumented tree and binds the wrapping
+    methods on it (cf. instrument). An optional callback is called after each timed operation
+    with a dict describing it, e.g. for exporting to a metrics pipeline
+    """
+    def __init__(self, callback=None):
+        """
+        :param callback: Function taking a dict with the keys operation, latency_ns,
+            nodes_visited, comparisons, single_rotations and double_rotations of one operation
+        """
+        self.callback = callback
+        # The depth of the timed operations running in each thread, so an operation done by way
+        # of another, e.g. the insert of a PersistentAVLTree, is recorded once
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """
+        Public routine for setting all counters to zero
+        :return: None
+        """
+        self.comparisons = 0
+        self.single_rotations = 0
+        self.double_rotations = 0
+        self.nodes_visited = 0
+        self.max_height = 0
+        self.operation_counts = dict.fromkeys(TIMED_OPERATIONS, 0)
+        self.operation_nodes_visited = dict.fromkeys(TIMED_OPERATIONS, 0)
+        # For each operation: upper bound in ns (a power of two) -> number of operations
+        self.latency_histograms = {operation: {} for operation in TIMED_OPERATIONS}
+
+    def instrument(self, tree):
+        """
+        Public routine for binding counting versions of the comparison, descent, rotation,
+        insertion, deletion and find methods on tree. The versions of a tree created by path
+        copying are instrumented with the same TreeStats, so their counters accumulate
+        :param tree: The AVLTree to be instrumented
+        :return: None
+        """
+        less_than_func = tree.less_than_func
+
+        def counting_less_than_func(x, y):
+            self.comparisons += 1
+            return less_than_func(x, y)
+
+        tree.less_than_func = counting_less_than_func
+        if tree.cmp_func is not None:
+            cmp = tree.cmp_func
+
+            def counting_cmp(x, y):
+                self.comparisons += 1
+                return cmp(x, y)
+
+            tree.cmp_func = counting_cmp
+        elif tree.descent_method == tree._descend_native:
+            # Native comparisons cannot be counted, so compare by the counting less_than_func
+            tree.descent_method = tree._descend
+            if tree.find_method == tree._iterative_find_native:
+                tree.find_method = tree._iterative_find
+
+        descent_method = tree.descent_method
+
+        def counting_descent(current_node, key):
+            path, directions, node = descent_method(current_node, key)
+            self.nodes_visited += len(path) if node is None else len(path) + 1
+            return path, directions, node
+
+        tree.descent_method = counting_descent
+
+        if tree.find_method == tree._recursive_find:
+            recursive_insert = tree._recursive_insert
+            recursive_delete = tree._recursive_delete
+            recursive_find = tree._recursive_find
+
+            # The recursive methods call themselves through the instance, so each level is counted
+            def counting_recursive_insert(parent_node, current_node, key, value):
+                self.nodes_visited += 1
+                return recursive_insert(parent_node, current_node, key, value)
+
+            def counting_recursive_delete(parent_node, current_node, key,
+                                          to_be_deleted_value_node=None):
+                if current_node is not None:
+                    self.nodes_visited += 1
+                return recursive_delete(parent_node, current_node, key, to_be_deleted_value_node)
+
+            def counting_recursive_find(current_node, key):
+                if current_node is not None:
+                    self.nodes_visited += 1
+                return recursive_find(current_node, key)
+
+            tree._recursive_insert = counting_recursive_insert
+            if tree.deletion_method == tree._recursive_delete:
+                # Unless the deletion is lazy, which descends by the counting descent
+                tree.deletion_method = counting_recursive_delete
+            tree._recursive_delete = counting_recursive_delete
+            tree._recursive_find = tree.find_method = counting_recursive_find
+        else:
+            def counting_find(current_node, key):
+                _, _, node = counting_descent(current_node, key)
+                return (False, None) if node is None else (True, node)
+
+            tree.find_method = counting_find
+
+        singlerotation = tree._singlerotation
+        doublerotation = tree._doublerotation
+
+        def counting_singlerotation(parent_node, current_node, delete=False):
+            self.single_rotations += 1
+            return singlerotation(parent_node, current_node, delete)
+
+        def counting_doublerotation(parent_node, current_node):
+            self.double_rotations += 1
+            return doublerotation(parent_node, current_node)
+
+        tree._singlerotation = counting_singlerotation
+        tree._doublerotation = counting_doublerotation
+
+        for operation in TIMED_OPERATIONS:
+            setattr(tree, operation, self._timed(tree, operation, getattr(tree, operation)))
+        for method_name, operation in VERSION_OPERATIONS.items():
+            setattr(tree, method_name, self._timed(tree, operation, getattr(tree, method_name)))
+
+    def _timed(self, tree, operation, method):
+        """
+        Internal routine for wrapping a public method of tree, recording its latency and the
+        counters of each call
+        :return: The wrapping function
+        """
+        histogram = self.latency_histograms[operation]
+        local = self.local
+
+        def timed_method(value):
+            depth = getattr(local, "depth", 0)
+            if depth:
+                return method(value)
+            local.depth = 1
+            result = None
+            comparisons = self.comparisons
+            nodes_visited = self.nodes_visited
+            single_rotations = self.single_rotations
+            double_rotations = self.double_rotations
+            start = time.perf_counter_ns()
+            try:
+                result = method(value)
+                return result
+            finally:
+                local.depth = 0
+                latency = time.perf_counter_ns() - start
+                bucket = 1 << latency.bit_length()
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+                self.operation_counts[operation] += 1
+                self.operation_nodes_visited[operation] += self.nodes_visited - nodes_visited
+                if operation == "insert":
+                    # A new version, if the insertion creates one
+                    head = getattr(result, "head", tree.head)
+                    self.max_height = max(self.max_height, tree._height(head))
+                if self.callback is not None:
+                    self.callback({
+                        "operation": operation,
+                        "latency_ns": latency,
+                        "nodes_visited": self.nodes_visited - nodes_visited,
+                        "comparisons": self.comparisons - comparisons,
+                        "single_rotations": self.single_rotations - single_rotations,
+                        "double_rotations": self.double_rotations - double_rotations,
+                    })
+
+        return timed_method
+
+    def as_dict(self, tree):
+        """
+        Public routine for collecting the counters
+        :param tree: The instrumented tree
+        :return: dict of the counters
+        """
+        operations = {}
+        for operation in TIMED_OPERATIONS:
+            count = self.operation_counts[operation]
+            operations[operation] = {
+                "count": count,
+                "nodes_visited": self.operation_nodes_visited[operation],
+                "mean_nodes_visited": self.operation_nodes_visited[operation] / count if count else 0,
+                "latency_histogram_ns": dict(sorted(self.latency_histograms[operation].items())),
+            }
+        return {
+            "comparisons": self.comparisons,
+            "single_rotations": self.single_rotations,
+            "double_rotations": self.double_rotations,
+            "nodes_visited": self.nodes_visited,
+            "height": tree._height(tree.head),
+            "max_height": max(self.max_height, tree._height(tree.head)),
+            "operations": operations,
+        }
@@ -1,6 +1,25 @@
+import collections
+import os
 import unittest
 import random
-from avltree import AVLTree
+import tempfile
+import threading
+import time
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from avltree import AVLTree, INSERTED, DUPLICATE, DELETED, MISSING, validate
+from arena import ArenaAVLTree, NIL
+from concurrent_avltree import ConcurrentAVLTree, ReadWriteLock
+from durable_avltree import DurableAVLTree
+from persistent_avltree import PersistentAVLTree
+from mapped_avltree import MappedAVLTree
+from sharded_avltree import ShardedAVLTree
+from avlmap import AVLMap
+from monoid import Monoid, SUM, MAX
+from cache import LRUCache, TinyLFUCache
+import fuzz
 
 
 def check_invariant(tree):
@@ -259,5 +278,1635 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(True, avl_invariant_intact)
 
 
+class IterativeRecursiveTestCase(unittest.TestCase):
+    def test_delete_same_shape_both_methods(self):
+        t_iter = AVLTree(lambda x, y: x < y, iterative=True)
+        t_rec = AVLTree(lambda x, y: x < y, iterative=False)
+        l = random.sample(range(100000), 1000)
+        for e in l:
+            t_iter.insert(e)
+            t_rec.insert(e)
+        self.assertEqual(t_rec.preorder(), t_iter.preorder())
+        random.shuffle(l)
+        for e in l:
+            t_iter.delete(e)
+            t_rec.delete(e)
+            self.assertEqual(t_rec.preorder(), t_iter.preorder())
+        self.assertEqual(None, t_iter.head)
+
+    def test_delete_multiple_right_doublerotations_recursive(self):
+        t = AVLTree(lambda x, y: x < y, iterative=False)
+        l = [100, 50, 500, 30, 70, 300, 700, 20, 40, 60, 80, 200, 400, 600, 900, 90, 350, 550, 650, 950, 625]
+        for e in l:
+            t.insert(e)
+        t.delete(200)
+        expected_preorder = [100, 50, 30, 20, 40, 70, 60, 80, 90, 600, 500, 350, 300, 400, 550, 700, 650, 625, 900, 950]
+        self.assertEqual((False, None), t.find(200))
+        self.assertEqual(expected_preorder, t.preorder())
+        self.assertEqual(True, check_invariant(t))
+
+    def test_find_both_methods(self):
+        for iterative in (True, False):
+            t = AVLTree(lambda x, y: x < y, iterative=iterative)
+            self.assertEqual((False, None), t.find(1))
+            for e in [20, 10, 5, 80, 15, 100]:
+                t.insert(e)
+            found, node = t.find(15)
+            self.assertEqual(True, found)
+            self.assertEqual(15, node.value)
+            self.assertEqual((False, None), t.find(16))
+
+    def test_delete_nonexistent_value_leaves_tree_intact(self):
+        for iterative in (True, False):
+            t = AVLTree(lambda x, y: x < y, iterative=iterative)
+            for e in [20, 10, 5, 80, 15, 100]:
+                t.insert(e)
+            with self.assertRaises(ValueError):
+                t.delete(16)
+            self.assertEqual([20, 10, 5, 15, 80, 100], t.preorder())
+
+
+def date_less_than_func(d1, d2):
+    return d1["year"] < d2["year"] or \
+        (d1["year"] == d2["year"] and d1["month"] < d2["month"]) or \
+        (d1["year"] == d2["year"] and d1["month"] == d2["month"] and d1["day"] < d2["day"]) or \
+        (d1["year"] == d2["year"] and d1["month"] == d2["month"] and d1["day"] == d2["day"] and d1["pid"] < d2["pid"])
+
+
+def date_key(d):
+    return d["year"], d["month"], d["day"], d["pid"]
+
+
+def random_persons(n):
+    return [{"year": random.randint(1900, 2000), "month": random.randint(1, 12), "day": random.randint(1, 28),
+             "pid": random.randint(1, 100000)} for _ in range(n)]
+
+
+class KeyModeTestCase(unittest.TestCase):
+    def test_key_mode_same_shape_as_less_than_func(self):
+        persons = random_persons(1000)
+        for iterative in (True, False):
+            t_lt = AVLTree(date_less_than_func, iterative=iterative)
+            t_key = AVLTree(key=date_key, iterative=iterative)
+            t_cmp = AVLTree(key=date_key, cmp=lambda x, y: (x > y) - (x < y), iterative=iterative)
+            for p in persons:
+                t_lt.insert(p)
+                t_key.insert(p)
+                t_cmp.insert(p)
+            self.assertEqual(t_lt.preorder(), t_key.preorder())
+            self.assertEqual(t_lt.preorder(), t_cmp.preorder())
+            self.assertEqual(True, check_invariant(t_key))
+            for p in persons[::2]:
+                if t_lt.find(p)[0]:
+                    t_lt.delete(p)
+                    t_key.delete(p)
+                    t_cmp.delete(p)
+            self.assertEqual(t_lt.preorder(), t_key.preorder())
+            self.assertEqual(t_lt.preorder(), t_cmp.preorder())
+            self.assertEqual(True, check_invariant(t_key))
+
+    def test_key_mode_find_by_equal_key(self):
+        t = AVLTree(key=date_key)
+        p1 = {"Name": "Joe Brown", "year": 1978, "month": 12, "day": 26, "pid": 7933}
+        p2 = {"Name": "Kate Bush", "year": 1977, "month": 4, "day": 12, "pid": 9004}
+        t.insert(p1)
+        t.insert(p2)
+        found, node = t.find({"year": 1977, "month": 4, "day": 12, "pid": 9004})
+        self.assertEqual(True, found)
+        self.assertIs(p2, node.value)
+        self.assertEqual((1977, 4, 12, 9004), node.key)
+        self.assertEqual((False, None), t.find({"year": 1977, "month": 4, "day": 12, "pid": 1}))
+
+    def test_key_computed_once_per_insert(self):
+        calls = []
+
+        def key(x):
+            calls.append(x)
+            return -x
+
+        t = AVLTree(key=key)
+        for e in range(100):
+            t.insert(e)
+        self.assertEqual(100, len(calls))
+        self.assertEqual(list(range(99, -1, -1)), t.inorder())
+
+    def test_native_comparison_without_less_than_func(self):
+        t = AVLTree()
+        for e in [20, 10, 5, 80, 15, 100, 2, 1, 12, 11, 120, 0]:
+            t.insert(e)
+        self.assertEqual([10, 2, 1, 0, 5, 20, 12, 11, 15, 100, 80, 120], t.preorder())
+
+    def test_less_than_func_and_cmp_exclusive(self):
+        with self.assertRaises(ValueError):
+            AVLTree(lambda x, y: x < y, cmp=lambda x, y: x - y)
+
+
+class ArenaTestCase(unittest.TestCase):
+    def test_same_shape_as_avltree(self):
+        t = AVLTree(lambda x, y: x < y)
+        a = ArenaAVLTree(lambda x, y: x < y)
+        l = random.sample(range(100000), 1000)
+        for e in l:
+            t.insert(e)
+            a.insert(e)
+        self.assertEqual(t.preorder(), a.preorder())
+        self.assertEqual(t.inorder(), a.inorder())
+        self.assertEqual(t.postorder(), a.postorder())
+        random.shuffle(l)
+        for e in l[:500]:
+            t.delete(e)
+            a.delete(e)
+            self.assertEqual(t.preorder(), a.preorder())
+
+    def test_deleted_slots_are_reused(self):
+        a = ArenaAVLTree()
+        for e in range(100):
+            a.insert(e)
+        for e in range(0, 100, 2):
+            a.delete(e)
+        self.assertEqual((False, None), a.find(10))
+        for e in range(1000, 1050):
+            a.insert(e)
+        self.assertEqual(100, len(a.values))
+        self.assertEqual(NIL, a.free)
+        self.assertEqual(list(range(1, 100, 2)) + list(range(1000, 1050)), a.inorder())
+        found, node = a.find(1049)
+        self.assertEqual(True, found)
+        self.assertEqual((1049, 1049), (node.value, a.values[node.slot]))
+
+    def test_find_returns_node_views(self):
+        a = ArenaAVLTree(key=date_key)
+        t = AVLTree(key=date_key)
+        for p in random_persons(100):
+            a.insert(p)
+            t.insert(p)
+        for p in t.inorder():
+            found, node = a.find(p)
+            _, expected = t.find(p)
+            self.assertEqual(True, found)
+            self.assertEqual((expected.value, expected.key, expected.balance),
+                             (node.value, node.key, node.balance))
+            for child, expected_child in ((node.left, expected.left),
+                                          (node.right, expected.right)):
+                self.assertEqual(expected_child and expected_child.value,
+                                 child and child.value)
+        self.assertEqual(a.find(t.min())[1], a.find(t.min())[1])
+
+    def test_key_mode(self):
+        a = ArenaAVLTree(key=date_key)
+        t = AVLTree(date_less_than_func)
+        persons = random_persons(300)
+        for p in persons:
+            a.insert(p)
+            t.insert(p)
+        self.assertEqual(t.preorder(), a.preorder())
+        for p in persons[::3]:
+            if t.find(p)[0]:
+                t.delete(p)
+                a.delete(p)
+        self.assertEqual(t.preorder(), a.preorder())
+
+    def test_delete_from_empty_and_nonexistent(self):
+        a = ArenaAVLTree()
+        with self.assertRaises(ValueError):
+            a.delete(1)
+        a.insert(1)
+        with self.assertRaises(ValueError):
+            a.delete(2)
+        a.delete(1)
+        self.assertEqual([], a.inorder())
+
+
+class BulkConstructionTestCase(unittest.TestCase):
+    def test_from_sorted_balanced_without_comparisons(self):
+        calls = []
+
+        def less_than_func(x, y):
+            calls.append((x, y))
+            return x < y
+
+        for n in [0, 1, 2, 3, 7, 8, 100, 1000]:
+            t = AVLTree.from_sorted(iter(range(n)), less_than_func)
+            self.assertEqual(True, check_invariant(t))
+            self.assertEqual(list(range(n)), t.inorder())
+        self.assertEqual([], calls)
+
+    def test_from_sorted_then_modify(self):
+        t = AVLTree.from_sorted(range(0, 2000, 2), lambda x, y: x < y)
+        for e in range(1, 2000, 4):
+            t.insert(e)
+        for e in range(0, 2000, 8):
+            t.delete(e)
+        self.assertEqual(True, check_invariant(t))
+        self.assertEqual(sorted(set(range(0, 2000, 2)) - set(range(0, 2000, 8)) | set(range(1, 2000, 4))),
+                         t.inorder())
+
+    def test_from_iterable_sorts_and_dedups(self):
+        l = [random.randint(0, 500) for _ in range(2000)]
+        for kwargs in [{"less_than_func": lambda x, y: x < y}, {}, {"cmp": lambda x, y: x - y},
+                       {"key": lambda x: -x}]:
+            t = AVLTree.from_iterable((e for e in l), **kwargs)
+            self.assertEqual(True, check_invariant(t))
+            expected = sorted(set(l), reverse="key" in kwargs)
+            self.assertEqual(expected, t.inorder())
+            for e in expected:
+                self.assertEqual(True, t.find(e)[0])
+
+    def test_from_iterable_keeps_first_of_equal_values(self):
+        persons = random_persons(500)
+        duplicates = [dict(p, Name="duplicate") for p in persons]
+        t_key = AVLTree.from_iterable(persons + duplicates, key=date_key)
+        t_lt = AVLTree.from_iterable(persons + duplicates, date_less_than_func)
+        t_insert = AVLTree(key=date_key)
+        for p in persons + duplicates:
+            t_insert.insert(p)
+        self.assertEqual(t_insert.inorder(), t_key.inorder())
+        self.assertEqual(t_insert.inorder(), t_lt.inorder())
+
+
+class TraversalTestCase(unittest.TestCase):
+    def test_iterators_match_recursive_definition(self):
+        def preorder(node):
+            return [node.value] + preorder(node.left) + preorder(node.right) if node else []
+
+        def postorder(node):
+            return postorder(node.left) + postorder(node.right) + [node.value] if node else []
+
+        t = AVLTree(lambda x, y: x < y)
+        l = random.sample(range(100000), 2000)
+        for e in l:
+            t.insert(e)
+        self.assertEqual(sorted(l), list(t.iter_inorder()))
+        self.assertEqual(sorted(l), list(t))
+        self.assertEqual(sorted(l, reverse=True), list(reversed(t)))
+        self.assertEqual(preorder(t.head), list(t.iter_preorder()))
+        self.assertEqual(postorder(t.head), list(t.iter_postorder()))
+
+    def test_iterators_on_empty_tree(self):
+        t = AVLTree()
+        self.assertEqual([], list(t))
+        self.assertEqual([], list(reversed(t)))
+        self.assertEqual([], t.preorder())
+        self.assertEqual([], t.postorder())
+
+    def test_iteration_is_lazy(self):
+        t = AVLTree.from_sorted(range(100000))
+        it = iter(t)
+        self.assertEqual([0, 1, 2], [next(it), next(it), next(it)])
+        it = t.iter_postorder()
+        self.assertEqual(0, next(it))
+
+
+def check_sizes(tree):
+    def calc_size(node):
+        if node:
+            left_ok, left_size = calc_size(node.left)
+            right_ok, right_size = calc_size(node.right)
+            size = left_size + right_size + getattr(node, "count", 1)
+            return left_ok and right_ok and node.size == size, size
+        return True, 0
+
+    sizes_ok, size = calc_size(tree.head)
+    return sizes_ok and size == len(tree)
+
+
+class OrderStatisticsTestCase(unittest.TestCase):
+    def test_sizes_maintained_by_insert_and_delete(self):
+        for iterative in (True, False):
+            t = AVLTree(lambda x, y: x < y, iterative=iterative, order_statistics=True)
+            l = random.sample(range(100000), 1000)
+            for e in l:
+                t.insert(e)
+            for e in l[:100]:
+                t.insert(e)
+            self.assertEqual(True, check_sizes(t))
+            self.assertEqual(1000, len(t))
+            random.shuffle(l)
+            for i, e in enumerate(l):
+                t.delete(e)
+                if i % 50 == 0:
+                    self.assertEqual(True, check_sizes(t))
+            self.assertEqual(0, len(t))
+
+    def test_rank_select(self):
+        l = random.sample(range(100000), 1000)
+        t = AVLTree(order_statistics=True)
+        for e in l:
+            t.insert(e)
+        l.sort()
+        for i, e in enumerate(l):
+            self.assertEqual(i, t.rank(e))
+            self.assertEqual(i, t.rank(e - 0.5))
+            self.assertEqual(e, t.select(i))
+        self.assertEqual(1000, t.rank(100000))
+        self.assertEqual(l[-1], t.select(-1))
+        with self.assertRaises(IndexError):
+            t.select(1000)
+
+    def test_percentile(self):
+        t = AVLTree.from_sorted(range(1, 101), order_statistics=True)
+        self.assertEqual(True, check_sizes(t))
+        self.assertEqual(1, t.percentile(0))
+        self.assertEqual(50, t.percentile(50))
+        self.assertEqual(91, t.percentile(90.5))
+        self.assertEqual(100, t.percentile(100))
+        with self.assertRaises(ValueError):
+            t.percentile(101)
+        with self.assertRaises(ValueError):
+            AVLTree(order_statistics=True).percentile(50)
+
+    def test_len_without_order_statistics(self):
+        t = AVLTree()
+        for e in [5, 3, 5, 8]:
+            t.insert(e)
+        self.assertEqual(3, len(t))
+        t.delete(5)
+        self.assertEqual(2, len(t))
+        with self.assertRaises(ValueError):
+            t.rank(3)
+
+
+class RangeQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.l = sorted(random.sample(range(0, 10000, 2), 1000))
+        self.t = AVLTree(lambda x, y: x < y)
+        for e in random.sample(self.l, len(self.l)):
+            self.t.insert(e)
+
+    def test_range(self):
+        l = self.l
+        for _ in range(100):
+            low, high = sorted(random.sample(range(-10, 10010), 2))
+            for low_inclusive in (True, False):
+                for high_inclusive in (True, False):
+                    expected = [e for e in l if (low < e or low_inclusive and low == e) and
+                                (e < high or high_inclusive and e == high)]
+                    inclusive = (low_inclusive, high_inclusive)
+                    self.assertEqual(expected, list(self.t.range(low, high, inclusive)))
+                    self.assertEqual(expected[::-1], list(self.t.range(low, high, inclusive, reverse=True)))
+        self.assertEqual(l, list(self.t.range()))
+        self.assertEqual([e for e in l if e >= 5000], list(self.t.range(5000)))
+        self.assertEqual([e for e in l if e < 5000][::-1], list(self.t.range(high=5000, reverse=True)))
+        self.assertEqual([], list(self.t.range(20000, 30000)))
+        self.assertEqual([], list(AVLTree().range(1, 2)))
+
+    def test_range_prunes_subtrees(self):
+        calls = []
+
+        def less_than_func(x, y):
+            calls.append(1)
+            return x < y
+
+        t = AVLTree.from_sorted(range(100000), less_than_func)
+        self.assertEqual(list(range(500, 510)), list(t.range(500, 510)))
+        self.assertLess(len(calls), 100)
+
+    def test_floor_ceiling_successor_predecessor(self):
+        l = self.l
+        for probe in range(-5, 10005):
+            below = [e for e in l if e < probe]
+            above = [e for e in l if e > probe]
+            at = [probe] if probe in l else []
+            self.assertEqual((below + at)[-1] if below + at else None, self.t.floor(probe))
+            self.assertEqual((at + above)[0] if at + above else None, self.t.ceiling(probe))
+            self.assertEqual(below[-1] if below else None, self.t.predecessor(probe))
+            self.assertEqual(above[0] if above else None, self.t.successor(probe))
+
+    def test_min_max(self):
+        self.assertEqual(self.l[0], self.t.min())
+        self.assertEqual(self.l[-1], self.t.max())
+        with self.assertRaises(ValueError):
+            AVLTree().min()
+        with self.assertRaises(ValueError):
+            AVLTree().max()
+
+    def test_dict_values_time_window(self):
+        persons = random_persons(500)
+        t = AVLTree(key=date_key)
+        for p in persons:
+            t.insert(p)
+        low = {"year": 1950, "month": 1, "day": 1, "pid": 0}
+        high = {"year": 1960, "month": 1, "day": 1, "pid": 0}
+        expected = sorted((p for p in {date_key(p): p for p in reversed(persons)}.values()
+                           if date_key(low) <= date_key(p) < date_key(high)), key=date_key)
+        self.assertEqual(expected, list(t.range(low, high)))
+        t_lt = AVLTree(date_less_than_func)
+        for p in persons:
+            t_lt.insert(p)
+        self.assertEqual(expected, list(t_lt.range(low, high)))
+        self.assertEqual(expected[0] if expected else t.successor(low), t_lt.ceiling(low))
+
+
+class BatchedLookupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.l = random.sample(range(0, 20000, 2), 2000)
+        self.t = AVLTree(lambda x, y: x < y)
+        for e in self.l:
+            self.t.insert(e)
+
+    def test_find_many(self):
+        probes = [random.randint(-10, 20010) for _ in range(3000)]
+        nodes = self.t.find_many(probes)
+        self.assertEqual([self.t.find(p)[1] for p in probes], nodes)
+        self.assertEqual([p in set(self.l) for p in probes], self.t.contains_many(probes))
+
+    def test_find_many_presorted(self):
+        probes = sorted(random.randint(-10, 20010) for _ in range(3000))
+        self.assertEqual([self.t.find(p)[1] for p in probes], self.t.find_many(iter(probes), presorted=True))
+        self.assertEqual([p in set(self.l) for p in probes], self.t.contains_many(probes, presorted=True))
+        self.assertEqual([None, None], AVLTree().find_many([1, 2], presorted=True))
+        self.assertEqual([False, False], AVLTree().contains_many([1, 2], presorted=True))
+
+    def test_find_many_presorted_shares_descents(self):
+        calls = []
+
+        def less_than_func(x, y):
+            calls.append(1)
+            return x < y
+
+        t = AVLTree.from_sorted(range(0, 200000, 2), less_than_func)
+        probes = list(range(1000, 3000))
+        t.contains_many(probes)
+        unsorted_calls = len(calls)
+        calls.clear()
+        self.assertEqual([p % 2 == 0 for p in probes], t.contains_many(probes, presorted=True))
+        self.assertLess(len(calls) * 3, unsorted_calls)
+
+    def test_find_many_key_mode(self):
+        persons = random_persons(300)
+        t = AVLTree(key=date_key)
+        for p in persons:
+            t.insert(p)
+        probes = sorted(persons + random_persons(300), key=date_key)
+        self.assertEqual([t.find(p)[1] for p in probes], t.find_many(probes, presorted=True))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy_probes(self):
+        t = AVLTree()
+        for e in self.l:
+            t.insert(e)
+        probes = numpy.array([random.randint(-10, 20010) for _ in range(3000)])
+        expected = numpy.array([p in set(self.l) for p in probes.tolist()])
+        self.assertEqual(expected.tolist(), t.contains_many(probes).tolist())
+        indices = t.find_many(probes)
+        inorder = t.inorder()
+        for p, i in zip(probes.tolist(), indices.tolist()):
+            if p in set(self.l):
+                self.assertEqual(p, inorder[i])
+            else:
+                self.assertEqual(-1, i)
+        t.insert(1)
+        self.assertEqual([True, False], t.contains_many(numpy.array([1, 3])).tolist())
+        self.assertEqual([False], AVLTree().contains_many(numpy.array([1])).tolist())
+        with self.assertRaises(ValueError):
+            self.t.contains_many(numpy.array([1]))
+
+
+class JoinSplitTestCase(unittest.TestCase):
+    def test_join(self):
+        for left_size, right_size in [(0, 0), (0, 10), (10, 0), (1, 1000), (1000, 3), (500, 600)]:
+            left = AVLTree.from_sorted(range(left_size), order_statistics=True)
+            right = AVLTree(order_statistics=True)
+            for e in random.sample(range(left_size + 1, left_size + 1 + right_size), right_size):
+                right.insert(e)
+            t = AVLTree.join(left, left_size, right)
+            self.assertEqual(True, check_invariant(t))
+            self.assertEqual(True, check_sizes(t))
+            self.assertEqual(list(range(left_size + right_size + 1)), t.inorder())
+            self.assertEqual((None, 0, None, 0), (left.head, len(left), right.head, len(right)))
+
+    def test_join_values_out_of_order(self):
+        left = AVLTree.from_sorted(range(10))
+        right = AVLTree.from_sorted(range(20, 30))
+        with self.assertRaises(ValueError):
+            left.join(9, right)
+        with self.assertRaises(ValueError):
+            left.join(25, right)
+        # Within the range of a tree, but not one of its values
+        with self.assertRaises(ValueError):
+            left.join(5.5, right)
+        with self.assertRaises(ValueError):
+            left.join(15, AVLTree.from_sorted([10, 12, 20]))
+        self.assertEqual((list(range(10)), list(range(20, 30))), (left.inorder(), right.inorder()))
+        joined = left.join(15, right)
+        self.assertEqual(list(range(10)) + [15] + list(range(20, 30)), joined.inorder())
+        validate(joined)
+
+    def test_split(self):
+        l = random.sample(range(0, 4000, 2), 1000)
+        for value in [-1, 0, 1, 1000, 1001, 3998, 4000] + random.sample(range(4000), 20):
+            for order_statistics in (True, False):
+                t = AVLTree(lambda x, y: x < y, order_statistics=order_statistics)
+                for e in l:
+                    t.insert(e)
+                left, node, right = t.split(value)
+                self.assertEqual(sorted(e for e in l if e < value), left.inorder())
+                self.assertEqual(sorted(e for e in l if e > value), right.inorder())
+                self.assertEqual(value in l, node is not None and node.value == value)
+                self.assertEqual(len(left.inorder()), len(left))
+                self.assertEqual(True, check_invariant(left) and check_invariant(right))
+                if order_statistics:
+                    self.assertEqual(True, check_sizes(left) and check_sizes(right))
+                self.assertEqual(0, len(t))
+                left.insert(-5)
+                if len(right):
+                    right.delete(right.max())
+                self.assertEqual(True, check_invariant(left) and check_invariant(right))
+
+
+class SetAlgebraTestCase(unittest.TestCase):
+    def check_operations(self, a, b, **kwargs):
+        t1 = AVLTree(**kwargs)
+        t2 = AVLTree(**kwargs)
+        for e in a:
+            t1.insert(e)
+        for e in b:
+            t2.insert(e)
+        for method, expected in [("union", set(a) | set(b)), ("intersection", set(a) & set(b)),
+                                 ("difference", set(a) - set(b)),
+                                 ("symmetric_difference", set(a) ^ set(b))]:
+            t = getattr(t1, method)(t2)
+            self.assertEqual(sorted(expected), t.inorder())
+            self.assertEqual(len(expected), len(t))
+            self.assertEqual(True, check_invariant(t))
+            if kwargs.get("order_statistics"):
+                self.assertEqual(True, check_sizes(t))
+        self.assertEqual(sorted(set(a)), t1.inorder())
+        self.assertEqual(sorted(set(b)), t2.inorder())
+        t1.update(t2)
+        self.assertEqual(sorted(set(a) | set(b)), t1.inorder())
+        self.assertEqual(True, check_invariant(t1))
+        self.assertEqual(sorted(set(b)), t2.inorder())
+
+    def test_set_operations(self):
+        for size1, size2 in [(0, 0), (0, 50), (50, 0), (1, 500), (500, 1), (300, 400), (1000, 1000)]:
+            a = random.sample(range(2000), size1)
+            b = random.sample(range(2000), size2)
+            self.check_operations(a, b)
+            self.check_operations(a, b, order_statistics=True)
+            self.check_operations(a, b, less_than_func=lambda x, y: x < y, iterative=False)
+
+    def test_union_keeps_own_values(self):
+        t1 = AVLTree(key=lambda x: x[0])
+        t2 = AVLTree(key=lambda x: x[0])
+        for i in range(10):
+            t1.insert((i, "t1"))
+            t2.insert((i + 5, "t2"))
+        self.assertEqual([(i, "t1") for i in range(10)] + [(i, "t2") for i in range(10, 15)],
+                         t1.union(t2).inorder())
+        self.assertEqual([(i, "t2") for i in range(5, 10)], t2.intersection(t1).inorder())
+
+    def test_union_with_small_tree_compares_little(self):
+        calls = []
+
+        def less_than_func(x, y):
+            calls.append(1)
+            return x < y
+
+        big = AVLTree.from_sorted(range(0, 200000, 2), less_than_func)
+        small = AVLTree.from_sorted([1001, 50001, 150001], less_than_func)
+        t = small.union(big)
+        self.assertEqual(100003, len(t))
+        self.assertLess(len(calls), 500)
+        self.assertEqual(True, check_invariant(t))
+
+
+class StatsTestCase(unittest.TestCase):
+    def test_counters(self):
+        for kwargs in [{}, {"less_than_func": lambda x, y: x < y}, {"cmp": lambda x, y: x - y},
+                       {"iterative": False}]:
+            t = AVLTree(stats=True, **kwargs)
+            for e in [20, 10, 5, 80, 15, 100, 2, 1, 12, 11, 120, 0]:
+                t.insert(e)
+            self.assertEqual([10, 2, 1, 0, 5, 20, 12, 11, 15, 100, 80, 120], t.preorder())
+            stats = t.stats()
+            self.assertEqual(6, stats["single_rotations"])
+            self.assertEqual(0, stats["double_rotations"])
+            self.assertEqual(4, stats["height"])
+            self.assertEqual(12, stats["operations"]["insert"]["count"])
+            self.assertEqual(31, stats["operations"]["insert"]["nodes_visited"])
+            self.assertEqual(sum(stats["operations"]["insert"]["latency_histogram_ns"].values()), 12)
+            comparisons = stats["comparisons"]
+            self.assertGreater(comparisons, 0)
+            self.assertEqual((True, t.find(10)[1]), t.find(10))
+            stats = t.stats()
+            self.assertEqual(2, stats["operations"]["find"]["count"])
+            self.assertEqual(2, stats["operations"]["find"]["nodes_visited"])
+            t.delete(120)
+            self.assertEqual(1, t.stats()["operations"]["delete"]["count"])
+
+    def test_callback(self):
+        events = []
+        t = AVLTree(stats_callback=events.append)
+        for e in [6, 8, 7]:
+            t.insert(e)
+        t.find(7)
+        self.assertEqual(["insert", "insert", "insert", "find"], [e["operation"] for e in events])
+        self.assertEqual(1, events[2]["double_rotations"])
+        self.assertEqual(1, events[3]["nodes_visited"])
+
+    def test_versions_share_the_counters(self):
+        events = []
+        c = ConcurrentAVLTree(snapshot_reads=True, stats=True, stats_callback=events.append)
+        for e in range(100):
+            c.insert(e)
+        for e in range(0, 100, 2):
+            c.delete(e)
+        c.find(1)
+        stats = c.snapshot().stats()
+        self.assertEqual((100, 50, 1), tuple(stats["operations"][operation]["count"]
+                                             for operation in ("insert", "delete", "find")))
+        self.assertEqual(151, len(events))
+        self.assertGreater(stats["single_rotations"], 0)
+        self.assertGreater(stats["operations"]["insert"]["nodes_visited"], 100)
+        self.assertEqual(7, stats["max_height"])
+        v = PersistentAVLTree(stats=True)
+        for e in range(100):
+            v = v.insert(e)
+        v = v.delete(50)
+        stats = v.stats()
+        self.assertEqual((100, 1), (stats["operations"]["insert"]["count"],
+                                    stats["operations"]["delete"]["count"]))
+        self.assertEqual(7, stats["max_height"])
+
+    def test_no_instrumentation_when_disabled(self):
+        t = AVLTree()
+        self.assertNotIn("insert", vars(t))
+        self.assertNotIn("_singlerotation", vars(t))
+        self.assertEqual(t._descend_native, t.descent_method)
+        with self.assertRaises(ValueError):
+            t.stats()
+
+
+class ConcurrencyTestCase(unittest.TestCase):
+    def test_no_state_kept_on_tree_between_operations(self):
+        for iterative in (True, False):
+            t = AVLTree(iterative=iterative)
+            for e in random.sample(range(1000), 300):
+                t.insert(e)
+            for e in random.sample(t.inorder(), 150):
+                t.delete(e)
+            self.assertNotIn("inc", vars(t))
+            self.assertNotIn("to_be_deleted_value_node", vars(t))
+            self.assertEqual(True, check_invariant(t))
+
+    def test_copying_versions_leave_former_versions_unchanged(self):
+        for order_statistics in (False, True):
+            t = AVLTree(order_statistics=order_statistics)
+            reference = set()
+            versions = []
+            for i in range(2000):
+                e = random.randrange(300)
+                if e in reference and random.random() < 0.5:
+                    t = t._deleted_version(e)
+                    reference.discard(e)
+                else:
+                    t = t._inserted_version(e)
+                    reference.add(e)
+                if i % 100 == 0:
+                    self.assertEqual(sorted(reference), t.inorder())
+                    self.assertEqual(True, check_invariant(t))
+                    if order_statistics:
+                        self.assertEqual(True, check_sizes(t))
+                    versions.append((t, t.preorder(), [n.balance for n in t._iter_nodes()]))
+            for version, preorder, balances in versions:
+                self.assertEqual(preorder, version.preorder())
+                self.assertEqual(balances, [n.balance for n in version._iter_nodes()])
+                self.assertEqual(True, check_invariant(version))
+
+    def test_snapshot_isolation(self):
+        t = ConcurrentAVLTree(snapshot_reads=True)
+        for e in range(100):
+            t.insert(e)
+        snapshot = t.snapshot()
+        it = iter(t)
+        for e in range(0, 100, 2):
+            t.delete(e)
+        t.insert(1000)
+        self.assertEqual(list(range(100)), list(it))
+        self.assertEqual(list(range(100)), snapshot.inorder())
+        self.assertEqual(list(range(1, 100, 2)) + [1000], t.inorder())
+        self.assertEqual((True, 1000), t.find(1000))
+        self.assertEqual((False, None), t.find(2))
+        with self.assertRaises(ValueError):
+            ConcurrentAVLTree().snapshot()
+
+    def test_readers_and_writers(self):
+        for snapshot_reads in (False, True):
+            t = ConcurrentAVLTree(snapshot_reads=snapshot_reads)
+            for e in range(-100, 0):
+                t.insert(e)
+            stop = threading.Event()
+            errors = []
+
+            def read():
+                while not stop.is_set():
+                    values = t.inorder()
+                    if values != sorted(values) or values[:100] != list(range(-100, 0)):
+                        errors.append(values)
+                    t.find(random.randrange(400))
+
+            def write(start):
+                for e in range(start, 400, 4):
+                    t.insert(e)
+                for e in range(start, 400, 8):
+                    t.delete(e)
+
+            readers = [threading.Thread(target=read) for _ in range(3)]
+            writers = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+            for thread in readers + writers:
+                thread.start()
+            for thread in writers:
+                thread.join()
+            stop.set()
+            for thread in readers:
+                thread.join()
+            self.assertEqual([], errors)
+            expected = list(range(-100, 0)) + [e for e in range(400) if e % 8 >= 4]
+            self.assertEqual(expected, t.inorder())
+            self.assertEqual(len(expected), len(t))
+            self.assertEqual(True, check_invariant(t.tree))
+
+    def test_read_write_lock_excludes_writers(self):
+        lock = ReadWriteLock()
+        lock.acquire_read()
+        acquired = threading.Event()
+
+        def write():
+            with lock.write_locked():
+                acquired.set()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        self.assertFalse(acquired.wait(0.05))
+        lock.release_read()
+        writer.join()
+        self.assertTrue(acquired.is_set())
+
+
+class PersistentTestCase(unittest.TestCase):
+    def test_versions(self):
+        for iterative in (True, False):
+            v0 = PersistentAVLTree(iterative=iterative)
+            v1 = v0.insert(5)
+            v2 = v1.insert(3).insert(8).insert(1)
+            v3 = v2.delete(5)
+            self.assertEqual([], v0.inorder())
+            self.assertEqual([5], v1.inorder())
+            self.assertEqual([1, 3, 5, 8], v2.inorder())
+            self.assertEqual([1, 3, 8], v3.inorder())
+            self.assertEqual((4, 3), (len(v2), len(v3)))
+            self.assertIs(v2, v2.insert(3))
+            self.assertIsInstance(v3, PersistentAVLTree)
+            with self.assertRaises(ValueError):
+                v3.delete(5)
+            with self.assertRaises(ValueError):
+                v0.delete(5)
+
+    def test_versions_share_nodes_off_the_path(self):
+        v1 = PersistentAVLTree.from_sorted(range(0, 2000, 2), order_statistics=True)
+        v2 = v1.insert(1001)
+        nodes1 = set(map(id, v1._iter_nodes()))
+        new_nodes = [node for node in v2._iter_nodes() if id(node) not in nodes1]
+        self.assertLessEqual(len(new_nodes), v2._height(v2.head) + 1)
+        self.assertEqual(501, v2.rank(1001))
+        self.assertEqual(True, check_sizes(v1) and check_sizes(v2))
+        v3 = v2.update(PersistentAVLTree.from_sorted([3, 5]))
+        self.assertEqual(1003, len(v3))
+        self.assertEqual(1001, len(v2))
+        with self.assertRaises(ValueError):
+            v3.split(10)
+
+    def test_batches_leave_the_version_unchanged(self):
+        for kwargs in [{}, {"iterative": False}, {"order_statistics": True, "monoid": SUM},
+                       {"lazy_delete": True, "compaction_threshold": None}]:
+            v1 = PersistentAVLTree.from_iterable(range(100), **kwargs)
+            v2 = v1.insert(1000)
+            v3, outcomes = v2.delete_many([5, 5, 2000])
+            self.assertEqual([DELETED, MISSING, MISSING], outcomes)
+            v4, outcomes = v3.insert_many([5, 7, 1001])
+            self.assertEqual([INSERTED, DUPLICATE, INSERTED], outcomes)
+            # Large batches rebuild the new version
+            v5, _ = v4.delete_many(range(0, 1002, 2))
+            v6, _ = v5.insert_many(range(200, 400))
+            self.assertEqual(list(range(100)), v1.inorder())
+            self.assertEqual(list(range(100)) + [1000], v2.inorder())
+            self.assertEqual([e for e in range(100) if e != 5] + [1000], v3.inorder())
+            self.assertEqual(list(range(100)) + [1000, 1001], v4.inorder())
+            self.assertEqual(list(range(1, 100, 2)) + [1001], v5.inorder())
+            self.assertEqual(list(range(1, 100, 2)) + list(range(200, 400)) + [1001],
+                             v6.inorder())
+            for version in (v1, v2, v3, v4, v5, v6):
+                validate(version)
+
+
+class SerializationTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "tree.avl")
+
+    def test_dump_and_load_keep_the_shape(self):
+        calls = []
+
+        def less_than_func(x, y):
+            calls.append((x, y))
+            return x < y
+
+        for values in [random.sample(range(-10 ** 12, 10 ** 12), 1000),
+                       [random.random() for _ in range(1000)],
+                       [str(i) for i in random.sample(range(10000), 1000)], [], [1]]:
+            t = AVLTree(less_than_func)
+            for e in values:
+                t.insert(e)
+            t.dump(self.path)
+            del calls[:]
+            loaded = AVLTree.load(self.path, less_than_func, order_statistics=True)
+            self.assertEqual([], calls)
+            self.assertEqual(t.preorder(), loaded.preorder())
+            self.assertEqual(len(t), len(loaded))
+            self.assertEqual(True, check_invariant(loaded))
+            self.assertEqual(True, check_sizes(loaded))
+            if values:
+                self.assertEqual(values[0], loaded.find(values[0])[1].value)
+                self.assertEqual(sorted(values)[len(values) // 2], loaded.select(len(values) // 2))
+
+    def test_key_mode_and_codecs(self):
+        persons = random_persons(300)
+        t = AVLTree(key=date_key)
+        for person in persons:
+            t.insert(person)
+        t.dump(self.path)
+        loaded = AVLTree.load(self.path, key=date_key)
+        self.assertEqual(t.inorder(), loaded.inorder())
+        self.assertEqual(True, loaded.find(persons[7])[0])
+        t = AVLTree.from_sorted(range(100))
+        t.dump(self.path, codec="pickle")
+        self.assertEqual(list(range(100)), AVLTree.load(self.path).inorder())
+        with self.assertRaises(ValueError):
+            AVLTree.from_sorted([0.5, 1.5]).dump(self.path, codec="int64")
+        with self.assertRaises(ValueError):
+            t.dump(self.path, codec="int32")
+
+    def test_mapped_tree(self):
+        values = random.sample(range(10000), 2000)
+        t = AVLTree.from_iterable(values)
+        t.dump(self.path)
+        with MappedAVLTree(self.path) as mapped:
+            self.assertEqual(2000, len(mapped))
+            self.assertEqual(t.inorder(), list(mapped))
+            self.assertEqual(t.inorder()[::-1], list(reversed(mapped)))
+            for e in random.sample(range(10000), 200):
+                self.assertEqual(e in values, e in mapped)
+            self.assertEqual((True, values[0]), mapped.find(values[0]))
+            for low, high, inclusive, reverse in [(100, 5000, (True, False), False),
+                                                  (None, 300, (True, True), True),
+                                                  (9000, None, (False, True), False)]:
+                self.assertEqual(list(t.range(low, high, inclusive, reverse)),
+                                 list(mapped.range(low, high, inclusive, reverse)))
+        persons = random_persons(100)
+        t = AVLTree(date_less_than_func)
+        for person in persons:
+            t.insert(person)
+        AVLTree.from_iterable(persons, key=date_key).dump(self.path)
+        with MappedAVLTree(self.path, key=date_key) as mapped:
+            self.assertEqual(t.inorder(), list(mapped))
+            self.assertEqual((True, persons[3]), mapped.find(persons[3]))
+        AVLTree().dump(self.path)
+        with MappedAVLTree(self.path) as mapped:
+            self.assertEqual(([], (False, None)), (list(mapped), mapped.find(1)))
+
+    def test_not_a_tree_file(self):
+        with open(self.path, "wb") as file:
+            file.write(b"not a tree file at all")
+        with self.assertRaises(ValueError):
+            AVLTree.load(self.path)
+        with self.assertRaises(ValueError):
+            MappedAVLTree(self.path)
+
+
+class ShardedTestCase(unittest.TestCase):
+    def test_build_route_and_concatenate(self):
+        values = [random.randrange(5000) for _ in range(3000)]
+        for kwargs in [{}, {"less_than_func": lambda x, y: x < y}, {"iterative": False}]:
+            t = ShardedAVLTree.build(values, shards=8, max_workers=1, **kwargs)
+            self.assertEqual(sorted(set(values)), t.inorder())
+            self.assertLessEqual(len(t.shards), 8)
+            for lower, shard, upper in zip([None] + t.splitters, t.shards, t.splitters + [None]):
+                self.assertTrue(all((lower is None or lower <= e) and (upper is None or e < upper)
+                                    for e in shard))
+            missing = next(e for e in range(5000) if e not in set(values))
+            t.insert(missing)
+            self.assertEqual(True, t.find(missing)[0])
+            t.delete(values[0])
+            self.assertEqual(False, t.find(values[0])[0])
+            with self.assertRaises(ValueError):
+                t.delete(values[0])
+            expected = t.inorder()
+            tree = t.concatenate()
+            self.assertEqual(expected, tree.inorder())
+            self.assertEqual(len(expected), len(tree))
+            self.assertEqual(True, check_invariant(tree))
+            self.assertEqual(0, len(t))
+
+    def test_concatenate_detaches_the_pivots(self):
+        values = list(range(2000))
+        t = ShardedAVLTree.build(values, shards=4, max_workers=1, lazy_delete=True)
+        nodes = {id(node) for shard in t.shards for node in shard._iter_nodes()}
+        tree = t.concatenate()
+        # No shard was rebuilt, so all nodes are kept
+        self.assertEqual(nodes, {id(node) for node in tree._iter_nodes()})
+        self.assertEqual((values, 0), (tree.inorder(), tree.tombstones))
+        validate(tree)
+        t = ShardedAVLTree(splitters=[500, 1000, 1500], duplicates="count")
+        for e in values * 2:
+            t.insert(e)
+        tree = t.concatenate()
+        self.assertEqual(sorted(values * 2), tree.inorder())
+        validate(tree)
+
+    def test_build_in_worker_processes(self):
+        persons = random_persons(500)
+        t = ShardedAVLTree.build(persons, key=date_key, shards=3, max_workers=2)
+        self.assertEqual(AVLTree.from_iterable(persons, key=date_key).inorder(), t.inorder())
+        self.assertEqual([], ShardedAVLTree.build([], max_workers=1).concatenate().inorder())
+        with self.assertRaises(ValueError):
+            ShardedAVLTree(splitters=[5, 1])
+
+
+class BatchUpdateTestCase(unittest.TestCase):
+    def test_insert_many_and_delete_many(self):
+        for iterative in (True, False):
+            for size, batch_size in [(0, 50), (2000, 30), (2000, 5000), (100, 100)]:
+                t = AVLTree(lambda x, y: x < y, iterative=iterative, order_statistics=True)
+                values = random.sample(range(10000), size)
+                reference = set(values)
+                self.assertEqual([INSERTED] * size, t.insert_many(values))
+                batch = [random.randrange(10000) for _ in range(batch_size)]
+                expected = []
+                for e in batch:
+                    expected.append(DUPLICATE if e in reference else INSERTED)
+                    reference.add(e)
+                self.assertEqual(expected, t.insert_many(batch))
+                self.assertEqual(sorted(reference), t.inorder())
+                self.assertEqual(len(reference), len(t))
+                self.assertEqual(True, check_invariant(t) and check_sizes(t))
+                batch = [random.randrange(10000) for _ in range(batch_size)]
+                expected = []
+                for e in batch:
+                    expected.append(DELETED if e in reference else MISSING)
+                    reference.discard(e)
+                self.assertEqual(expected, t.delete_many(batch))
+                self.assertEqual(sorted(reference), t.inorder())
+                self.assertEqual(len(reference), len(t))
+                self.assertEqual(True, check_invariant(t) and check_sizes(t))
+
+    def test_first_of_equal_values_kept(self):
+        persons = list({date_key(person): person for person in random_persons(60)}.values())[:50]
+        t = AVLTree(key=date_key)
+        t.insert_many(persons[:40])
+        renamed = [dict(person, Name="Renamed") for person in persons]
+        outcomes = t.insert_many(renamed + renamed)
+        self.assertEqual([DUPLICATE] * 40 + [INSERTED] * 10 + [DUPLICATE] * 50, outcomes)
+        self.assertEqual(40, sum("Name" not in person for person in t))
+        self.assertEqual([DELETED] * 50 + [MISSING] * 50, t.delete_many(renamed + renamed))
+        self.assertEqual(0, len(t))
+
+
+class MapTestCase(unittest.TestCase):
+    def test_dict_behaviour(self):
+        for kwargs in [{}, {"iterative": False}, {"cmp": lambda x, y: (x > y) - (x < y)},
+                       {"order_statistics": True}]:
+            m = AVLMap(**kwargs)
+            reference = {}
+            for _ in range(3000):
+                key = random.randrange(500)
+                operation = random.random()
+                if operation < 0.4:
+                    m[key] = reference[key] = random.random()
+                elif operation < 0.6:
+                    self.assertEqual(reference.pop(key, None), m.pop(key, None))
+                elif operation < 0.8:
+                    self.assertEqual(reference.setdefault(key, key), m.setdefault(key, key))
+                else:
+                    self.assertEqual(reference.get(key), m.get(key))
+            self.assertEqual(sorted(reference), list(m))
+            self.assertEqual(sorted(reference, reverse=True), list(reversed(m)))
+            self.assertEqual(sorted(reference.items()), list(m.items()))
+            self.assertEqual([reference[key] for key in sorted(reference)], list(m.values()))
+            self.assertEqual(len(reference), len(m))
+            self.assertEqual(True, check_invariant(m))
+            if kwargs.get("order_statistics"):
+                self.assertEqual(True, check_sizes(m))
+            key = next(iter(reference))
+            self.assertEqual(True, key in m)
+            self.assertEqual(reference[key], m[key])
+            del m[key]
+            self.assertEqual(False, key in m)
+            with self.assertRaises(KeyError):
+                m[key]
+            with self.assertRaises(KeyError):
+                m.pop(key)
+            with self.assertRaises(KeyError):
+                del m[key]
+
+    def test_setitem_updates_in_place(self):
+        m = AVLMap.from_iterable([(2, "b"), (1, "a"), (3, "c"), (2, "B")])
+        self.assertEqual([(1, "a"), (2, "B"), (3, "c")], list(m.items()))
+        _, node = m.find(2)
+        m[2] = "two"
+        self.assertEqual((True, node), m.find(2))
+        self.assertEqual("two", node.value)
+        m.update({4: "d", 1: "one"})
+        self.assertEqual([(1, "one"), (2, "two"), (3, "c"), (4, "d")], list(m.items()))
+        self.assertEqual(["one", "two", "c"], list(m.range(1, 4)))
+        self.assertEqual([1, 2], list(AVLMap.from_sorted([(1, "a"), (2, "b")])))
+        with self.assertRaises(ValueError):
+            m.insert(5)
+        with self.assertRaises(ValueError):
+            m.insert_many([100])
+        self.assertEqual([1, 2, 3, 4], list(m))
+        self.assertEqual([DELETED, MISSING], m.delete_many([4, 5]))
+        with self.assertRaises(ValueError):
+            AVLMap(key=len)
+
+    def test_dump_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "map.avl")
+            m = AVLMap.from_iterable((i, {"payload": i * i}) for i in range(100))
+            m.dump(path)
+            loaded = AVLMap.load(path)
+            self.assertEqual(list(m.items()), list(loaded.items()))
+            with MappedAVLTree(path) as mapped:
+                self.assertEqual((True, {"payload": 49}), mapped.find(7))
+
+
+class MultisetTestCase(unittest.TestCase):
+    def test_counts_against_counter(self):
+        for iterative in (True, False):
+            t = AVLTree(iterative=iterative, order_statistics=True, duplicates="count")
+            reference = collections.Counter()
+            for _ in range(4000):
+                e = random.randrange(200)
+                if reference[e] and random.random() < 0.45:
+                    t.delete(e)
+                    reference[e] -= 1
+                else:
+                    t.insert(e)
+                    reference[e] += 1
+            expected = sorted(reference.elements())
+            self.assertEqual(expected, t.inorder())
+            self.assertEqual(expected[::-1], list(reversed(t)))
+            self.assertEqual(sorted(t.preorder()), expected)
+            self.assertEqual(sorted(t.postorder()), expected)
+            self.assertEqual(len(expected), len(t))
+            self.assertEqual(True, check_invariant(t) and check_sizes(t))
+            for e in range(0, 200, 7):
+                self.assertEqual(reference[e], t.count(e))
+                self.assertEqual(sum(reference[x] for x in reference if x < e), t.rank(e))
+                self.assertEqual([x for x in expected if 50 <= x < e], list(t.range(50, e)))
+            for index in random.sample(range(len(expected)), 50):
+                self.assertEqual(expected[index], t.select(index))
+            for e in list(reference):
+                for _ in range(reference[e]):
+                    t.delete(e)
+            self.assertEqual(([], 0), (t.inorder(), len(t)))
+            with self.assertRaises(ValueError):
+                t.delete(5)
+
+    def test_equal_values_are_counted_in_one_node(self):
+        persons = random_persons(10)
+        t = AVLTree(key=date_key, duplicates="count")
+        for person in persons + persons[:3]:
+            t.insert(person)
+        self.assertEqual(10, sum(1 for _ in t._iter_nodes()))
+        self.assertEqual((2, 1), (t.count(persons[0]), t.count(persons[5])))
+        self.assertEqual(13, len(t))
+        t = AVLTree.from_iterable([3, 1, 3, 2, 3, 1], order_statistics=True, duplicates="count")
+        self.assertEqual([1, 1, 2, 3, 3, 3], t.inorder())
+        self.assertEqual((6, 3), (len(t), t.count(3)))
+        self.assertEqual(True, check_sizes(t))
+        self.assertEqual([INSERTED] * 3, t.insert_many([2, 2, 4]))
+        self.assertEqual([DELETED, DELETED, MISSING], t.delete_many([4, 1, 4]))
+        self.assertEqual([1, 2, 2, 2, 3, 3, 3], t.inorder())
+        with self.assertRaises(ValueError):
+            AVLTree(duplicates="keep")
+
+    def test_copying_versions(self):
+        v1 = PersistentAVLTree.from_iterable(range(50), order_statistics=True, duplicates="count")
+        v2 = v1.insert(10).insert(10)
+        v3 = v2.delete(10).delete(20)
+        self.assertEqual((1, 3, 2), (v1.count(10), v2.count(10), v3.count(10)))
+        self.assertEqual((50, 52, 50), (len(v1), len(v2), len(v3)))
+        self.assertEqual(True, check_sizes(v1) and check_sizes(v2) and check_sizes(v3))
+
+
+def check_aggregates(tree):
+    """
+    Checks the aggregate of every node against its children, cf. check_sizes
+    """
+    monoid = tree.monoid
+    for node in tree._iter_nodes():
+        count = getattr(node, "count", 1)
+        expected = monoid.repeat(monoid.measure(node.value), count)
+        if node.left:
+            expected = monoid.combine(node.left.agg, expected)
+        if node.right:
+            expected = monoid.combine(expected, node.right.agg)
+        if node.agg != expected:
+            return False
+    return True
+
+
+# Concatenation is associative but not commutative, so it also checks the order of combining
+CONCATENATION = Monoid(lambda a, b: a + b, "", measure=lambda value: str(value) + ",")
+
+
+class AggregateTestCase(unittest.TestCase):
+    def test_range_sums_against_reference(self):
+        for iterative in (True, False):
+            for order_statistics in (False, True):
+                for duplicates in ("ignore", "count"):
+                    t = AVLTree(iterative=iterative, order_statistics=order_statistics,
+                                duplicates=duplicates, monoid=SUM)
+                    reference = collections.Counter()
+                    for _ in range(2000):
+                        e = random.randrange(300)
+                        if reference[e] and random.random() < 0.45:
+                            t.delete(e)
+                            reference[e] -= 1
+                        else:
+                            t.insert(e)
+                            if duplicates == "count" or not reference[e]:
+                                reference[e] += 1
+                    self.assertEqual(True, check_aggregates(t))
+                    values = sorted(reference.elements())
+                    self.assertEqual(sum(values), t.aggregate())
+                    for _ in range(50):
+                        low, high = sorted(random.sample(range(-10, 310), 2))
+                        self.assertEqual(sum(v for v in values if low <= v < high),
+                                         t.aggregate(low, high))
+                        self.assertEqual(sum(v for v in values if low < v <= high),
+                                         t.aggregate(low, high, inclusive=(False, True)))
+                    self.assertEqual(0, t.aggregate(400, 500))
+
+    def test_non_commutative_monoid(self):
+        for iterative in (True, False):
+            t = AVLTree(iterative=iterative, monoid=CONCATENATION)
+            values = random.sample(range(1000), 300)
+            for value in values:
+                t.insert(value)
+            for value in values[:100]:
+                t.delete(value)
+            expected = sorted(values[100:])
+            self.assertEqual("".join(f"{v}," for v in expected), t.aggregate())
+            self.assertEqual("".join(f"{v}," for v in expected if 200 <= v <= 700),
+                             t.aggregate(200, 700, inclusive=(True, True)))
+            self.assertEqual(True, check_aggregates(t))
+
+    def test_interval_max_endpoint(self):
+        # Intervals ordered by their start, aggregating the greatest end: the intervals starting
+        # before x overlap x exactly if that greatest end is beyond x
+        intervals = [(start, start + random.randrange(1, 50))
+                     for start in random.sample(range(1000), 200)]
+        t = AVLTree(key=lambda interval: interval[0],
+                    monoid=Monoid(max, float("-inf"), measure=lambda interval: interval[1]))
+        for interval in intervals:
+            t.insert(interval)
+        for x in range(0, 1000, 13):
+            overlapping = any(start <= x < end for start, end in intervals)
+            self.assertEqual(overlapping, t.aggregate(None, (x, None),
+                                                      inclusive=(True, True)) > x)
+
+    def test_bulk_and_structural_operations(self):
+        values = random.sample(range(10000), 1000)
+        t = AVLTree.from_iterable(values, order_statistics=True, monoid=SUM)
+        self.assertEqual((sum(values), True), (t.aggregate(), check_aggregates(t)))
+        t.insert_many(range(10000, 10600))
+        t.delete_many(values[:300])
+        expected = set(values[300:]) | set(range(10000, 10600))
+        self.assertEqual((sum(expected), True), (t.aggregate(), check_aggregates(t)))
+        left, found, right = t.split(5000)
+        self.assertEqual(sum(v for v in expected if v < 5000), left.aggregate())
+        self.assertEqual(sum(v for v in expected if v > 5000), right.aggregate())
+        self.assertEqual(True, check_aggregates(left) and check_aggregates(right))
+        joined = AVLTree.join(left, 5000, right)
+        self.assertEqual(sum(expected | {5000}), joined.aggregate())
+        self.assertEqual(True, check_aggregates(joined) and check_sizes(joined))
+        other = AVLTree.from_iterable(range(0, 20000, 3), monoid=SUM)
+        for operation in ("union", "intersection", "difference", "symmetric_difference"):
+            result = getattr(joined, operation)(other)
+            self.assertEqual(sum(result), result.aggregate())
+            self.assertEqual(True, check_aggregates(result))
+        with self.assertRaises(ValueError):
+            AVLTree.from_iterable(values).aggregate()
+
+    def test_versions_maps_and_loading(self):
+        v1 = PersistentAVLTree.from_iterable(range(100), monoid=MAX, duplicates="count")
+        v2 = v1.insert(500).delete(99)
+        self.assertEqual((99, 500), (v1.aggregate(), v2.aggregate()))
+        self.assertEqual(98, v2.aggregate(None, 500))
+        self.assertEqual(True, check_aggregates(v1) and check_aggregates(v2))
+        prices = AVLMap(monoid=SUM)
+        for day in random.sample(range(365), 200):
+            prices[day] = day % 7
+        for day in range(0, 365, 5):
+            prices[day] = 1
+        for day in range(0, 365, 11):
+            prices.pop(day, None)
+        self.assertEqual(sum(prices[d] for d in prices if 30 <= d < 60),
+                         prices.aggregate(30, 60))
+        self.assertEqual(True, check_aggregates(prices))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tree.avlt")
+            AVLTree.from_iterable(range(1000)).dump(path)
+            t = AVLTree.load(path, order_statistics=True, monoid=SUM)
+        self.assertEqual((sum(range(1000)), sum(range(100, 200))),
+                         (t.aggregate(), t.aggregate(100, 200)))
+        self.assertEqual(True, check_aggregates(t))
+
+
+def node_in_tree(tree, node):
+    """
+    Checks that node is reachable from the head of tree by descending to its key
+    """
+    current_node = tree.head
+    while current_node is not None and current_node is not node:
+        current_node = current_node.left if node.key < current_node.key else current_node.right
+    return current_node is node
+
+
+class CacheTestCase(unittest.TestCase):
+    def test_lookups_against_reference(self):
+        for iterative in (True, False):
+            for policy in ("lru", "tinylfu"):
+                for duplicates in ("ignore", "count"):
+                    t = AVLTree(iterative=iterative, duplicates=duplicates, cache=policy,
+                                cache_size=16)
+                    reference = collections.Counter()
+                    for _ in range(5000):
+                        e = random.randrange(100)
+                        operation = random.random()
+                        if operation < 0.3:
+                            t.insert(e)
+                            if duplicates == "count" or not reference[e]:
+                                reference[e] += 1
+                        elif operation < 0.5 and reference[e]:
+                            t.delete(e)
+                            reference[e] -= 1
+                        else:
+                            found, node = t.find(e)
+                            self.assertEqual(reference[e] > 0, found)
+                            if found:
+                                self.assertEqual(e, node.value)
+                                self.assertEqual(reference[e], t.count(e))
+                                self.assertEqual(True, node_in_tree(t, node))
+                    info = t.cache_info()
+                    self.assertEqual(policy, info["policy"])
+                    self.assertLessEqual(info["size"], 16)
+                    self.assertGreater(info["hits"], 0)
+                    self.assertAlmostEqual(info["hits"] / (info["hits"] + info["misses"]),
+                                           info["hit_ratio"])
+
+    def test_predecessor_moving_up(self):
+        for iterative in (True, False):
+            t = AVLTree.from_sorted(range(1, 8), iterative=iterative, cache="lru")
+            # 4 is the head, and its predecessor 3 is a leaf
+            _, leaf_node = t.find(3)
+            _, head_node = t.find(4)
+            t.delete(4)
+            found, node = t.find(3)
+            self.assertEqual((True, head_node), (found, node))
+            self.assertEqual(False, node_in_tree(t, leaf_node))
+            self.assertEqual((False, None), t.find(4))
+
+    def test_keys_equal_by_ordering_only(self):
+        # (5, "y") is equal to (5, "x") by the ordering, but not by == and hash
+        for iterative in (True, False):
+            for policy in ("lru", "tinylfu"):
+                t = AVLTree(lambda a, b: a[0] < b[0], iterative=iterative, cache=policy)
+                for i in range(10):
+                    t.insert((i, "x"))
+                self.assertEqual((5, "x"), t.find((5, "y"))[1].value)
+                t.delete((5, "x"))
+                self.assertEqual((False, None), t.find((5, "y")))
+                for i in (4, 6):
+                    t.find((i, "y"))
+                    t.delete((i, "z"))
+                    self.assertEqual((False, None), t.find((i, "y")))
+                self.assertEqual([0, 1, 2, 3, 7, 8, 9], [value[0] for value in t])
+                self.assertEqual(True, all(node_in_tree(t, t.find((i, "y"))[1])
+                                           for i in (0, 1, 2, 3, 7, 8, 9)))
+
+    def test_rebuilds_and_maps(self):
+        t = AVLTree.from_iterable(range(100), order_statistics=True, cache="tinylfu")
+        for e in range(10):
+            t.find(e)
+        t.insert_many(range(100, 300))
+        self.assertEqual(0, t.cache_info()["size"])
+        self.assertEqual(True, all(node_in_tree(t, t.find(e)[1]) for e in range(300)))
+        left, _, right = t.split(150)
+        self.assertEqual((0, 0), (left.cache_info()["size"], right.cache_info()["size"]))
+        m = AVLMap(cache="lru")
+        for key in range(50):
+            m[key] = key
+        for key in range(0, 50, 3):
+            self.assertEqual(key, m[key])
+            m[key] = -key
+        for key in range(0, 50, 2):
+            del m[key]
+        self.assertEqual({key: -key if key % 3 == 0 else key for key in range(1, 50, 2)},
+                         dict(m.items()))
+        self.assertEqual(True, all(node_in_tree(m, m.find_method(m.head, key)[1])
+                                   for key in range(1, 50, 2)))
+        with self.assertRaises(ValueError):
+            AVLTree(cache="fifo")
+        with self.assertRaises(ValueError):
+            AVLTree().cache_info()
+        with self.assertRaises(ValueError):
+            ConcurrentAVLTree(cache="lru")
+
+    def test_tinylfu_resists_scans(self):
+        retained = {}
+        for cache in (LRUCache(100), TinyLFUCache(100)):
+            for key in list(range(100)) * 20 + list(range(1000, 1300)):
+                if cache.get(key) is None:
+                    cache.put(key, key)
+            retained[cache.policy] = len(set(range(100)) & set(cache.entries))
+        # The sketch may overestimate a cold key colliding with hot ones
+        self.assertEqual(0, retained["lru"])
+        self.assertGreaterEqual(retained["tinylfu"], 90)
+
+
+class LazyDeleteTestCase(unittest.TestCase):
+    def test_queries_against_reference(self):
+        for iterative in (True, False):
+            for duplicates in ("ignore", "count"):
+                t = AVLTree(iterative=iterative, duplicates=duplicates, lazy_delete=True,
+                            compaction_threshold=None, monoid=SUM)
+                reference = collections.Counter()
+                for _ in range(3000):
+                    e = random.randrange(200)
+                    if reference[e] and random.random() < 0.55:
+                        t.delete(e)
+                        reference[e] -= 1
+                    else:
+                        t.insert(e)
+                        if duplicates == "count" or not reference[e]:
+                            reference[e] += 1
+                self.assertGreater(t.tombstones, 0)
+                expected = sorted(reference.elements())
+                self.assertEqual(expected, t.inorder())
+                self.assertEqual(expected[::-1], list(reversed(t)))
+                self.assertEqual(len(expected), len(t))
+                self.assertEqual((expected[0], expected[-1]), (t.min(), t.max()))
+                self.assertEqual(sum(expected), t.aggregate())
+                self.assertEqual(True, check_invariant(t) and check_sizes(t))
+                for e in range(0, 200, 3):
+                    self.assertEqual(reference[e], t.count(e))
+                    self.assertEqual(reference[e] > 0, e in t.inorder() and t.find(e)[0])
+                    self.assertEqual(max((x for x in expected if x <= e), default=None),
+                                     t.floor(e))
+                    self.assertEqual(min((x for x in expected if x > e), default=None),
+                                     t.successor(e))
+                    self.assertEqual([x for x in expected if e <= x < e + 30],
+                                     list(t.range(e, e + 30)))
+                self.assertEqual([reference[e] > 0 for e in range(200)],
+                                 t.contains_many(range(200), presorted=True))
+                t.compact()
+                self.assertEqual((0, expected), (t.tombstones, t.inorder()))
+                self.assertEqual(True, check_invariant(t) and check_sizes(t))
+                self.assertEqual(True, check_aggregates(t))
+
+    def test_delete_and_revive(self):
+        persons = random_persons(20)
+        t = AVLTree(key=date_key, lazy_delete=True, compaction_threshold=None)
+        for person in persons:
+            t.insert(person)
+        t.delete(persons[3])
+        self.assertEqual((False, None), t.find(persons[3]))
+        with self.assertRaises(ValueError):
+            t.delete(persons[3])
+        # A value with the key of the tombstone takes its place
+        twin = dict(persons[3], Surname="Twin")
+        t.insert(twin)
+        self.assertEqual((0, twin), (t.tombstones, t.find(persons[3])[1].value))
+        self.assertEqual(20, len(t))
+
+    def test_compaction_threshold(self):
+        t = AVLTree.from_iterable(range(1000), lazy_delete=True, compaction_threshold=0.25)
+        for e in range(333):
+            t.delete(e)
+            self.assertLessEqual(t.tombstones, 0.25 * (len(t) + t.tombstones) + 1)
+        self.assertLess(t.tombstones, 333)
+        self.assertEqual(list(range(333, 1000)), t.inorder())
+        t.delete_many(range(333, 600))
+        self.assertEqual(list(range(600, 1000)), t.inorder())
+        self.assertEqual(True, check_invariant(t) and check_sizes(t))
+
+    def test_versions_and_structural_operations(self):
+        v1 = PersistentAVLTree.from_iterable(range(100), lazy_delete=True,
+                                             compaction_threshold=None)
+        v2 = v1.delete(10).delete(20)
+        v3 = v2.insert(10)
+        self.assertEqual((0, 2, 1), (v1.tombstones, v2.tombstones, v3.tombstones))
+        self.assertEqual((100, 98, 99), (len(v1), len(v2), len(v3)))
+        self.assertEqual(list(range(100)), v1.inorder())
+        self.assertEqual((True, False), (v3.find(10)[0], v3.find(20)[0]))
+        t = AVLTree.from_iterable(range(50), lazy_delete=True, compaction_threshold=None)
+        for e in range(0, 50, 2):
+            t.delete(e)
+        other = AVLTree.from_iterable(range(0, 60, 3))
+        self.assertEqual(sorted(set(range(1, 50, 2)) | set(range(0, 60, 3))),
+                         t.union(other).inorder())
+        # The operands are left as they are, tombstones included
+        self.assertEqual((25, 0), (t.tombstones, other.tombstones))
+        self.assertEqual(sorted(set(range(0, 60, 3)) - set(range(1, 50, 2))),
+                         other.difference(t).inorder())
+        self.assertEqual(list(range(1, 50, 2)), t.inorder())
+        found, node = t.find(7)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "tree.avl")
+        t.dump(path)
+        self.assertEqual((25, True), (t.tombstones, node_in_tree(t, node)))
+        loaded = AVLTree.load(path, order_statistics=True)
+        self.assertEqual(list(range(1, 50, 2)), loaded.inorder())
+        validate(loaded)
+        c = AVLTree.from_iterable(range(10))
+        c.update(t)
+        self.assertEqual(25, t.tombstones)
+        self.assertEqual(sorted(set(range(10)) | set(range(1, 50, 2))), c.inorder())
+        t.delete(25)
+        left, found, right = t.split(25)
+        self.assertEqual((list(range(1, 25, 2)), None, list(range(27, 50, 2))),
+                         (left.inorder(), found, right.inorder()))
+        c = ConcurrentAVLTree(lazy_delete=True, compaction_threshold=None, snapshot_reads=True)
+        for e in range(10):
+            c.insert(e)
+        c.delete(4)
+        before = c.snapshot()
+        c.compact()
+        self.assertEqual((1, 0), (before.tombstones, c.snapshot().tombstones))
+        self.assertEqual([0, 1, 2, 3, 5, 6, 7, 8, 9], list(c))
+        with self.assertRaises(ValueError):
+            AVLMap(lazy_delete=True)
+
+
+class DurabilityTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def random_operations(self, t, n):
+        reference = set()
+        for _ in range(n):
+            e = random.randrange(100)
+            if e in reference and random.random() < 0.6:
+                t.delete(e)
+                reference.discard(e)
+            else:
+                t.insert(e)
+                reference.add(e)
+            yield sorted(reference)
+
+    def test_recovery_from_truncated_log(self):
+        path = os.path.join(self.directory, "tree")
+        with DurableAVLTree(path) as t:
+            ends = []
+            states = [[]]
+            log_path = os.path.join(path, "log.0")
+            for state in self.random_operations(t, 300):
+                ends.append(os.path.getsize(log_path))
+                states.append(state)
+        with open(log_path, "rb") as file:
+            log = file.read()
+        for offset in set(random.sample(range(len(log) + 1), 30) + [0, len(log)]):
+            crashed = os.path.join(self.directory, f"crashed{offset}")
+            os.makedirs(crashed)
+            with open(os.path.join(crashed, "log.0"), "wb") as file:
+                file.write(log[:offset])
+            t = DurableAVLTree(crashed, iterative=False)
+            complete = sum(1 for end in ends if end <= offset)
+            self.assertEqual(states[complete], t.inorder())
+            self.assertEqual(True, check_invariant(t.tree))
+            # New records follow the last complete one
+            t.insert(1000)
+            t.close()
+            self.assertEqual(states[complete] + [1000], DurableAVLTree(crashed).inorder())
+
+    def test_checkpoints(self):
+        persons = random_persons(200)
+        with DurableAVLTree(self.directory, key=date_key, sync=5, checkpoint_every=70) as t:
+            for person in persons:
+                t.insert(person)
+            t.delete(persons[0])
+            self.assertEqual(2, t.generation)
+            with self.assertRaises(ValueError):
+                t.delete(persons[0])
+        self.assertEqual(["log.2", "snapshot.2"], sorted(os.listdir(self.directory)))
+        expected = sorted(persons[1:], key=date_key)
+        t = DurableAVLTree(self.directory, key=date_key, order_statistics=True)
+        self.assertEqual((expected, 199), (t.inorder(), len(t)))
+        self.assertEqual(True, check_sizes(t.tree))
+        # A crash during a checkpoint leaves an unfinished snapshot, which is ignored
+        with open(os.path.join(self.directory, "snapshot.3.tmp"), "wb") as file:
+            file.write(b"AVLT")
+        t.insert(persons[0])
+        t.checkpoint()
+        t.delete(persons[1])
+        t.close()
+        t = DurableAVLTree(self.directory, key=date_key, sync="none")
+        self.assertEqual(sorted(persons[:1] + persons[2:], key=date_key), t.inorder())
+        self.assertEqual(["log.3", "snapshot.3"], sorted(os.listdir(self.directory)))
+
+    def test_sync_policies(self):
+        for sync in ("always", 1, 10 ** 6, "none"):
+            path = os.path.join(self.directory, str(sync))
+            t = DurableAVLTree(path, sync=sync)
+            states = list(self.random_operations(t, 50))
+            if sync == 1:
+                time.sleep(0.1)
+            self.assertEqual(sync == 10 ** 6 or sync == "none", t.unsynced > 0)
+            # The records are flushed, so a crash of the process loses nothing
+            self.assertEqual(states[-1], DurableAVLTree(path, sync="none").inorder())
+            t.close()
+            self.assertEqual(states[-1], DurableAVLTree(path).inorder())
+        for sync in ("sometimes", 0):
+            with self.assertRaises(ValueError):
+                DurableAVLTree(self.directory, sync=sync)
+        with self.assertRaises(ValueError):
+            DurableAVLTree(self.directory, duplicates="count")
+
+    def test_failed_operations_are_not_logged(self):
+        with DurableAVLTree(self.directory, key=lambda value: value[0]) as t:
+            t.insert((1, "a"))
+            with self.assertRaises(Exception):
+                t.insert((2, lambda: None))
+            with self.assertRaises(ValueError):
+                t.delete((3, "c"))
+            self.assertEqual([(1, "a")], t.inorder())
+        t = DurableAVLTree(self.directory, key=lambda value: value[0])
+        self.assertEqual([(1, "a")], t.inorder())
+
+    def test_rejected_operations_are_retracted(self):
+        for sync in ("always", 10 ** 6, "none"):
+            path = os.path.join(self.directory, str(sync))
+            with DurableAVLTree(path, sync=sync) as t:
+                t.insert(1)
+                with self.assertRaises(TypeError):
+                    t.insert("x")
+                t.insert(2)
+                with self.assertRaises(TypeError):
+                    t.delete(None)
+                t.insert(3)
+                self.assertEqual(3, t.operations)
+            self.assertEqual([1, 2, 3], DurableAVLTree(path).inorder())
+
+
+class ValidationTestCase(unittest.TestCase):
+    def test_fuzz_against_sorted_list(self):
+        for name, kwargs in fuzz.CONFIGURATIONS.items():
+            for iterative in (True, False):
+                with self.subTest(name, iterative=iterative):
+                    fuzz.fuzz(3000, seed=random.randrange(10 ** 6), validate_every=50,
+                              universe=300, iterative=iterative, **kwargs)
+
+    def test_sampled_stress(self):
+        t = fuzz.fuzz(10 ** 5, seed=random.randrange(10 ** 6), validate_every=10 ** 4,
+                      universe=10 ** 4)
+        self.assertGreater(len(t), 1000)
+
+    def test_validate_finds_broken_invariants(self):
+        def corrupted(corrupt, **kwargs):
+            t = AVLTree.from_iterable(range(100), **kwargs)
+            validate(t)
+            corrupt(t)
+            with self.assertRaises(ValueError):
+                validate(t)
+
+        def swap_values(t):
+            t.head.left.key, t.head.right.key = t.head.right.key, t.head.left.key
+
+        def unbalance(t):
+            t.head.balance = 1 - t.head.balance
+
+        def rotate_without_rebalancing(t):
+            # Balance factors unchanged, but the subtree heights no longer match them
+            head, left = t.head, t.head.left
+            t.head, head.left, left.right = left, left.right, head
+
+        corrupted(swap_values)
+        corrupted(unbalance)
+        corrupted(rotate_without_rebalancing)
+        corrupted(lambda t: setattr(t.head.left, "size", 0), order_statistics=True)
+        corrupted(lambda t: setattr(t.head, "agg", 0), monoid=SUM)
+        corrupted(lambda t: setattr(t, "length", 99))
+        corrupted(lambda t: setattr(t.head, "count", 0), lazy_delete=True)
+        corrupted(lambda t: setattr(t.head, "key", -1), key=abs)
+        validate(AVLTree())
+
+
 if __name__ == '__main__':
     unittest.main()